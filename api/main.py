@@ -1,8 +1,10 @@
 import os
+import json
 from typing import Dict, Any, Optional, List
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, BackgroundTasks
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
@@ -12,11 +14,18 @@ from src.document_ingestion.data_ingestion import (
     DocumentComparator,
     ChatIngestor, 
 )
+from src.document_ingestion.ingestion_jobs import INGESTION_JOBS, JobQueueFullError
 
 from src.document_analyser.data_analysis import DocumentAnalyzer
+from src.document_analyser.local_metadata import extract_pdf_metadata
 from src.document_compare.document_comparator import DocumentComparatorLLM
-from src.document_chat.retrieval import ConversationalRAG
-from utils.document_ops import FastAPIFileAdapter,read_pdf_via_handler
+from src.document_chat.retrieval import ConversationalRAG, NO_ANSWER
+from src.document_chat.hybrid_retriever import RETRIEVAL_MODES
+from src.document_chat.answer_cache import ANSWER_CACHE
+from src.document_chat.conversation_memory import ConversationMemory, get_conversation_memory
+from utils.document_ops import FastAPIFileAdapter
+from utils.executors import CPU_EXECUTOR, iterate_on, run_cpu, run_io
+from utils.metrics import METRICS
 from logger import GLOBAL_LOGGER as log
 
 
@@ -57,18 +66,27 @@ def health() -> Dict[str, str]:
     log.info("Health check passed.")
     return {"status": "ok", "service": "Enterprise Document Chat API"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """Process metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
 # ---------- ANALYZE ----------
 @app.post("/analyze")
 async def analyze_document(file: UploadFile = File(...)) -> Any:
     try:
         log.info(f"Received file for analysis: {file.filename}")
         dh = DocHandler()
-        saved_path = dh.save_pdf(FastAPIFileAdapter(file))
-        text = read_pdf_via_handler(dh, saved_path)
+        saved_path = await run_io(dh.save_pdf, FastAPIFileAdapter(file))
         
-        analyzer = DocumentAnalyzer()
-        result = analyzer.analyze_document(text)
-        log.info("Document analysis complete.")
+        analyzer = await run_io(DocumentAnalyzer)
+        # Info-dict fields are read locally, so the model is only asked for the rest
+        known = await run_cpu(extract_pdf_metadata, saved_path)
+        # Pages are parsed on the CPU pool and streamed into the analyzer, which picks
+        # single-pass or map-reduce by size and starts map calls before the last page is read
+        pages = iterate_on(CPU_EXECUTOR, dh.iter_pages, saved_path)
+        result = await run_io(analyzer.analyze_pages, pages, known)
+        log.info("Document analysis complete.", **analyzer.last_stats)
         return JSONResponse(content=result)
         
     except HTTPException:
@@ -83,13 +101,13 @@ async def compare_documents(reference: UploadFile = File(...), actual: UploadFil
     try:
         log.info(f"Comparing files: {reference.filename} vs {actual.filename}")
         dc = DocumentComparator()
-        ref_path, act_path = dc.save_uploaded_files(FastAPIFileAdapter(reference), FastAPIFileAdapter(actual))
-        __ = ref_path, act_path
-        combined_text = dc.combine_documents()
-        comp = DocumentComparatorLLM()
-        df = comp.compare_documents(combined_text)
-        log.info("Document comparison completed.")
-        return {"rows": df.to_dict(orient="records"), "session_id": dc.session_id}
+        ref_path, act_path = await run_io(dc.save_uploaded_files, FastAPIFileAdapter(reference), FastAPIFileAdapter(actual))
+        ref_pages = await run_cpu(dc.read_pages, ref_path)
+        act_pages = await run_cpu(dc.read_pages, act_path)
+        comp = await run_io(DocumentComparatorLLM)
+        df = await run_io(comp.compare_pages, ref_pages, act_pages)
+        log.info("Document comparison completed.", **comp.last_stats)
+        return {"rows": df.to_dict(orient="records"), "session_id": dc.session_id, "stats": comp.last_stats}
     except HTTPException:
         raise    
     except Exception as e:
@@ -97,6 +115,10 @@ async def compare_documents(reference: UploadFile = File(...), actual: UploadFil
         raise HTTPException(status_code=500, detail=f"Comparison failed: {e}")
 
 # ---------- CHAT: INDEX ----------
+def _invalidate_answers(ci: ChatIngestor):
+    # Cached answers predate the new chunks (entries also expire on the index signature)
+    ANSWER_CACHE.invalidate(str(ci.faiss_dir))
+
 @app.post("/chat/index")
 async def chat_build_index(
     files: List[UploadFile] = File(...),
@@ -105,6 +127,7 @@ async def chat_build_index(
     chunk_size: int = Form(1000),
     chunk_overlap: int = Form(200),
     k: int = Form(5),
+    background: bool = Form(False),
 ) -> Any: 
     try:
         log.info(f"Indexing chat session. Session ID: {session_id}, Files: {[f.filename for f in files]}")
@@ -115,49 +138,184 @@ async def chat_build_index(
             use_session_dirs = use_session_dirs,
             session_id = session_id or None,
         )
-        ci.build_retriever(wrapped, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k)
+        if background:
+            # Uploads must be on disk before the request ends; the rest runs in the job pool
+            if INGESTION_JOBS.is_full():
+                raise HTTPException(status_code=429, detail=f"Ingestion queue is full ({INGESTION_JOBS.max_pending} pending jobs)")
+            paths = await run_io(ci.save_uploads, wrapped)
+            try:
+                job = INGESTION_JOBS.submit(ci, paths, on_done=_invalidate_answers, chunk_size=chunk_size,
+                                            chunk_overlap=chunk_overlap, k=k)
+            except JobQueueFullError as e:
+                # The queue filled up while the files were being saved; don't leave them behind
+                for path in paths:
+                    path.unlink(missing_ok=True)
+                raise HTTPException(status_code=429, detail=str(e))
+            log.info(f"Index job queued for session: {ci.session_id}", job_id=job.job_id)
+            return JSONResponse(status_code=202, content={
+                "job_id": job.job_id, "status": job.status, "session_id": ci.session_id,
+                "k": k, "use_session_dirs": use_session_dirs,
+            })
+        paths = await run_io(ci.save_uploads, wrapped)
+        # Parsing fans out to the parsing process pool; this thread mostly waits on it and on embeddings
+        try:
+            await run_io(ci.build_retriever_from_paths, paths, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k)
+        finally:
+            _invalidate_answers(ci)
         log.info(f"Index created successfully for session: {ci.session_id}")
-        return {"session_id":ci.session_id, "k":k, "use_session_dirs":use_session_dirs}
+        return {"session_id":ci.session_id, "k":k, "use_session_dirs":use_session_dirs, **ci.ingest_stats}
     except HTTPException:
         raise    
     except Exception as e:
         log.exception("Chat index building failed")
         raise HTTPException(status_code=500, detail=f"Comparison failed: {e}")
 
+@app.get("/chat/index/jobs/{job_id}")
+def chat_index_job_status(job_id: str) -> Any:
+    status = INGESTION_JOBS.get(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown ingestion job: {job_id}")
+    return status
+
 # ---------- CHAT: QUERY ----------
+def _resolve_index_dir(session_id: Optional[str], use_session_dirs: bool) -> str:
+    if use_session_dirs and not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required when use_session_dirs is True")
+    if use_session_dirs and (os.path.basename(session_id) != session_id or session_id in (".", "..")):
+        raise HTTPException(status_code=400, detail=f"Invalid session_id: {session_id}")
+    
+    index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE
+    if not os.path.isdir(index_dir):
+        raise HTTPException(status_code=404, detail=f"FAISS index not found at: {index_dir}")
+    return index_dir
+
+def _check_retrieval_mode(retrieval_mode: str):
+    if retrieval_mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"retrieval_mode must be one of {list(RETRIEVAL_MODES)}")
+
+async def _load_rag(session_id: Optional[str], session_ids: Optional[str], use_session_dirs: bool,
+                    k: int, retrieval_mode: str) -> ConversationalRAG:
+    """
+    Build the RAG for one session index, or a federated one when ``session_ids``
+    (comma-separated) names several sessions.
+    """
+    _check_retrieval_mode(retrieval_mode)
+    federated = list(dict.fromkeys(s.strip() for s in (session_ids or "").split(",") if s.strip()))
+    if federated:
+        if retrieval_mode != "vector":
+            raise HTTPException(status_code=400, detail="Federated queries support retrieval_mode=vector only")
+        index_paths = {sid: _resolve_index_dir(sid, True) for sid in federated}
+        rag = await run_io(ConversationalRAG, session_id=session_id)
+        await run_cpu(rag.load_retriever_from_sessions, index_paths, k=k, index_name=FAISS_INDEX_NAME)
+        return rag
+    
+    index_dir = _resolve_index_dir(session_id, use_session_dirs)
+    rag = await run_io(ConversationalRAG, session_id=session_id)
+    await run_cpu(rag.load_retriever_from_faiss, index_dir, k=k, index_name=FAISS_INDEX_NAME,
+                  retrieval_mode=retrieval_mode)
+    return rag
+
+def _memory_for(session_id: Optional[str], use_memory: bool) -> Optional[ConversationMemory]:
+    return get_conversation_memory() if use_memory and session_id else None
+
+async def _compact_memory(memory: ConversationMemory, session_id: str, llm):
+    # Runs after the response is sent; a failed summary only delays compaction
+    try:
+        await run_io(memory.compact, session_id, llm)
+    except Exception:
+        log.exception("Conversation summary failed", session_id=session_id)
+
 @app.post("/chat/query")
 async def chat_query(
+    background_tasks: BackgroundTasks,
     question: str = Form(...),
     session_id: Optional[str] = Form(None),
     use_session_dirs: bool = Form(True),
     k: int = Form(5),
+    retrieval_mode: str = Form("vector"),
+    use_memory: bool = Form(False),
+    session_ids: Optional[str] = Form(None),
 ) -> Any:
     try:
-        log.info(f"Received chat query: '{question}' | session: {session_id}")
-        if use_session_dirs and not session_id:
-            raise HTTPException(status_code=400, detail="session_id is required when use_session_dirs is True")
+        log.info(f"Received chat query: '{question}' | session: {session_id} | sessions: {session_ids}")
+        rag = await _load_rag(session_id, session_ids, use_session_dirs, k, retrieval_mode)
         
-        index_dir = os.path.join(FAISS_BASE, session_id) if use_session_dirs else FAISS_BASE
-        if not os.path.isdir(index_dir):
-            raise HTTPException(status_code=404, detail=f"FAISS index not found at: {index_dir}")
-
-        rag = ConversationalRAG(session_id=session_id)
-        rag.load_retriever_from_faiss(index_dir)
-        
-        response = rag.invoke(user_input=question, chat_history=[])
+        memory = _memory_for(session_id, use_memory)
+        history = await run_io(memory.history, session_id) if memory else []
+        response = await run_io(rag.invoke, user_input=question, chat_history=history)
+        if memory and response != NO_ANSWER:
+            await run_io(memory.append, session_id, question, response)
+            background_tasks.add_task(_compact_memory, memory, session_id, rag.llm)
         log.info("Chat query handled successfully.")
         
         return {
             "answer": response,
             "session_id": session_id,
             "k": k,
-            "engine": "LCEL-RAG"
+            "engine": "LCEL-RAG",
+            "cached": rag.last_answer_cached,
+            "history_messages": len(history),
+            "retrieval_mode": rag.retrieval_mode,
+            "retrieval_timings": rag.retrieval_timings(),
         }        
     except HTTPException:
         raise    
     except Exception as e:
         log.exception("Chat query failed")
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/query/stream")
+async def chat_query_stream(
+    question: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    use_session_dirs: bool = Form(True),
+    k: int = Form(5),
+    retrieval_mode: str = Form("vector"),
+    use_memory: bool = Form(False),
+    session_ids: Optional[str] = Form(None),
+) -> Any:
+    """
+    Server-Sent Events variant of /chat/query: ``timing`` events (rewrite, retrieval),
+    then one ``token`` event per model chunk, then ``done`` (or ``error``).
+    """
+    try:
+        log.info(f"Received streaming chat query: '{question}' | session: {session_id} | sessions: {session_ids}")
+        rag = await _load_rag(session_id, session_ids, use_session_dirs, k, retrieval_mode)
+        memory = _memory_for(session_id, use_memory)
+        history = await run_io(memory.history, session_id) if memory else []
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.exception("Chat stream setup failed")
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+    
+    async def events():
+        yield _sse("meta", {"session_id": session_id, "k": k, "engine": "LCEL-RAG", "retrieval_mode": rag.retrieval_mode})
+        answer: List[str] = []
+        try:
+            async for event in rag.astream(user_input=question, chat_history=history):
+                name = event.pop("event")
+                if name == "token":
+                    answer.append(event["data"])
+                yield _sse(name, event.get("data") if name == "token" else event)
+            if memory and "".join(answer).strip():
+                await run_io(memory.append, session_id, question, "".join(answer))
+        except Exception as e:
+            log.exception("Chat stream failed")
+            yield _sse("error", {"detail": f"Query failed: {getattr(e, 'error_message', e)}"})
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(_compact_memory, memory, session_id, rag.llm) if memory else None)
+
+@app.delete("/chat/memory/{session_id}")
+async def clear_chat_memory(session_id: str) -> Dict[str, Any]:
+    """Forget the stored conversation (turns and summary) for a session."""
+    await run_io(get_conversation_memory().clear, session_id)
+    return {"session_id": session_id, "cleared": True}
     
 # command for executing the fast api
 # uvicorn api.main:app --port 8080 --reload    
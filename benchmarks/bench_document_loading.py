@@ -0,0 +1,83 @@
+"""
+Benchmark: utils.document_ops.load_documents vs the previous sequential PyPDFLoader path,
+with the PDF text cache disabled and then warm (repeat analysis / re-indexing).
+
+Run from the repository root:
+    python -m benchmarks.bench_document_loading --files 4 --pages 60
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import fitz
+from langchain_community.document_loaders import PyPDFLoader
+
+from utils.document_ops import load_documents
+from utils.pdf_text_cache import PDF_TEXT_CACHE
+
+LOREM = ("Clause {n}. The supplier shall deliver the goods described in Schedule {n} "
+         "within thirty days of the purchase order, subject to the terms herein. ")
+
+
+def make_pdf(path: Path, pages: int):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        text = "".join(LOREM.format(n=i * 40 + j) for j in range(40))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=8)
+    doc.save(str(path))
+    doc.close()
+
+
+def legacy_load(paths):
+    docs = []
+    for p in paths:
+        docs.extend(PyPDFLoader(str(p)).load())
+    return docs
+
+
+def timed(fn, paths, repeat):
+    best = float("inf")
+    docs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        docs = fn(paths)
+        best = min(best, time.perf_counter() - started)
+    return best, docs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [Path(tmp) / f"doc_{i}.pdf" for i in range(args.files)]
+        for p in paths:
+            make_pdf(p, args.pages)
+
+        PDF_TEXT_CACHE.enabled = False
+        # Warm the process pool so the comparison reflects steady-state requests
+        load_documents(paths[:1])
+
+        legacy_s, legacy_docs = timed(legacy_load, paths, args.repeat)
+        new_s, new_docs = timed(load_documents, paths, args.repeat)
+
+        PDF_TEXT_CACHE.enabled = True
+        PDF_TEXT_CACHE.cache_dir = Path(tmp) / "text_cache"
+        load_documents(paths)
+        cached_s, cached_docs = timed(load_documents, paths, args.repeat)
+
+    print(f"files={args.files} pages/file={args.pages}")
+    print(f"{'loader':<28}{'best seconds':>14}{'docs':>8}")
+    print(f"{'PyPDFLoader (sequential)':<28}{legacy_s:>14.3f}{len(legacy_docs):>8}")
+    print(f"{'load_documents (parallel)':<28}{new_s:>14.3f}{len(new_docs):>8}")
+    print(f"{'load_documents (cache warm)':<28}{cached_s:>14.3f}{len(cached_docs):>8}")
+    print(f"speedup: {legacy_s / new_s:.1f}x parsing, {legacy_s / cached_s:.1f}x cached")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: FAISS index open time and resident memory, FAISS.load_local vs the
+memory-mapped loader in utils.faiss_io. Each load runs in a fresh process so memory
+deltas are not polluted by earlier loads. Memory is private (anonymous) RSS: mapped
+index pages are file-backed and shared by every worker through the page cache.
+
+Run from the repository root:
+    python -m benchmarks.bench_faiss_loading --vectors 200000 --dim 768
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def build_index(path: str, vectors: int, dim: int):
+    from langchain_community.embeddings import FakeEmbeddings
+    from langchain_community.vectorstores import FAISS
+    from utils.faiss_io import save_vectorstore
+
+    rng = np.random.default_rng(0)
+    data = rng.random((vectors, dim), dtype=np.float32)
+    pairs = [(f"chunk {i}", data[i].tolist()) for i in range(vectors)]
+    store = FAISS.from_embeddings(pairs, FakeEmbeddings(size=dim))
+    save_vectorstore(store, path)
+
+
+def child(mode: str, path: str, dim: int):
+    from langchain_community.embeddings import FakeEmbeddings
+    from langchain_community.vectorstores import FAISS
+    from utils.faiss_io import load_vectorstore
+
+    emb = FakeEmbeddings(size=dim)
+    before = rss_mb()
+    started = time.perf_counter()
+    if mode == "load_local":
+        store = FAISS.load_local(path, emb, allow_dangerous_deserialization=True)
+    else:
+        store = load_vectorstore(path, emb, mmap=True)
+    open_s = time.perf_counter() - started
+    after_open = rss_mb()
+
+    query = np.random.default_rng(1).random((1, dim), dtype=np.float32)
+    started = time.perf_counter()
+    store.index.search(query, 5)
+    first_search_s = time.perf_counter() - started
+    print(json.dumps({
+        "mode": mode,
+        "open_s": open_s,
+        "rss_open_mb": after_open - before,
+        "first_search_s": first_search_s,
+        "rss_after_search_mb": rss_mb() - before,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--child", choices=["load_local", "mmap"])
+    parser.add_argument("--path")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.path, args.dim)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        build_index(tmp, args.vectors, args.dim)
+        print(f"vectors={args.vectors} dim={args.dim} index={args.vectors * args.dim * 4 / 2**20:.0f} MB")
+        print(f"{'mode':<12}{'open s':>10}{'private MB':>14}{'1st search s':>14}{'after search':>15}")
+        for mode in ("load_local", "mmap"):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_faiss_loading", "--child", mode,
+                 "--path", tmp, "--dim", str(args.dim)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{mode:<12}{r['open_s']:>10.3f}{r['rss_open_mb']:>14.1f}"
+                  f"{r['first_search_s']:>14.3f}{r['rss_after_search_mb']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Benchmark: recall@k vs query latency for the faiss_db index types on synthetic,
+clustered embeddings (ground truth from an exact Flat search).
+
+Run from the repository root:
+    python -m benchmarks.bench_index_types --vectors 100000 --dim 256
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.faiss_io import DEFAULT_INDEX_SETTINGS, apply_search_params, build_index
+
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, rng) -> np.ndarray:
+    # Document embeddings are clustered by topic rather than uniform noise
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    data = centers[rng.integers(0, clusters, n)] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    data = synthetic_embeddings(args.vectors, args.dim, clusters=200, rng=rng)
+    queries = synthetic_embeddings(args.queries, args.dim, clusters=200, rng=np.random.default_rng(0))
+    queries += 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    configs = [("Flat", {})]
+    configs += [("IVFFlat", {"nprobe": p}) for p in (4, 16, 64)]
+    configs += [("IVFPQ", {"nprobe": p}) for p in (16, 64)]
+    configs += [("HNSW", {"ef_search": ef}) for ef in (32, 64, 128)]
+
+    truth = None
+    print(f"vectors={args.vectors} dim={args.dim} queries={args.queries} k={args.k}")
+    print(f"{'index':<10}{'params':<14}{'build s':>9}{'ms/query':>10}{f'recall@{args.k}':>11}")
+    built = {}
+    for index_type, params in configs:
+        settings = {**DEFAULT_INDEX_SETTINGS, "index_type": index_type, "min_vectors_for_ann": 0, **params}
+        started = time.perf_counter()
+        if index_type not in built:
+            index = build_index(data, settings)
+            index.add(data)
+            built[index_type] = (index, time.perf_counter() - started)
+        index, build_s = built[index_type]
+        if params:
+            apply_search_params(index, settings)
+
+        started = time.perf_counter()
+        _, found = index.search(queries, args.k)
+        per_query_ms = (time.perf_counter() - started) * 1000 / args.queries
+        if truth is None:
+            truth = found
+        label = ",".join(f"{k}={v}" for k, v in params.items()) or "-"
+        print(f"{index_type:<10}{label:<14}{build_s:>9.2f}{per_query_ms:>10.3f}{recall_at_k(found, truth):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Load test: concurrent /chat/query throughput and /health latency, with blocking work
+run on the event loop ("before") vs on the dedicated executors ("after").
+
+The RAG pipeline is replaced by a stub that blocks like the real one (FAISS load +
+synchronous LLM call), so no API keys or indexes are needed.
+
+Run from the repository root:
+    python -m benchmarks.load_test_api --requests 40 --llm-seconds 0.5
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+import api.main as main
+
+
+def make_stub_rag(load_seconds: float, llm_seconds: float):
+    class StubRAG:
+        retrieval_mode = "vector"
+        last_answer_cached = False
+
+        def __init__(self, session_id=None, **kwargs):
+            self.session_id = session_id
+
+        def retrieval_timings(self):
+            return {}
+
+        def load_retriever_from_faiss(self, index_path, **kwargs):
+            time.sleep(load_seconds)
+
+        def invoke(self, user_input, chat_history=None, **kwargs):
+            time.sleep(llm_seconds)
+            return f"stub answer to {user_input}"
+
+    return StubRAG
+
+
+async def inline(fn, *args, **kwargs):
+    # Reproduces the old handlers: blocking calls made directly on the event loop
+    return fn(*args, **kwargs)
+
+
+async def run_scenario(n_requests: int, health_probes: int):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        async def query(i):
+            r = await client.post("/chat/query", data={"question": f"q{i}", "session_id": "bench", "use_memory": "false"})
+            r.raise_for_status()
+
+        async def probe():
+            started = time.perf_counter()
+            (await client.get("/health")).raise_for_status()
+            return time.perf_counter() - started
+
+        async def probes():
+            samples = []
+            for _ in range(health_probes):
+                samples.append(await probe())
+                await asyncio.sleep(0.02)
+            return samples
+
+        started = time.perf_counter()
+        results = await asyncio.gather(probes(), *(query(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - started
+    return elapsed, results[0]
+
+
+def report(label, n_requests, elapsed, health):
+    print(f"{label:<8} wall={elapsed:7.2f}s  throughput={n_requests / elapsed:6.1f} req/s  "
+          f"/health p50={statistics.median(health) * 1000:7.1f}ms  max={max(health) * 1000:7.1f}ms")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--llm-seconds", type=float, default=0.5)
+    parser.add_argument("--load-seconds", type=float, default=0.05)
+    parser.add_argument("--health-probes", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        (Path(tmp) / "bench").mkdir()
+        main.FAISS_BASE = tmp
+        main.ConversationalRAG = make_stub_rag(args.load_seconds, args.llm_seconds)
+
+        executors = (main.run_cpu, main.run_io)
+        main.run_cpu = main.run_io = inline
+        before = asyncio.run(run_scenario(args.requests, args.health_probes))
+
+        main.run_cpu, main.run_io = executors
+        after = asyncio.run(run_scenario(args.requests, args.health_probes))
+
+    print(f"{args.requests} concurrent /chat/query, llm={args.llm_seconds}s load={args.load_seconds}s")
+    report("before", args.requests, *before)
+    report("after", args.requests, *after)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -11,6 +11,15 @@ Analyze this document:
 {document_text}
 """)
 
+#map step of large-document analysis: condense one page range
+document_analysis_map_prompt = ChatPromptTemplate.from_template("""
+You are condensing part of a longer document so it can be analyzed as a whole later.
+Summarize pages {first_page} to {last_page} below in at most {max_words} words. Keep the key points,
+any title, author, publisher or date information, and note the tone of the writing.
+
+{page_text}
+""")
+
 document_comparison_prompt = ChatPromptTemplate.from_template("""
 You will be provided with content from two documents. Your tasks are as follows:
 
@@ -28,6 +37,24 @@ Your response should follow this format:
 {format_instruction}
 """)
 
+#prompt for comparing only the pages that a local diff found changed
+document_comparison_diff_prompt = ChatPromptTemplate.from_template("""
+You will be given the pages that differ between a reference document and an actual document.
+Each page is introduced by a header with its page label, followed by unified-diff hunks:
+lines starting with "-" appear only in the reference, lines starting with "+" only in the actual document.
+
+For every page listed, describe what changed in plain language. Use the page label from the
+header, exactly as written, as the "page" value. Do not report pages that are not listed.
+
+Changed pages:
+
+{changed_pages}
+
+Your response should follow this format:
+
+{format_instruction}
+""")
+
 #prompt for contextual question rewriting
 contextual_question_prompt = ChatPromptTemplate.from_messages([
     ("system", (
@@ -50,10 +77,24 @@ context_qa_prompt = ChatPromptTemplate.from_messages([
     ("human", "{input}"),
     ])
 
+#prompt for folding older chat turns into a rolling summary
+conversation_summary_prompt = ChatPromptTemplate.from_messages([
+    ("system", (
+        "You maintain a running summary of a conversation about a set of documents. Update the existing "
+        "summary with the new messages, keeping facts, names, numbers and open questions the user may refer "
+        "back to. Reply with the updated summary only, in at most {max_words} words.\n\n"
+        "Existing summary: {summary}"
+    )),
+    MessagesPlaceholder("messages"),
+    ])
+
 
 PROMPT_REGISTRY = {
     "document_analysis":document_analysis_prompt, 
+    "document_analysis_map":document_analysis_map_prompt,
     "document_comparison":document_comparison_prompt,
+    "document_comparison_diff":document_comparison_diff_prompt,
     "contextualize_question":contextual_question_prompt,
-    "context_qa":context_qa_prompt
+    "context_qa":context_qa_prompt,
+    "summarize_conversation":conversation_summary_prompt
     }
\ No newline at end of file
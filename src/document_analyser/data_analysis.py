@@ -1,11 +1,65 @@
 import sys
-from utils.model_loader import ModelLoader
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, Future, wait
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Type
+from pydantic import BaseModel, create_model
+from utils.model_loader import MODEL_REGISTRY
+from utils.config_loader import load_settings
+from utils.executors import ANALYSIS_MAP_EXECUTOR
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import EnterpriseDocumentChatException
 from model.models import *
-from langchain_core.output_parsers import JsonOutputParser
-from langchain.output_parsers import OutputFixingParser
+from langchain_core.output_parsers import StrOutputParser
 from prompt.prompt_library import PROMPT_REGISTRY
+from src.document_analyser.local_metadata import detect_language
+from utils.structured_output import StructuredOutputChain
+
+DEFAULT_ANALYSIS_SETTINGS: Dict[str, Any] = {
+    "single_pass_max_tokens": 12000,
+    "map_group_tokens": 4000,
+    "map_summary_words": 250,
+    "chars_per_token": 4.0,
+}
+
+# (first page, last page, text) of consecutive pages, 1-based
+PageGroup = Tuple[int, int, str]
+
+
+def analysis_settings() -> Dict[str, Any]:
+    """Single-pass / map-reduce settings from the analysis section of config.yaml."""
+    return load_settings("analysis", DEFAULT_ANALYSIS_SETTINGS)
+
+
+@lru_cache(maxsize=None)
+def metadata_schema(known_fields: FrozenSet[str]) -> Type[BaseModel]:
+    """Metadata restricted to the fields not already known locally."""
+    if not known_fields:
+        return Metadata
+    return create_model("MetadataFromLLM", **{
+        name: (field.annotation, field) for name, field in Metadata.model_fields.items() if name not in known_fields
+    })
+
+
+_OUTPUT_CHAINS: Dict[FrozenSet[str], StructuredOutputChain] = {}
+_OUTPUT_CHAINS_LOCK = threading.Lock()
+
+
+def analysis_chain(prompt, llm, known_fields: FrozenSet[str]) -> StructuredOutputChain:
+    """
+    Structured-output chain for metadata_schema(known_fields), built once and
+    reused for as long as the shared LLM client stays the same.
+    """
+    with _OUTPUT_CHAINS_LOCK:
+        chain = _OUTPUT_CHAINS.get(known_fields)
+        if chain is None or chain.llm is not llm:
+            chain = StructuredOutputChain(prompt, llm, metadata_schema(known_fields), component="analysis")
+            _OUTPUT_CHAINS[known_fields] = chain
+        return chain
+
 
 class DocumentAnalyzer:
     """
@@ -16,13 +70,14 @@ class DocumentAnalyzer:
     def __init__(self):
         
         try:
-            self.loader = ModelLoader()
-            self.llm = self.loader.load_llm()
-            
-            self.parser = JsonOutputParser(pydantic_object=Metadata)
-            self.fixing_parser = OutputFixingParser.from_llm(parser= self.parser, llm= self.llm)
+            self.loader = MODEL_REGISTRY.loader()
+            self.llm = MODEL_REGISTRY.llm()
             
             self.prompt = PROMPT_REGISTRY["document_analysis"]
+            self.output = analysis_chain(self.prompt, self.llm, frozenset())
+            self.map_chain = PROMPT_REGISTRY["document_analysis_map"] | self.llm | StrOutputParser()
+            self.settings = analysis_settings()
+            self.last_stats: Dict[str, Any] = {}
             
             log.info("DocumentAnalyzer initialized successfully")
             
@@ -33,26 +88,159 @@ class DocumentAnalyzer:
             raise EnterpriseDocumentChatException("Error initializing DocumentAnalyzer", sys)
         
     
-    def analyze_document(self, document_text: str) -> dict:
+    def analyze_document(self, document_text: str, known: Optional[Dict[str, Any]] = None) -> dict:
         """
         Analyze a document's text and extract structured metadata & summary.
+        Fields in ``known`` (read locally from the file) are left out of the
+        requested schema and override whatever the model returns.
         """
         
         try: 
-            chain = self.prompt | self.llm | self.fixing_parser
+            known = {name: value for name, value in (known or {}).items() if name in Metadata.model_fields}
+            output = analysis_chain(self.prompt, self.llm, frozenset(known))
             
-            log.info("Document analysis chain created successfully")
+            log.info("Document analysis chain created successfully", known_fields=sorted(known))
             
-            response = chain.invoke({
-                "format_instructions": self.parser.get_format_instructions(),
-                "document_text": document_text
-            })
-    
-            log.info("Document extraction successfully", keys=list(response.keys()))
+            response, path = output.invoke_with_path({"document_text": document_text})
+            self.last_stats["output_path"] = path
+            
+            merged = {**response, **known}
+            response = {name: merged[name] for name in Metadata.model_fields if name in merged}
+            log.info("Document extraction successfully", keys=list(response.keys()), output_path=path)
             
             return response
         
         
         except Exception as e:
             log.error("Metadata analysis failed", error=str(e))
-            raise EnterpriseDocumentChatException("Error analyzing document", sys) 
\ No newline at end of file
+            raise EnterpriseDocumentChatException("Error analyzing document", sys)
+    
+    def _estimate_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / float(self.settings["chars_per_token"]))
+    
+    def _group_pages(self, pages: Iterable[str]) -> Iterator[PageGroup]:
+        """Consecutive pages packed into groups of about map_group_tokens."""
+        limit = int(self.settings["map_group_tokens"])
+        first, parts, tokens, page_num = 1, [], 0, 0
+        for page_num, text in enumerate(pages, start=1):
+            block = f"\n--- Page {page_num} ---\n{text}"
+            block_tokens = self._estimate_tokens(block)
+            if parts and tokens + block_tokens > limit:
+                yield first, page_num - 1, "\n".join(parts)
+                first, parts, tokens = page_num, [], 0
+            parts.append(block)
+            tokens += block_tokens
+        if parts:
+            yield first, page_num, "\n".join(parts)
+    
+    def _summarize_group(self, group: PageGroup) -> Tuple[PageGroup, float]:
+        first, last, text = group
+        started = time.perf_counter()
+        summary = self.map_chain.invoke({
+            "first_page": first,
+            "last_page": last,
+            "page_text": text,
+            "max_words": self.settings["map_summary_words"],
+        })
+        return (first, last, summary), (time.perf_counter() - started) * 1000
+    
+    def _map(self, groups: Iterable[PageGroup]) -> List[PageGroup]:
+        # Submitting while iterating lets map calls start before the last page is read
+        futures: List[Future] = [ANALYSIS_MAP_EXECUTOR.submit(self._summarize_group, g) for g in groups]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = next((f for f in futures if f in done and f.exception() is not None), None)
+        if failed is not None:
+            # The analysis is lost anyway; don't spend LLM calls on groups not yet started
+            cancelled = sum(f.cancel() for f in pending)
+            log.error("Map step failed", error=str(failed.exception()), cancelled=cancelled)
+            raise failed.exception()
+        results = [f.result() for f in futures]
+        self.last_stats.setdefault("map_ms", []).extend(round(ms, 1) for _, ms in results)
+        return [summary for summary, _ in results]
+    
+    def analyze_pages(self, pages: Iterable[str], known: Optional[Dict[str, Any]] = None) -> dict:
+        """
+        Analyze a document given as a stream of page texts.
+        
+        Small documents go to the model in one pass. Once the text read so far
+        exceeds single_pass_max_tokens, page groups are summarized concurrently
+        (map) as they stream in, and the summaries are analyzed into Metadata
+        (reduce), re-summarizing them first if they are still too large.
+        ``known`` holds locally extracted fields; Language is detected from the
+        first pages when it is not given.
+        """
+        try:
+            limit = int(self.settings["single_pass_max_tokens"])
+            self.last_stats = {"mode": "single_pass"}
+            started = time.perf_counter()
+            groups = self._group_pages(pages)
+            
+            buffered: List[PageGroup] = []
+            tokens = 0
+            for group in groups:
+                buffered.append(group)
+                tokens += self._estimate_tokens(group[2])
+                if tokens > limit:
+                    break
+            else:
+                known = self._with_language(known, buffered)
+                result = self.analyze_document("\n".join(text for _, _, text in buffered), known)
+                self.last_stats.update(pages=buffered[-1][1] if buffered else 0,
+                                       total_ms=round((time.perf_counter() - started) * 1000, 1))
+                log.info("Document analyzed", **self.last_stats)
+                return result
+            
+            # Too large for one prompt: keep streaming pages into concurrent map calls
+            self.last_stats["mode"] = "map_reduce"
+            known = self._with_language(known, buffered)
+            summaries = self._map(itertools.chain(buffered, groups))
+            page_count = summaries[-1][1]
+            self.last_stats.update(pages=page_count, groups=len(summaries))
+            
+            def joined(parts: List[PageGroup]) -> str:
+                return "\n\n".join(f"[Pages {first}-{last}]\n{text}" for first, last, text in parts)
+            
+            while len(summaries) > 1 and self._estimate_tokens(joined(summaries)) > limit:
+                regrouped = self._pack_summaries(summaries)
+                if len(regrouped) == len(summaries):
+                    break
+                summaries = self._map(regrouped)
+            
+            reduce_started = time.perf_counter()
+            result = self.analyze_document(
+                f"The document has {page_count} pages. Below are summaries of consecutive page ranges, "
+                f"in order; analyze the document as a whole.\n\n{joined(summaries)}",
+                known,
+            )
+            self.last_stats.update(reduce_ms=round((time.perf_counter() - reduce_started) * 1000, 1),
+                                   total_ms=round((time.perf_counter() - started) * 1000, 1))
+            log.info("Document analyzed", **self.last_stats)
+            return result
+        
+        except EnterpriseDocumentChatException:
+            raise
+        except Exception as e:
+            log.error("Map-reduce analysis failed", error=str(e))
+            raise EnterpriseDocumentChatException("Error analyzing document", sys)
+    
+    def _with_language(self, known: Optional[Dict[str, Any]], buffered: List[PageGroup]) -> Dict[str, Any]:
+        known = dict(known or {})
+        if "Language" not in known:
+            language = detect_language("\n".join(text for _, _, text in buffered))
+            if language:
+                known["Language"] = language
+        self.last_stats["local_fields"] = sorted(known)
+        return known
+    
+    def _pack_summaries(self, summaries: List[PageGroup]) -> List[PageGroup]:
+        """Merge neighbouring summaries into groups of about map_group_tokens."""
+        limit = int(self.settings["map_group_tokens"])
+        packed: List[PageGroup] = []
+        for first, last, text in summaries:
+            if packed and self._estimate_tokens(packed[-1][2] + text) <= limit:
+                p_first, _, p_text = packed[-1]
+                packed[-1] = (p_first, last, f"{p_text}\n\n[Pages {first}-{last}]\n{text}")
+            else:
+                packed.append((first, last, f"[Pages {first}-{last}]\n{text}"))
+        return packed
+
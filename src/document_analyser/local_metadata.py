@@ -0,0 +1,118 @@
+"""
+Document metadata that can be read without the LLM: the PDF info dictionary via
+PyMuPDF, and a fast stopword/script based language guess.
+"""
+from __future__ import annotations
+import re
+from collections import Counter
+from typing import Any, Dict, Optional
+
+import fitz
+
+from logger import GLOBAL_LOGGER as log
+
+_PDF_DATE_RE = re.compile(r"^D:(\d{4})(\d{2})?(\d{2})?(\d{2})?(\d{2})?(\d{2})?([Zz+\-])?(\d{2})?'?(\d{2})?")
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+# Non-Latin scripts identify the language (or a close family) on their own; kana before Han
+_SCRIPTS = [
+    ("Japanese", re.compile(r"[\u3040-\u30ff]")),
+    ("Korean", re.compile(r"[\uac00-\ud7af]")),
+    ("Chinese", re.compile(r"[\u4e00-\u9fff]")),
+    ("Russian", re.compile(r"[\u0400-\u04ff]")),
+    ("Arabic", re.compile(r"[\u0600-\u06ff]")),
+    ("Hebrew", re.compile(r"[\u0590-\u05ff]")),
+    ("Greek", re.compile(r"[\u0370-\u03ff]")),
+    ("Hindi", re.compile(r"[\u0900-\u097f]")),
+    ("Thai", re.compile(r"[\u0e00-\u0e7f]")),
+]
+
+_STOPWORDS = {
+    "English": "the and of to in is that for it with as was on are be by this have from or not which",
+    "Spanish": "el la de que y en los se del las por un para con una su al es lo como más pero sus",
+    "French": "le la les de des et en du un une est que qui dans pour pas sur au avec ce il sont",
+    "German": "der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch",
+    "Italian": "il di che è la per un in con non una del sono le si della al dei gli da",
+    "Portuguese": "de que não o da em um para é com uma os no se na por mais as dos do",
+    "Dutch": "de het een en van in is dat op te zijn voor met die niet aan er ook als",
+}
+_STOPWORD_SETS = {lang: set(words.split()) for lang, words in _STOPWORDS.items()}
+
+SAMPLE_CHARS = 20000
+
+# Info-dict values written by authoring tools rather than by people
+_APP_TITLE_RE = re.compile(r"^(?:microsoft (?:word|powerpoint|excel)\b.*|untitled\b.*|document\s*\d*|slide\s*\d+)$",
+                            re.IGNORECASE)
+_FILE_NAME_RE = re.compile(r"\.(docx?|pdf|txt|rtf|odt|pptx?|xlsx?|tex|html?)$", re.IGNORECASE)
+_ACCOUNT_NAMES = {"user", "admin", "administrator", "owner", "author", "unknown", "default"}
+
+
+def parse_pdf_date(value: str) -> str:
+    """PDF date string ("D:YYYYMMDDHHmmSS+HH'mm'") as ISO 8601; "" if unparseable."""
+    match = _PDF_DATE_RE.match((value or "").strip())
+    if not match:
+        return ""
+    year, month, day, hour, minute, second, tz, tz_h, tz_m = match.groups()
+    out = f"{year}-{month or '01'}-{day or '01'}"
+    if hour:
+        out += f"T{hour}:{minute or '00'}:{second or '00'}"
+        if tz in ("Z", "z"):
+            out += "Z"
+        elif tz in ("+", "-") and tz_h:
+            out += f"{tz}{tz_h}:{tz_m or '00'}"
+    return out
+
+
+def detect_language(text: str) -> Optional[str]:
+    """
+    Best-guess language name of ``text``, or None when the sample is inconclusive.
+    """
+    sample = text[:SAMPLE_CHARS]
+    letters = [ch for ch in sample if ch.isalpha()]
+    if not letters:
+        return None
+    non_latin = "".join(ch for ch in letters if ord(ch) > 0x24F)
+    if len(non_latin) > len(letters) / 2:
+        counts = Counter(name for name, pattern in _SCRIPTS for _ in pattern.finditer(non_latin))
+        if counts.get("Japanese"):
+            return "Japanese"
+        return counts.most_common(1)[0][0] if counts else None
+
+    words = [w.lower() for w in _WORD_RE.findall(sample)]
+    if len(words) < 5:
+        return None
+    scores = {lang: sum(w in stop for w in words) for lang, stop in _STOPWORD_SETS.items()}
+    best = max(scores, key=scores.get)
+    return best if scores[best] / len(words) >= 0.05 else None
+
+
+def plausible_title(title: str) -> bool:
+    """False for info-dict titles that are file names or tool defaults ("Microsoft Word - draft.docx")."""
+    return (len(title) >= 3 and not title.isdigit()
+            and not _APP_TITLE_RE.match(title) and not _FILE_NAME_RE.search(title))
+
+
+def plausible_author(author: str) -> bool:
+    return len(author) >= 2 and author.lower() not in _ACCOUNT_NAMES
+
+
+def extract_pdf_metadata(pdf_path: str) -> Dict[str, Any]:
+    """
+    Metadata fields readable from the PDF itself. Only fields with a plausible value
+    are returned, so the caller can ask the LLM for the rest. Publisher is left to
+    the LLM: the info dict only names the authoring software (creator / producer).
+    """
+    with fitz.open(pdf_path) as doc:
+        info = doc.metadata or {}
+        title = (info.get("title") or "").strip()
+        author = (info.get("author") or "").strip()
+        fields: Dict[str, Any] = {
+            "Title": title if plausible_title(title) else "",
+            "Author": author if plausible_author(author) else "",
+            "DateCreated": parse_pdf_date(info.get("creationDate") or ""),
+            "LastModifiedDate": parse_pdf_date(info.get("modDate") or ""),
+            "PageCount": doc.page_count,
+        }
+    known = {name: value for name, value in fields.items() if value not in ("", None)}
+    log.info("Local PDF metadata extracted", pdf_path=str(pdf_path), fields=sorted(known))
+    return known
@@ -0,0 +1,164 @@
+from __future__ import annotations
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from utils.config_loader import load_settings
+from utils.metrics import METRICS
+from src.document_chat.question_rewrite import normalize_question
+from logger import GLOBAL_LOGGER as log
+
+DEFAULT_ANSWER_CACHE_SETTINGS: Dict[str, Any] = {
+    "enabled": True,
+    "similarity_threshold": 0.95,
+    "ttl_seconds": 3600,
+    "max_entries": 2000,
+}
+
+Scope = Tuple[str, str, Hashable]
+
+_HITS = METRICS.counter("answer_cache_hits_total", "Answers served from the semantic answer cache")
+_MISSES = METRICS.counter("answer_cache_misses_total", "Questions that missed the semantic answer cache")
+_SAVED = METRICS.counter("answer_cache_saved_seconds_total", "Answer latency avoided by cache hits (seconds)")
+
+
+def answer_cache_settings() -> Dict[str, Any]:
+    """Semantic answer cache settings from the answer_cache section of config.yaml."""
+    return load_settings("answer_cache", DEFAULT_ANSWER_CACHE_SETTINGS)
+
+
+def _index_signature(index_dir: str, index_name: str) -> Tuple[int, ...]:
+    try:
+        st = os.stat(os.path.join(index_dir, f"{index_name}.faiss"))
+    except FileNotFoundError:
+        return ()
+    return st.st_mtime_ns, st.st_size
+
+
+@dataclass
+class _Entry:
+    scope: Scope
+    question: str
+    vector: np.ndarray
+    answer: str
+    signature: Tuple[int, ...]
+    created: float
+    cost_s: float
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by session index and question embedding.
+
+    A lookup hits when a cached question of the same scope (index directory, index
+    name, retrieval options) is at least ``similarity_threshold`` cosine-similar and
+    younger than ``ttl_seconds``. Entries record the index file signature, so answers
+    given before an ingest are never served after it, even by another worker process;
+    ``invalidate`` drops them eagerly. Least-recently-used entries beyond
+    ``max_entries`` are evicted.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl_seconds: float = 3600,
+                 max_entries: int = 2000, enabled: bool = True):
+        self.similarity_threshold = float(similarity_threshold)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = int(max_entries)
+        self.enabled = bool(enabled)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(index_dir: str, index_name: str = "index", options: Hashable = ()) -> Scope:
+        return str(Path(index_dir).resolve()), index_name, options
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _live(self, scope: Scope, now: float) -> List[Tuple[int, _Entry]]:
+        signature = _index_signature(scope[0], scope[1])
+        live, stale = [], []
+        for entry_id, entry in self._entries.items():
+            if entry.scope != scope:
+                continue
+            if entry.signature != signature or now - entry.created > self.ttl_seconds:
+                stale.append(entry_id)
+            else:
+                live.append((entry_id, entry))
+        for entry_id in stale:
+            del self._entries[entry_id]
+        return live
+
+    def lookup(self, scope: Scope, question: str, embed_query) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Return (cached answer or None, question vector). The vector is only computed
+        when no cached question matches textually; pass it back to ``store``.
+        """
+        if not self.enabled:
+            return None, None
+        now = time.time()
+        normalized = normalize_question(question)
+        with self._lock:
+            live = self._live(scope, now)
+            match = next((i for i, e in live if e.question == normalized), None)
+        vector = None
+        if match is None and live:
+            vector = self._normalize(embed_query(question))
+            matrix = np.stack([e.vector for _, e in live])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity_threshold:
+                match = live[best][0]
+
+        with self._lock:
+            entry = self._entries.get(match) if match is not None else None
+            if entry is None:
+                _MISSES.inc()
+                return None, vector
+            self._entries.move_to_end(match)
+        _HITS.inc()
+        _SAVED.inc(entry.cost_s)
+        log.info("Answer cache hit", index_dir=scope[0], question=question, cached_question=entry.question)
+        return entry.answer, vector
+
+    def store(self, scope: Scope, question: str, answer: str, cost_s: float,
+              embed_query, vector: Optional[np.ndarray] = None):
+        if not self.enabled:
+            return
+        if vector is None:
+            vector = self._normalize(embed_query(question))
+        entry = _Entry(scope, normalize_question(question), vector, answer,
+                       _index_signature(scope[0], scope[1]), time.time(), cost_s)
+        with self._lock:
+            self._entries[next(self._ids)] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, index_dir: Optional[str] = None):
+        """Drop every answer for ``index_dir`` (all answers when None)."""
+        with self._lock:
+            if index_dir is None:
+                self._entries.clear()
+                return
+            resolved = str(Path(index_dir).resolve())
+            for entry_id in [i for i, e in self._entries.items() if e.scope[0] == resolved]:
+                del self._entries[entry_id]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Shared by every request handled in this process
+ANSWER_CACHE = SemanticAnswerCache(**answer_cache_settings())
+METRICS.gauge("answer_cache_entries", "Answers held in the semantic answer cache", lambda: len(ANSWER_CACHE))
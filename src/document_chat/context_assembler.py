@@ -0,0 +1,179 @@
+from __future__ import annotations
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from utils.config_loader import load_settings
+from logger import GLOBAL_LOGGER as log
+
+DEFAULT_CONTEXT_SETTINGS: Dict[str, Any] = {
+    "max_tokens": 3000,
+    "chars_per_token": 4.0,
+    "min_overlap_chars": 20,
+    "duplicate_threshold": 0.9,
+}
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def context_settings() -> Dict[str, Any]:
+    """Context assembly settings from the context section of config.yaml."""
+    return load_settings("context", DEFAULT_CONTEXT_SETTINGS)
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _text_overlap(left: str, right: str, min_chars: int) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right`` (0 if < min_chars)."""
+    if len(right) < min_chars:
+        return 0
+    probe = right[:min_chars]
+    pos = left.find(probe, max(0, len(left) - len(right)))
+    while pos != -1:
+        tail = left[pos:]
+        if right.startswith(tail):
+            return len(tail)
+        pos = left.find(probe, pos + 1)
+    return 0
+
+
+@dataclass
+class _Block:
+    text: str
+    rank: int
+    source: Any
+    page: Any
+    start: Optional[int] = None
+    shingles: set = field(default_factory=set)
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+
+class ContextAssembler:
+    """
+    Turns retrieved chunks into the QA prompt context.
+
+    Chunks from the same source and page that overlap or touch (the splitter's
+    ``chunk_overlap``) are stitched into one passage, near-duplicate passages are
+    dropped, and passages are packed best-first up to ``max_tokens``.
+    """
+
+    def __init__(self, max_tokens: int = 3000, chars_per_token: float = 4.0,
+                 min_overlap_chars: int = 20, duplicate_threshold: float = 0.9):
+        self.max_tokens = int(max_tokens)
+        self.chars_per_token = float(chars_per_token)
+        self.min_overlap_chars = int(min_overlap_chars)
+        self.duplicate_threshold = float(duplicate_threshold)
+        self.last_stats: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls) -> "ContextAssembler":
+        return cls(**context_settings())
+
+    def estimate_tokens(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def _merge(self, docs: List[Document]) -> List[_Block]:
+        groups: Dict[Tuple[Any, Any], List[_Block]] = {}
+        for rank, doc in enumerate(docs):
+            meta = getattr(doc, "metadata", None) or {}
+            block = _Block(getattr(doc, "page_content", str(doc)), rank,
+                           meta.get("source"), meta.get("page"), meta.get("start_index"))
+            groups.setdefault((block.source, block.page), []).append(block)
+
+        merged: List[_Block] = []
+        for blocks in groups.values():
+            if all(b.start is not None for b in blocks):
+                merged.extend(self._merge_by_offset(blocks))
+            else:
+                merged.extend(self._merge_by_text(blocks))
+        merged.sort(key=lambda b: b.rank)
+        return merged
+
+    @staticmethod
+    def _merge_by_offset(blocks: List[_Block]) -> List[_Block]:
+        blocks = sorted(blocks, key=lambda b: b.start)
+        out = [blocks[0]]
+        for block in blocks[1:]:
+            cur = out[-1]
+            if block.start <= cur.end:
+                cur.text += block.text[cur.end - block.start:]
+                cur.rank = min(cur.rank, block.rank)
+            else:
+                out.append(block)
+        return out
+
+    def _merge_by_text(self, blocks: List[_Block]) -> List[_Block]:
+        out: List[_Block] = []
+        for block in blocks:
+            for cur in out:
+                if block.text in cur.text:
+                    break
+                if cur.text in block.text:
+                    cur.text = block.text
+                    break
+                overlap = _text_overlap(cur.text, block.text, self.min_overlap_chars)
+                if overlap:
+                    cur.text += block.text[overlap:]
+                    break
+                overlap = _text_overlap(block.text, cur.text, self.min_overlap_chars)
+                if overlap:
+                    cur.text = block.text + cur.text[overlap:]
+                    break
+            else:
+                out.append(block)
+                continue
+            cur.rank = min(cur.rank, block.rank)
+        return out
+
+    def _is_duplicate(self, block: _Block, kept: List[_Block]) -> bool:
+        for other in kept:
+            union = len(block.shingles | other.shingles)
+            if union and len(block.shingles & other.shingles) / union >= self.duplicate_threshold:
+                return True
+        return False
+
+    def assemble(self, docs: List[Document]) -> str:
+        """
+        Build the context string for ``docs`` (ordered best first).
+        """
+        blocks = self._merge(list(docs))
+        kept: List[_Block] = []
+        parts: List[str] = []
+        used = duplicates = truncated = 0
+        for block in blocks:
+            block.shingles = _shingles(block.text)
+            if self._is_duplicate(block, kept):
+                duplicates += 1
+                continue
+            tokens = self.estimate_tokens(block.text)
+            if used + tokens > self.max_tokens:
+                if parts:
+                    truncated += 1
+                    continue
+                # The best passage alone is over budget: keep its head rather than nothing
+                block.text = block.text[:int(self.max_tokens * self.chars_per_token)]
+                tokens = self.estimate_tokens(block.text)
+            kept.append(block)
+            parts.append(block.text)
+            used += tokens
+
+        self.last_stats = {
+            "chunks": len(docs),
+            "passages": len(parts),
+            "duplicates": duplicates,
+            "over_budget": truncated,
+            "tokens": used,
+        }
+        log.info("Context assembled", **self.last_stats)
+        return "\n\n".join(parts)
@@ -0,0 +1,177 @@
+from __future__ import annotations
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+
+from utils.config_loader import load_settings
+from prompt.prompt_library import PROMPT_REGISTRY
+from model.models import PromptType
+from logger import GLOBAL_LOGGER as log
+
+DEFAULT_MEMORY_SETTINGS: Dict[str, Any] = {
+    "db_path": "chat_memory/memory.sqlite3",
+    "window_turns": 4,
+    "summarize_batch_turns": 2,
+    "summary_max_words": 200,
+    "max_raw_turns": 12,
+}
+
+
+def memory_settings() -> Dict[str, Any]:
+    """Conversation memory settings from the chat_memory section of config.yaml."""
+    return load_settings("chat_memory", DEFAULT_MEMORY_SETTINGS)
+
+
+def _to_message(role: str, content: str) -> BaseMessage:
+    return HumanMessage(content=content) if role == "human" else AIMessage(content=content)
+
+
+class ConversationMemory:
+    """
+    Bounded, persistent chat history per session_id.
+
+    Every turn is stored in SQLite; prompts see only the last ``window_turns``
+    question/answer pairs plus a rolling summary of everything older. Once
+    ``summarize_batch_turns`` extra turns accumulate past the window, ``compact``
+    folds them into the summary with one LLM call, so history size stays bounded
+    however long the conversation runs. If compaction keeps failing, prompts still
+    carry at most ``max_raw_turns`` unsummarized turns; the next compaction folds
+    the whole backlog, oldest first, ``max_raw_turns`` turns per LLM call.
+    """
+
+    def __init__(self, db_path: Path, window_turns: int = 4, summarize_batch_turns: int = 2,
+                 summary_max_words: int = 200, max_raw_turns: int = 12):
+        self.db_path = Path(db_path)
+        self.window_turns = int(window_turns)
+        self.summarize_batch_turns = max(1, int(summarize_batch_turns))
+        self.max_raw_turns = max(int(max_raw_turns), self.window_turns + self.summarize_batch_turns)
+        self.summary_max_words = int(summary_max_words)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._compacting: Set[str] = set()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS messages (session_id TEXT NOT NULL, seq INTEGER NOT NULL,"
+            " role TEXT NOT NULL, content TEXT NOT NULL, created REAL NOT NULL,"
+            " PRIMARY KEY (session_id, seq)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS summaries (session_id TEXT PRIMARY KEY, summary TEXT NOT NULL,"
+            " covered_seq INTEGER NOT NULL) WITHOUT ROWID;"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls) -> "ConversationMemory":
+        return cls(**memory_settings())
+
+    def _summary(self, session_id: str):
+        return self._conn.execute(
+            "SELECT summary, covered_seq FROM summaries WHERE session_id = ?", (session_id,)
+        ).fetchone() or ("", -1)
+
+    def _pending(self, session_id: str, covered_seq: int):
+        return self._conn.execute(
+            "SELECT seq, role, content FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+            (session_id, covered_seq),
+        ).fetchall()
+
+    def history(self, session_id: str) -> List[BaseMessage]:
+        """
+        Messages to send with the next question: summary first, then recent turns.
+        """
+        with self._lock:
+            summary, covered_seq = self._summary(session_id)
+            rows = self._pending(session_id, covered_seq)
+        # Turns not yet folded into the summary stay visible until compaction runs
+        messages: List[BaseMessage] = []
+        if summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+        messages.extend(_to_message(role, content) for _, role, content in rows[-2 * self.max_raw_turns:])
+        return messages
+
+    def append(self, session_id: str, question: str, answer: str):
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT MAX(seq) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+            seq = -1 if row[0] is None else row[0]
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, seq, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, seq + 1, "human", question, now), (session_id, seq + 2, "ai", answer, now)],
+            )
+
+    def needs_compaction(self, session_id: str) -> bool:
+        with self._lock:
+            _, covered_seq = self._summary(session_id)
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ? AND seq > ?", (session_id, covered_seq)
+            ).fetchone()[0]
+        return count >= 2 * (self.window_turns + self.summarize_batch_turns)
+
+    def compact(self, session_id: str, llm) -> bool:
+        """
+        Fold turns older than the window into the rolling summary. Returns True if
+        the summary changed. Safe to call from a background task.
+        """
+        with self._lock:
+            if session_id in self._compacting:
+                return False
+            self._compacting.add(session_id)
+        try:
+            if not self.needs_compaction(session_id):
+                return False
+            with self._lock:
+                summary, covered_seq = self._summary(session_id)
+                rows = self._pending(session_id, covered_seq)
+            overflow = rows[:len(rows) - 2 * self.window_turns]
+            started = time.perf_counter()
+            chain = PROMPT_REGISTRY[PromptType.SUMMARIZE_CONVERSATION.value] | llm | StrOutputParser()
+            step = 2 * self.max_raw_turns
+            for start in range(0, len(overflow), step):
+                batch = overflow[start:start + step]
+                summary = chain.invoke({
+                    "summary": summary or "(none)",
+                    "messages": [_to_message(role, content) for _, role, content in batch],
+                    "max_words": self.summary_max_words,
+                }).strip()
+                # Saved per batch, so a failure later on keeps the turns already folded
+                with self._lock, self._conn:
+                    self._conn.execute(
+                        "INSERT INTO summaries (session_id, summary, covered_seq) VALUES (?, ?, ?) "
+                        "ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary, covered_seq = excluded.covered_seq",
+                        (session_id, summary, batch[-1][0]),
+                    )
+            log.info("Conversation summarized", session_id=session_id, folded_messages=len(overflow),
+                     llm_calls=-(-len(overflow) // step), summary_words=len(summary.split()),
+                     ms=round((time.perf_counter() - started) * 1000, 1))
+            return True
+        finally:
+            with self._lock:
+                self._compacting.discard(session_id)
+
+    def clear(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM summaries WHERE session_id = ?", (session_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_memory: Optional[ConversationMemory] = None
+_memory_lock = threading.Lock()
+
+
+def get_conversation_memory() -> ConversationMemory:
+    """Process-wide memory store, opened on first use."""
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = ConversationMemory.from_config()
+        return _memory
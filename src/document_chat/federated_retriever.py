@@ -0,0 +1,66 @@
+from __future__ import annotations
+import heapq
+import itertools
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import FAISS
+from pydantic import ConfigDict, Field
+
+from utils.executors import FEDERATED_EXECUTOR
+from logger import GLOBAL_LOGGER as log
+
+Hit = Tuple[float, str, str]  # (distance, session_id, docstore id)
+
+
+class FederatedRetriever(BaseRetriever):
+    """
+    Searches several session indexes with one query embedding and returns the
+    global top ``k`` by distance, merged with a heap.
+
+    All sessions are embedded with the same model, so L2 distances are comparable
+    across indexes. Each returned Document carries its ``session_id`` in metadata.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstores: Dict[str, FAISS]
+    k: int = 5
+    timings: Dict[str, float] = Field(default_factory=dict)
+
+    def _search(self, session_id: str, vector: np.ndarray) -> List[Hit]:
+        store = self.vectorstores[session_id]
+        distances, positions = store.index.search(vector, self.k)
+        return [
+            (float(d), session_id, store.index_to_docstore_id[p])
+            for d, p in zip(distances[0], positions[0]) if p != -1
+        ]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        started = time.perf_counter()
+        # Any store's embedding function will do: they share the process-wide embeddings
+        embedding = next(iter(self.vectorstores.values())).embedding_function.embed_query(query)
+        vector = np.asarray([embedding], dtype=np.float32)
+        embedded = time.perf_counter()
+
+        futures = [FEDERATED_EXECUTOR.submit(self._search, sid, vector) for sid in self.vectorstores]
+        # Each index returns its hits nearest first; merge lazily and stop at k
+        best = list(itertools.islice(heapq.merge(*(f.result() for f in futures)), self.k))
+        searched = time.perf_counter()
+
+        docs: List[Document] = []
+        for _, session_id, doc_id in best:
+            doc = self.vectorstores[session_id].docstore.search(doc_id)
+            if isinstance(doc, Document):
+                docs.append(Document(page_content=doc.page_content, metadata={**doc.metadata, "session_id": session_id}))
+        self.timings = {
+            "embed_ms": round((embedded - started) * 1000, 2),
+            "search_ms": round((searched - embedded) * 1000, 2),
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        log.info("Federated retrieval", sessions=len(self.vectorstores), returned=len(docs), **self.timings)
+        return docs
@@ -0,0 +1,90 @@
+from __future__ import annotations
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import FAISS
+from pydantic import ConfigDict, Field
+
+from utils.bm25_index import BM25Index
+from utils.executors import RETRIEVAL_EXECUTOR
+from logger import GLOBAL_LOGGER as log
+
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rrf_k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse ranked id lists: score(d) = sum over lists of 1 / (rrf_k + rank(d)).
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    BM25 + FAISS retriever fused with reciprocal rank fusion.
+
+    Each leg fetches ``fetch_k`` candidates; the fused top ``k`` are returned.
+    Per-leg latencies of the last query are kept in ``timings`` (milliseconds).
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: FAISS
+    bm25: BM25Index
+    k: int = 5
+    fetch_k: int = 20
+    rrf_k: int = 60
+    timings: Dict[str, float] = Field(default_factory=dict)
+
+    def _vector_leg(self, query: str, embedding: Optional[List[float]] = None) -> Tuple[List[str], Dict[str, float]]:
+        started = time.perf_counter()
+        if embedding is None:
+            embedding = self.vectorstore.embedding_function.embed_query(query)
+        embedded = time.perf_counter()
+        vector = np.asarray([embedding], dtype=np.float32)
+        _, positions = self.vectorstore.index.search(vector, self.fetch_k)
+        ids = [self.vectorstore.index_to_docstore_id[p] for p in positions[0] if p != -1]
+        done = time.perf_counter()
+        return ids, {"embed_ms": (embedded - started) * 1000, "vector_ms": (done - embedded) * 1000}
+
+    def _bm25_leg(self, query: str) -> Tuple[List[str], Dict[str, float]]:
+        started = time.perf_counter()
+        ids = [doc_id for doc_id, _ in self.bm25.search(query, self.fetch_k)]
+        return ids, {"bm25_ms": (time.perf_counter() - started) * 1000}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.search(query)
+
+    def search(self, query: str, embedding: Optional[List[float]] = None) -> List[Document]:
+        """Fused results for ``query``; ``embedding`` skips re-embedding an already embedded query."""
+        started = time.perf_counter()
+        vector_future = RETRIEVAL_EXECUTOR.submit(self._vector_leg, query, embedding)
+        bm25_ids, bm25_timing = self._bm25_leg(query)
+        vector_ids, vector_timing = vector_future.result()
+
+        fuse_started = time.perf_counter()
+        docs: List[Document] = []
+        for doc_id, _ in reciprocal_rank_fusion([vector_ids, bm25_ids], self.rrf_k):
+            doc = self.vectorstore.docstore.search(doc_id)
+            # Keyword postings may briefly reference ids from an ingest still being saved
+            if isinstance(doc, Document):
+                docs.append(doc)
+            if len(docs) >= self.k:
+                break
+        finished = time.perf_counter()
+
+        self.timings = {
+            **{key: round(ms, 2) for key, ms in {**vector_timing, **bm25_timing}.items()},
+            "fusion_ms": round((finished - fuse_started) * 1000, 2),
+            "total_ms": round((finished - started) * 1000, 2),
+        }
+        log.info("Hybrid retrieval", vector_hits=len(vector_ids), bm25_hits=len(bm25_ids),
+                 returned=len(docs), **self.timings)
+        return docs
@@ -0,0 +1,66 @@
+from __future__ import annotations
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage
+
+REWRITE_CACHE_SIZE = 2048
+
+RewriteKey = Tuple[Optional[str], str, str]
+
+
+def history_digest(chat_history: Sequence[BaseMessage]) -> str:
+    """Stable digest of a conversation, so equal histories share cached rewrites."""
+    h = hashlib.sha256()
+    for message in chat_history:
+        h.update(f"{message.type}\x1f{message.content}\x1e".encode("utf-8"))
+    return h.hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+
+def same_question(original: str, rewritten: str) -> bool:
+    """True when the rewrite only changed case, whitespace or trailing punctuation."""
+    return normalize_question(original) == normalize_question(rewritten)
+
+
+class RewriteCache:
+    """
+    Thread-safe LRU of standalone questions keyed by (session, history digest, question).
+    """
+
+    def __init__(self, max_entries: int = REWRITE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[RewriteKey, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(session_id: Optional[str], chat_history: List[BaseMessage], question: str) -> RewriteKey:
+        return session_id, history_digest(chat_history), question.strip()
+
+    def get(self, key: RewriteKey) -> Optional[str]:
+        with self._lock:
+            rewritten = self._entries.get(key)
+            if rewritten is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return rewritten
+
+    def put(self, key: RewriteKey, rewritten: str):
+        with self._lock:
+            self._entries[key] = rewritten
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+# Shared by every ConversationalRAG in this process
+REWRITE_CACHE = RewriteCache()
@@ -1,19 +1,34 @@
 import sys
 import os
+import time
+import asyncio
 from operator import itemgetter
-from typing import Optional, List, Dict, Any
+from typing import AsyncIterator, Optional, List, Dict, Any, Tuple
 
+from langchain_core.documents import Document
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.vectorstores import FAISS
+from langchain_core.runnables import RunnableLambda
+from langchain_core.vectorstores import VectorStoreRetriever
 
-from utils.model_loader import ModelLoader
+from utils.model_loader import MODEL_REGISTRY
+from utils.index_cache import VECTORSTORE_CACHE
+from utils.bm25_index import shared_bm25_index
+from src.document_chat.hybrid_retriever import HybridRetriever, RETRIEVAL_MODES
+from utils.executors import FEDERATED_EXECUTOR, SPECULATION_EXECUTOR, run_io
+from src.document_chat.federated_retriever import FederatedRetriever
+from src.document_chat.context_assembler import ContextAssembler
+from src.document_chat.question_rewrite import REWRITE_CACHE, RewriteKey, same_question
+from src.document_chat.answer_cache import ANSWER_CACHE
 from exception.custom_exception import EnterpriseDocumentChatException
 from logger import GLOBAL_LOGGER as log
 from prompt.prompt_library import PROMPT_REGISTRY
 from model.models import PromptType
 
+# Returned by invoke() when the chain produced nothing; not worth remembering or caching
+NO_ANSWER = "no answer generated"
+
 
 class ConversationalRAG:
     """
@@ -23,6 +38,8 @@ class ConversationalRAG:
         rag = ConversationalRAG(session_id="abc")
         rag.load_retriever_from_faiss(index_path="faiss_index/abc", k=5, index_name="index")
         answer = rag.invoke("What is ...?", chat_history=[])
+        async for event in rag.astream("What is ...?"):  # streaming variant
+            ...
     """
     
     def __init__(self, session_id: Optional[str], retriever=None):
@@ -33,8 +50,14 @@ class ConversationalRAG:
             self.llm = self._load_llm()
             self.contextualize_prompt: ChatPromptTemplate = PROMPT_REGISTRY[PromptType.CONTEXTUALIZE_QUESTION.value]
             self.qa_prompt: ChatPromptTemplate = PROMPT_REGISTRY[PromptType.CONTEXT_QA.value]
+            self.context_assembler = ContextAssembler.from_config()
             
             self.retriever = retriever
+            self.retrieval_mode = "vector"
+            self.last_rewrite: Dict[str, Any] = {}
+            self.answer_scope = None  # set once the retriever comes from a session index
+            self.last_answer_cached = False
+            self._query_vector: Optional[Tuple[str, List[float]]] = None  # reused by retrieval
             self.chain = None
             if self.retriever is not None:
                 self._build_lcel_chain()
@@ -53,26 +76,47 @@ class ConversationalRAG:
         index_name: str = "index",
         search_type: str = "similarity",
         search_kwargs: Optional[Dict[str, Any]] = None,
+        mmap: Optional[bool] = None,
+        retrieval_mode: str = "vector",
     ):
         """ 
-        Load FAISS vectorstore from disk and build retriever + LCEL chain.
+        Load FAISS vectorstore (through the process-wide cache) and build retriever + LCEL chain.
+        mmap=None uses faiss_db.mmap from config; mapped stores are shared read-only.
+        retrieval_mode="hybrid" fuses BM25 keyword hits with vector hits (RRF).
         """
         try:
             if not os.path.isdir(index_path):
                 raise FileNotFoundError(f"FAISS index path not found: {index_path}")
+            if retrieval_mode not in RETRIEVAL_MODES:
+                raise ValueError(f"Unsupported retrieval_mode {retrieval_mode!r}; expected one of {RETRIEVAL_MODES}")
             
-            embeddings = ModelLoader().load_embedding_model()
-            vectorstore = FAISS.load_local(
-                index_path,
-                embeddings,
-                index_name=index_name,
-                allow_dangerous_deserialization=True,
-            )
+            embeddings = MODEL_REGISTRY.embeddings()
+            vectorstore = VECTORSTORE_CACHE.get(index_path, embeddings, index_name=index_name, mmap=mmap)
             
             if search_kwargs is None:
                 search_kwargs = {"k": k}
-                
-            self.retriever = vectorstore.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
+            
+            bm25_path = os.path.join(index_path, "bm25.sqlite3")
+            if retrieval_mode == "hybrid" and not os.path.exists(bm25_path):
+                log.warning("No BM25 index for this session, using vector retrieval", index_path=index_path)
+                retrieval_mode = "vector"
+            
+            if retrieval_mode == "hybrid":
+                retriever_cfg = MODEL_REGISTRY.loader().config.get("retriever") or {}
+                self.retriever = HybridRetriever(
+                    vectorstore=vectorstore,
+                    bm25=shared_bm25_index(bm25_path),
+                    k=search_kwargs.get("k", k),
+                    fetch_k=max(search_kwargs.get("k", k), int(retriever_cfg.get("hybrid_fetch_k", 20))),
+                    rrf_k=int(retriever_cfg.get("rrf_k", 60)),
+                )
+            else:
+                self.retriever = vectorstore.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
+            self.retrieval_mode = retrieval_mode
+            self.answer_scope = ANSWER_CACHE.scope(
+                index_path, index_name, (retrieval_mode, search_type, repr(sorted(search_kwargs.items())))
+            )
+            self._embed_query = embeddings.embed_query
             
             self._build_lcel_chain()
             
@@ -81,6 +125,7 @@ class ConversationalRAG:
                 index_path=index_path, 
                 index_name=index_name, 
                 k=k,
+                retrieval_mode=retrieval_mode,
                 session_id=self.session_id
             )
             return self.retriever
@@ -88,6 +133,40 @@ class ConversationalRAG:
         except Exception as e:
             log.error("Failed to load FAISS retriever", error=str(e))
             raise EnterpriseDocumentChatException("Error loading FAISS retriever", sys)
+    
+    def load_retriever_from_sessions(
+        self,
+        index_paths: Dict[str, str],
+        k: int = 5,
+        index_name: str = "index",
+        mmap: Optional[bool] = None,
+    ):
+        """
+        Federated retrieval over several session indexes ({session_id: index_path}).
+        Stores come from the process-wide cache, so repeated queries reuse them.
+        """
+        try:
+            missing = [path for path in index_paths.values() if not os.path.isdir(path)]
+            if missing:
+                raise FileNotFoundError(f"FAISS index path not found: {missing}")
+            
+            embeddings = MODEL_REGISTRY.embeddings()
+            loads = {
+                session_id: FEDERATED_EXECUTOR.submit(VECTORSTORE_CACHE.get, path, embeddings, index_name, mmap)
+                for session_id, path in index_paths.items()
+            }
+            self.retriever = FederatedRetriever(vectorstores={sid: f.result() for sid, f in loads.items()}, k=k)
+            self.retrieval_mode = "federated"
+            # Answers span several indexes; the answer cache tracks one index per scope
+            self.answer_scope = None
+            
+            self._build_lcel_chain()
+            log.info("Federated retriever loaded", sessions=list(index_paths), k=k, session_id=self.session_id)
+            return self.retriever
+        
+        except Exception as e:
+            log.error("Failed to load federated retriever", error=str(e))
+            raise EnterpriseDocumentChatException("Error loading federated retriever", sys)
         
     def invoke(self, user_input:str, chat_history: Optional[List[BaseMessage]] = None)-> str:
         try:
@@ -96,16 +175,27 @@ class ConversationalRAG:
                     "RAG chain not initialized. Call load_retriever_from_faiss() before invoke().", sys
                 )
             chat_history = chat_history or []
+            # Follow-up answers depend on the conversation, so only standalone questions are cached
+            cacheable = self.answer_scope is not None and not chat_history
+            if cacheable:
+                cached = self._lookup_answer(user_input)
+                if cached is not None:
+                    return cached
+            
+            started = time.perf_counter()
             payload = {"input": user_input, "chat_history": chat_history}
             response = self.chain.invoke(payload)
             if not response:
                 log.warning("No answer generated", user_input=user_input, session_id=self.session_id)
-                return "no answer generated"
+                return NO_ANSWER
+            if cacheable:
+                self._store_answer(user_input, response, time.perf_counter() - started)
             
             log.info(
                 "Chain invoked successfully", 
                 user_input=user_input,
                 session_id=self.session_id,
+                rewrite=self.last_rewrite.get("rewrite"),
                 answer_preview=str(response)[:150],
             )
             return response
@@ -114,9 +204,162 @@ class ConversationalRAG:
             log.error("Failed to invoke ConversationalRAG", error=str(e))
             raise EnterpriseDocumentChatException("Invocation error in ConversationalRAG", sys)
     
+    async def astream(self, user_input: str, chat_history: Optional[List[BaseMessage]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream the answer as events: rewrite and retrieval timings first, then one
+        ``token`` event per chunk emitted by the model, then ``done``.
+        """
+        try:
+            if self.chain is None:
+                raise EnterpriseDocumentChatException(
+                    "RAG chain not initialized. Call load_retriever_from_faiss() before astream().", sys
+                )
+            chat_history = chat_history or []
+            payload = {"input": user_input, "chat_history": chat_history}
+            started = time.perf_counter()
+            cacheable = self.answer_scope is not None and not chat_history
+            if cacheable:
+                cached = await run_io(self._lookup_answer, user_input)
+                if cached is not None:
+                    total_ms = round((time.perf_counter() - started) * 1000, 1)
+                    yield {"event": "token", "data": cached}
+                    yield {"event": "done", "first_token_ms": total_ms, "total_ms": total_ms, "cached": True}
+                    return
+            
+            docs = await self._aretrieve(payload)
+            context = self._format_docs(docs)
+            retrieved_at = time.perf_counter()
+            rewrite_ms = self.last_rewrite["rewrite_ms"]
+            yield {"event": "timing", "stage": "rewrite", "ms": rewrite_ms, "rewrite": self.last_rewrite["rewrite"]}
+            yield {"event": "timing", "stage": "retrieval",
+                   "ms": round((retrieved_at - started) * 1000 - rewrite_ms, 1),
+                   "documents": len(docs), "mode": self.retrieval_mode, **self.retrieval_timings(),
+                   "context_tokens": self.context_assembler.last_stats.get("tokens")}
+            
+            first_token_ms = None
+            answer_parts: List[str] = []
+            async for token in self.answer_chain.astream({**payload, "context": context}):
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - started) * 1000, 1)
+                answer_parts.append(token)
+                yield {"event": "token", "data": token}
+            
+            total_ms = round((time.perf_counter() - started) * 1000, 1)
+            answer = "".join(answer_parts)
+            if cacheable and answer:
+                await run_io(self._store_answer, user_input, answer, total_ms / 1000)
+            yield {"event": "done", "first_token_ms": first_token_ms, "total_ms": total_ms, "cached": False}
+            log.info(
+                "Chain streamed successfully",
+                user_input=user_input,
+                session_id=self.session_id,
+                first_token_ms=first_token_ms,
+                total_ms=total_ms,
+                answer_preview=answer[:150],
+            )
+        
+        except Exception as e:
+            log.error("Failed to stream ConversationalRAG", error=str(e))
+            raise EnterpriseDocumentChatException("Streaming error in ConversationalRAG", sys)
+    
+    def _lookup_answer(self, question: str) -> Optional[str]:
+        """
+        Answer-cache lookup for a standalone question. The question is embedded once;
+        on a miss retrieval reuses that vector instead of embedding it again.
+        """
+        vector = self._embed_query(question)
+        self._query_vector = (question, vector)
+        cached, _ = ANSWER_CACHE.lookup(self.answer_scope, question, lambda _: vector)
+        self.last_answer_cached = cached is not None
+        return cached
+    
+    def _store_answer(self, question: str, answer: str, cost_s: float):
+        vector = self._query_vector[1] if self._query_vector and self._query_vector[0] == question else None
+        embed = (lambda _: vector) if vector is not None else self._embed_query
+        ANSWER_CACHE.store(self.answer_scope, question, answer, cost_s, embed)
+    
+    def _search(self, question: str) -> List[Document]:
+        """Retriever call, searching by the already computed query vector when there is one."""
+        vector = self._query_vector[1] if self._query_vector and self._query_vector[0] == question else None
+        if vector is not None:
+            if isinstance(self.retriever, HybridRetriever):
+                return self.retriever.search(question, embedding=vector)
+            if isinstance(self.retriever, VectorStoreRetriever) and self.retriever.search_type == "similarity":
+                return self.retriever.vectorstore.similarity_search_by_vector(vector, **self.retriever.search_kwargs)
+        return self.retriever.invoke(question)
+    
+    def _cached_rewrite(self, payload: Dict[str, Any]) -> Tuple[Optional[RewriteKey], Optional[str]]:
+        """
+        (cache key, standalone question) for a turn. The question is known without an
+        LLM call when there is no history (it is already standalone) or on a cache hit.
+        """
+        if not payload["chat_history"]:
+            self.last_rewrite = {"rewrite": "skipped", "rewrite_ms": 0.0}
+            return None, payload["input"]
+        key = REWRITE_CACHE.key(self.session_id, payload["chat_history"], payload["input"])
+        question = REWRITE_CACHE.get(key)
+        if question is not None:
+            self.last_rewrite = {"rewrite": "cached", "rewrite_ms": 0.0}
+        return key, question
+    
+    def _record_rewrite(self, key: RewriteKey, question: str, user_input: str, started: float) -> bool:
+        REWRITE_CACHE.put(key, question)
+        unchanged = same_question(user_input, question)
+        self.last_rewrite = {
+            "rewrite": "unchanged" if unchanged else "rewritten",
+            "rewrite_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
+        return unchanged
+    
+    def _retrieve(self, payload: Dict[str, Any]) -> List[Document]:
+        """
+        Retrieval step of the chain. Follow-up questions are rewritten by the LLM while
+        the raw question is retrieved speculatively; those results are kept when the
+        rewrite comes back unchanged.
+        """
+        key, question = self._cached_rewrite(payload)
+        if question is not None:
+            return self._search(question)
+        
+        started = time.perf_counter()
+        speculative = SPECULATION_EXECUTOR.submit(self.retriever.invoke, payload["input"])
+        try:
+            question = self.question_rewriter.invoke(payload)
+        except BaseException:
+            speculative.cancel()
+            raise
+        if self._record_rewrite(key, question, payload["input"], started):
+            return speculative.result()
+        speculative.cancel()
+        return self.retriever.invoke(question)
+    
+    async def _aretrieve(self, payload: Dict[str, Any]) -> List[Document]:
+        """Async counterpart of _retrieve."""
+        key, question = self._cached_rewrite(payload)
+        if question is not None:
+            if self._query_vector is not None:
+                return await run_io(self._search, question)
+            return await self.retriever.ainvoke(question)
+        
+        started = time.perf_counter()
+        speculative = asyncio.ensure_future(self.retriever.ainvoke(payload["input"]))
+        try:
+            question = await self.question_rewriter.ainvoke(payload)
+        except BaseException:
+            speculative.cancel()
+            raise
+        if self._record_rewrite(key, question, payload["input"], started):
+            return await speculative
+        speculative.cancel()
+        return await self.retriever.ainvoke(question)
+    
+    def retrieval_timings(self) -> Dict[str, float]:
+        """Per-leg latency breakdown of the last retrieval (hybrid mode only)."""
+        return dict(getattr(self.retriever, "timings", None) or {})
+    
     def _load_llm(self):
         try:
-            llm = ModelLoader().load_llm()
+            llm = MODEL_REGISTRY.llm()
             if not llm:
                 raise ValueError("LLM could not be loaded")
             log.info("LLM loaded successfully", session_id=self.session_id)
@@ -125,9 +368,9 @@ class ConversationalRAG:
             log.error("Failed to load LLM", error=str(e))
             raise EnterpriseDocumentChatException("LLM loading error in ConversationalRAG", sys)
         
-    @staticmethod
-    def _format_docs(docs):
-        return "\n\n".join(getattr(d, "page_content", str(d)) for d in docs)
+    def _format_docs(self, docs):
+        # Stitch overlapping chunks, drop near-duplicates and pack to the token budget
+        return self.context_assembler.assemble(docs)
     
     def _build_lcel_chain(self):
         try:
@@ -135,25 +378,24 @@ class ConversationalRAG:
                 raise EnterpriseDocumentChatException("No retriever set before building chain", sys)
             
             # 1) Rewriting the question based on chat history
-            question_rewriter = (
+            self.question_rewriter = (
                 {"input": itemgetter("input"), "chat_history": itemgetter("chat_history")}
                 | self.contextualize_prompt
                 | self.llm
                 | StrOutputParser()
             )
-            # 2) Retrieve relevant documents based on rewritten question
-            retrieve_docs = question_rewriter | self.retriever | self._format_docs
+            # 2) Retrieve relevant documents; the rewrite is skipped, cached or speculative
+            retrieve_docs = RunnableLambda(self._retrieve, afunc=self._aretrieve) | self._format_docs
             
             # 3) Feed context + original input + chat history into answer prompt
+            self.answer_chain = self.qa_prompt | self.llm | StrOutputParser()
             self.chain = (
                 {
                     "context": retrieve_docs,
                     "input": itemgetter("input"),
                     "chat_history": itemgetter("chat_history"),
                 }
-                | self.qa_prompt
-                | self.llm
-                | StrOutputParser()
+                | self.answer_chain
             )
             
             log.info("LCEL chain built successfully", session_id=self.session_id)
@@ -1,35 +1,116 @@
 import sys
-from dotenv import load_dotenv
+import time
+from typing import Any, Dict, List
 import pandas as pd
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import EnterpriseDocumentChatException
 from model.models import SummaryResponse, PromptType
 from prompt.prompt_library import PROMPT_REGISTRY
-from utils.model_loader import ModelLoader
-from langchain_core.output_parsers import JsonOutputParser
-from langchain.output_parsers import OutputFixingParser
+from utils.model_loader import MODEL_REGISTRY
+from utils.config_loader import load_settings
+from utils.executors import COMPARE_EXECUTOR
+from utils.structured_output import StructuredOutputChain
+from src.document_compare.page_diff import NO_CHANGE, PageAlignment, align_pages, format_changed_pages, window_pages
+
+DEFAULT_COMPARISON_SETTINGS: Dict[str, Any] = {
+    "window_max_chars": 12000,
+    "window_max_pages": 8,
+    "degraded_diff_chars": 2000,
+}
+
+
+def comparison_settings() -> Dict[str, Any]:
+    """Windowing settings from the comparison section of config.yaml."""
+    return load_settings("comparison", DEFAULT_COMPARISON_SETTINGS)
 
 
 class DocumentComparatorLLM:
     def __init__(self):
-        load_dotenv()
-        self.loader = ModelLoader()
-        self.llm = self.loader.load_llm()
-        self.parser = JsonOutputParser(pydantic_object=SummaryResponse)
-        self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=self.llm)
+        self.loader = MODEL_REGISTRY.loader()
+        self.llm = MODEL_REGISTRY.llm()
         self.prompt = PROMPT_REGISTRY[PromptType.DOCUMENT_COMPARISON.value]
-        self.chain = self.prompt | self.llm | self.fixing_parser
+        self.chain = StructuredOutputChain(self.prompt, self.llm, SummaryResponse, component="comparison",
+                                           instructions_key="format_instruction")
+        self.diff_chain = StructuredOutputChain(PROMPT_REGISTRY[PromptType.DOCUMENT_COMPARISON_DIFF.value],
+                                                self.llm, SummaryResponse, component="comparison_window",
+                                                instructions_key="format_instruction", settings=self.chain.settings)
+        self.settings = comparison_settings()
+        self.last_stats: Dict[str, Any] = {}
         log.info("DocumentComparatorLLM initialized successfully")
     
+    def _compare_window(self, window: List[PageAlignment]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        label = f"{window[0].label}..{window[-1].label}" if len(window) > 1 else window[0].label
+        try:
+            response, path = self.diff_chain.invoke_with_path({"changed_pages": format_changed_pages(window)})
+            rows, error = response or [], None
+        except Exception as e:
+            # One failed window degrades its own rows instead of the whole comparison
+            log.error("Comparison window failed", pages=label, error=str(e))
+            rows, error, path = [], str(e), "failed"
+        return {"pages": label, "page_count": len(window), "rows": rows, "error": error, "output_path": path,
+                "ms": round((time.perf_counter() - started) * 1000, 1)}
+    
+    def _raw_diff(self, a: PageAlignment) -> str:
+        """Placeholder for a page without a model summary: its diff hunks, truncated."""
+        limit = int(self.settings["degraded_diff_chars"])
+        diff = a.diff if len(a.diff) <= limit else a.diff[:limit] + "\n[diff truncated]"
+        return f"Page {a.status}; diff:\n{diff}"
+    
+    def compare_pages(self, ref_pages: List[str], act_pages: List[str]) -> pd.DataFrame:
+        """
+        Page-aligned comparison: pages whose normalized text is identical are
+        reported as "No Change" locally; only changed pages, as diff hunks, go to the LLM.
+        Changed pages are split into windows compared by concurrent LLM calls, and the
+        rows are merged back in page order; each row carries a ``degraded`` flag set
+        when its page has no model summary, in which case the row holds the page's
+        truncated diff.
+        """
+        try:
+            alignments = align_pages(ref_pages, act_pages)
+            windows = window_pages(alignments, int(self.settings["window_max_chars"]),
+                                   int(self.settings["window_max_pages"]))
+            changed = [a for window in windows for a in window]
+            self.last_stats = {
+                "pages": len(alignments),
+                "unchanged_pages": len(alignments) - len(changed),
+                "changed_pages": len(changed),
+                "prompt_chars": sum(len(format_changed_pages(w)) for w in windows),
+                "full_text_chars": sum(map(len, ref_pages)) + sum(map(len, act_pages)),
+            }
+            log.info("Local page diff complete", windows=len(windows), **self.last_stats)
+            
+            started = time.perf_counter()
+            results = list(COMPARE_EXECUTOR.map(self._compare_window, windows))
+            summaries: Dict[str, str] = {}
+            for result in results:
+                summaries.update({str(row.get("page", "")).strip(): row.get("changes", "")
+                                  for row in result.pop("rows") if isinstance(row, dict)})
+            self.last_stats["windows"] = results
+            self.last_stats["llm_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            
+            # Changed pages without a model summary (failed window or page left out of
+            # the reply) carry their own truncated diff instead and are flagged as degraded
+            failed = {a.label for window, result in zip(windows, results) if result["error"] for a in window}
+            rows = []
+            for a in alignments:
+                summary = NO_CHANGE if a.status == "unchanged" else summaries.get(a.label)
+                degraded = not summary or a.label in failed
+                rows.append({"page": a.label, "changes": summary or self._raw_diff(a), "degraded": degraded})
+            self.last_stats["degraded_pages"] = sum(row["degraded"] for row in rows)
+            log.info("Document comparison successful", rows=len(rows))
+            return self._format_response(rows)
+        
+        except Exception as e:
+            log.error("Document comparison failed", error=str(e))
+            raise EnterpriseDocumentChatException("Error comparing documents", sys)
+    
     def compare_documents(self, combined_docs: str) -> pd.DataFrame:
         """
         compares two documents and returns a structured comparison
         """
         try:
-            inputs = {
-                "format_instruction": self.parser.get_format_instructions(),
-                "combined_docs": combined_docs
-            }
+            inputs = {"combined_docs": combined_docs}
             log.info("Starting document comparison", inputs=inputs)
             response = self.chain.invoke(inputs)    
             log.info("Document comparison successful", response=response)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import difflib
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass, replace
+from typing import List, Optional
+
+NO_CHANGE = "No Change"
+
+_SPACE_RE = re.compile(r"[ \t ]+")
+
+
+def normalize_lines(text: str) -> List[str]:
+    """
+    Page text as comparable lines: Unicode NFKC, runs of spaces collapsed, blank
+    lines dropped, so re-rendered but otherwise identical pages compare equal.
+    """
+    text = unicodedata.normalize("NFKC", text)
+    lines = (_SPACE_RE.sub(" ", line).strip() for line in text.splitlines())
+    return [line for line in lines if line]
+
+
+def _fingerprint(lines: List[str]) -> str:
+    return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class PageAlignment:
+    """One aligned page pair; page numbers are 1-based, None when the page has no counterpart."""
+    ref_page: Optional[int]
+    act_page: Optional[int]
+    status: str  # "unchanged" | "changed" | "added" | "removed"
+    diff: str = ""
+
+    @property
+    def label(self) -> str:
+        """Page identifier used in ChangeFormat rows (the actual document's page number)."""
+        if self.act_page is None:
+            return f"{self.ref_page} (removed)"
+        return str(self.act_page)
+
+
+def diff_hunks(ref_lines: List[str], act_lines: List[str], context: int = 1) -> str:
+    """Unified-diff hunks between two normalized pages, without the file headers."""
+    diff = difflib.unified_diff(ref_lines, act_lines, lineterm="", n=context)
+    return "\n".join(line for line in diff if not line.startswith(("---", "+++")))
+
+
+def align_pages(ref_pages: List[str], act_pages: List[str], context: int = 1) -> List[PageAlignment]:
+    """
+    Align reference and actual pages and classify each pair.
+
+    Pages are matched on their normalized-text fingerprints, so an inserted or
+    deleted page does not shift every later page into "changed". Pages left over
+    inside a replaced block are paired by position and diffed.
+    """
+    ref_lines = [normalize_lines(p) for p in ref_pages]
+    act_lines = [normalize_lines(p) for p in act_pages]
+    matcher = difflib.SequenceMatcher(
+        a=[_fingerprint(p) for p in ref_lines], b=[_fingerprint(p) for p in act_lines], autojunk=False
+    )
+    out: List[PageAlignment] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            out.extend(PageAlignment(i + 1, j + 1, "unchanged") for i, j in zip(range(i1, i2), range(j1, j2)))
+            continue
+        paired = min(i2 - i1, j2 - j1)
+        for offset in range(paired):
+            i, j = i1 + offset, j1 + offset
+            out.append(PageAlignment(i + 1, j + 1, "changed", diff_hunks(ref_lines[i], act_lines[j], context)))
+        for i in range(i1 + paired, i2):
+            out.append(PageAlignment(i + 1, None, "removed", diff_hunks(ref_lines[i], [], context)))
+        for j in range(j1 + paired, j2):
+            out.append(PageAlignment(None, j + 1, "added", diff_hunks([], act_lines[j], context)))
+    return out
+
+
+def format_changed_pages(alignments: List[PageAlignment]) -> str:
+    """Prompt input listing only the changed pages and their diff hunks."""
+    parts = []
+    for a in alignments:
+        if a.status == "unchanged":
+            continue
+        header = f"=== Page {a.label} ({a.status}; reference page {a.ref_page or '-'}, actual page {a.act_page or '-'}) ==="
+        parts.append(f"{header}\n{a.diff}")
+    return "\n\n".join(parts)
+
+
+def window_pages(alignments: List[PageAlignment], max_chars: int, max_pages: int) -> List[List[PageAlignment]]:
+    """
+    Group changed pages, in document order, into windows of at most ``max_pages``
+    pages and about ``max_chars`` of diff. A single page whose diff alone exceeds
+    the budget gets its own window with a truncated copy of its diff; the input
+    alignments are left untouched.
+    """
+    windows: List[List[PageAlignment]] = []
+    current: List[PageAlignment] = []
+    size = 0
+    for a in alignments:
+        if a.status == "unchanged":
+            continue
+        if len(a.diff) > max_chars:
+            a = replace(a, diff=a.diff[:max_chars] + "\n[diff truncated]")
+        if current and (len(current) >= max_pages or size + len(a.diff) > max_chars):
+            windows.append(current)
+            current, size = [], 0
+        current.append(a)
+        size += len(a.diff)
+    if current:
+        windows.append(current)
+    return windows
@@ -1,94 +1,217 @@
 from __future__ import annotations
 import os
 import sys
-import json
 import hashlib
 import shutil
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Iterable, List, Optional, Dict, Any
+from typing import Callable, Iterable, Iterator, List, Optional, Dict, Any
 
 
-import fitz
+import numpy as np
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 
 
-from utils.model_loader import ModelLoader
+from utils.model_loader import ModelLoader, MODEL_REGISTRY
+from utils.index_cache import VECTORSTORE_CACHE
+from utils.fingerprint_store import FingerprintStore
+from utils.bm25_index import BM25Index
+from utils.pdf_text_cache import PDF_TEXT_CACHE
+from utils.faiss_io import load_vectorstore, save_vectorstore, build_index, index_settings, is_flat
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import EnterpriseDocumentChatException
 
-from utils.file_io import generate_session_id, save_uploaded_files
+from utils.file_io import generate_session_id, persist_upload, persist_uploads
 from utils.document_ops import load_documents
 
 SUPPORTED_EXTENSIONS = [".pdf", ".docx", ".txt"]
 
+# progress(stage, done=None, total=None) -- used by background ingestion jobs
+ProgressCallback = Callable[..., None]
+
+def _report(progress: Optional[ProgressCallback], stage: str, done: Optional[int] = None, total: Optional[int] = None):
+    if progress is not None:
+        progress(stage, done=done, total=total)
+
+# index dir -> [lock, holders]; an entry lives only while some writer holds or waits on it
+_INDEX_LOCKS: Dict[str, List[Any]] = {}
+_INDEX_LOCKS_GUARD = threading.Lock()
+
+@contextmanager
+def index_write_lock(index_dir: Path) -> Iterator[None]:
+    """
+    Process-wide lock for one index directory. Held for a whole ingest (load, add,
+    save, fingerprints) so sync /chat/index calls and background jobs on the same
+    session cannot overwrite each other's chunks.
+    """
+    key = str(Path(index_dir).resolve())
+    with _INDEX_LOCKS_GUARD:
+        entry = _INDEX_LOCKS.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _INDEX_LOCKS_GUARD:
+            entry[1] -= 1
+            if not entry[1]:
+                del _INDEX_LOCKS[key]
+
 class FaissManager:
+    # Chunks embedded per step, so progress can be reported during long ingests
+    EMBED_SLICE = 512
+    
     def __init__(self, index_dir: Path, model_loader: Optional[ModelLoader] = None):
         self.index_dir = Path(index_dir)
         self.index_dir.mkdir(parents=True, exist_ok=True)
         
-        self.meta_path = self.index_dir / "ingested_meta.json"
-        self._meta: Dict[str, any] = {"rows": {}}
-        
-        if self.meta_path.exists():
-            try:
-                self._meta = json.loads(self.meta_path.read_text(encodings="utf-8")) or {"rows": {}}
-            except Exception:
-                self._meta = {"rows": {}}
+        # Indexed fingerprint store; replaces the whole-file ingested_meta.json rewrite
+        self.meta_path = self.index_dir / "ingested_meta.sqlite3"
+        self.fingerprints = FingerprintStore(self.meta_path)
+        # Sparse keyword index for hybrid retrieval, keyed by FAISS docstore id
+        self.bm25 = BM25Index(self.index_dir / "bm25.sqlite3")
                 
-        self.model_loader = model_loader or ModelLoader()
-        self.emb = self.model_loader.load_embedding_model()
+        # Reuse the process-wide embedding client unless a dedicated loader is supplied
+        self.model_loader = model_loader
+        self.emb = model_loader.load_embedding_model() if model_loader else MODEL_REGISTRY.embeddings()
         self.vs: Optional[FAISS] = None
+        self._mapped = False
+        self.index_settings = index_settings()
         
     
     def _exists(self) -> bool:
         return (self.index_dir / "index.faiss").exists() and (self.index_dir / "index.pkl").exists()
     
     @staticmethod
-    def _fingerprint(text: str, md: Dict[str, Any]) -> str:
-        src = md.get("source") or md.get("file_path")
-        rid = md.get("row_id")
-        if src is not None:
-            return f"{src}::{'' if rid is None else rid}"
-        
+    def _fingerprint(text: str) -> str:
+        # Content-based, so re-uploads of the same text (under new file names) are skipped
         return hashlib.sha256(text.encode("utf-8")).hexdigest()
     
-    def _save_metadata(self):
-        self.meta_path.write_text(json.dumps(self._meta, ensure_ascii=False, indent=2), encoding="utf-8")
-    
     def add_documents(self, docs: List[Document]):
         if self.vs is None:
             raise RuntimeError("Call load_or_create() before adding documents.")
+        return self.ingest(docs)["added"]
+    
+    def ingest(self, docs: List[Document], progress: Optional[ProgressCallback] = None) -> Dict[str, int]:
+        """
+        Embed only chunks not already in the index (each exactly once) and create or
+        extend the index in a single step. Returns added/skipped counts.
+        """
+        with index_write_lock(self.index_dir):
+            # Another writer may have saved since this manager loaded; start from disk
+            self.vs = None
+            return self._ingest(docs, progress)
+    
+    def _ingest(self, docs: List[Document], progress: Optional[ProgressCallback]) -> Dict[str, int]:
+        if not self._exists():
+            # Fingerprints and keyword postings without an index on disk are stale
+            self.fingerprints.clear()
+            self.bm25.clear()
+        elif not len(self.fingerprints):
+            self._backfill_fingerprints()
         
+        keys = [self._fingerprint(d.page_content) for d in docs]
+        known = self.fingerprints.contains_many(keys)
         new_docs: List[Document] = []
-        
-        for d in docs:
-            key = self._fingerprint(d.page_content, d.metadata or {})
-            if key in self._meta["rows"]:
+        new_keys: List[str] = []
+        batch_keys = set()
+        for d, key in zip(docs, keys):
+            if key in known or key in batch_keys:
                 continue
-            self._meta["rows"][key] = True
+            batch_keys.add(key)
+            new_keys.append(key)
             new_docs.append(d)
-            
-        if new_docs:
-            self.vs.add_documents(new_docs)
-            self.vs.save_local(str(self.index_dir))
-            self._save_metadata()
-        return len(new_docs)
+        
+        stats = {"added": len(new_docs), "skipped": len(docs) - len(new_docs)}
+        if not new_docs:
+            if self.vs is None:
+                self.load_or_create()
+            log.info("No new chunks to ingest", index_dir=str(self.index_dir), **stats)
+            return stats
+        
+        texts = [d.page_content for d in new_docs]
+        metadatas = [d.metadata or {} for d in new_docs]
+        vectors: List[List[float]] = []
+        _report(progress, "embedding", done=0, total=len(texts))
+        for i in range(0, len(texts), self.EMBED_SLICE):
+            vectors.extend(self.emb.embed_documents(texts[i:i + self.EMBED_SLICE]))
+            _report(progress, "embedding", done=len(vectors), total=len(texts))
+        
+        _report(progress, "indexing")
+        text_embeddings = list(zip(texts, vectors))
+        
+        if self._mapped:
+            # FAISS aborts on writes to a memory-mapped index; reload a private copy
+            self.vs = None
+        if self.vs is None and self._exists():
+            self.load_or_create()
+        if self.vs is None:
+            index = build_index(np.asarray(vectors, dtype=np.float32), self.index_settings)
+            self.vs = FAISS(self.emb, index, InMemoryDocstore(), {})
+        self._backfill_bm25()
+        ids = self.vs.add_embeddings(text_embeddings, metadatas=metadatas)
+        self.bm25.add(ids, texts)
+        self._maybe_upgrade_index()
+        
+        save_vectorstore(self.vs, self.index_dir)
+        VECTORSTORE_CACHE.invalidate(str(self.index_dir))
+        self.fingerprints.add_many(new_keys)
+        log.info("Chunks ingested", index_dir=str(self.index_dir), **stats)
+        return stats
         
     
-    def load_or_create(self, texts:Optional[List[str]] = None, metadatas: Optional[List[Dict]] =None):
+    def _backfill_fingerprints(self):
+        # Indexes from before content fingerprints (ingested_meta.json keyed by
+        # source::row_id) are re-keyed from the chunks they already store
+        if self.vs is None:
+            self.load_or_create()
+        ids = list(self.vs.index_to_docstore_id.values())
+        self.fingerprints.add_many(self._fingerprint(self.vs.docstore.search(i).page_content) for i in ids)
+        log.info("Fingerprints backfilled", index_dir=str(self.index_dir), docs=len(ids))
+    
+    def _backfill_bm25(self):
+        # Indexes created before keyword search existed get their postings on next ingest
+        if len(self.bm25) or not self.vs.index_to_docstore_id:
+            return
+        ids = list(self.vs.index_to_docstore_id.values())
+        self.bm25.add(ids, [self.vs.docstore.search(i).page_content for i in ids])
+        log.info("BM25 index backfilled", index_dir=str(self.index_dir), docs=len(ids))
+    
+    def _maybe_upgrade_index(self):
+        """
+        Rebuild a Flat index as the configured ANN type once it crosses
+        min_vectors_for_ann. Vectors keep their positions, so docstore ids stay valid.
+        """
+        settings = self.index_settings
+        ntotal = self.vs.index.ntotal
+        if settings["index_type"] == "Flat" or ntotal < settings["min_vectors_for_ann"] or not is_flat(self.vs.index):
+            return
+        vectors = self.vs.index.reconstruct_n(0, ntotal)
+        index = build_index(vectors, settings)
+        index.add(vectors)
+        self.vs.index = index
+        log.info("FAISS index upgraded from Flat", index_type=settings["index_type"], vectors=ntotal,
+                 index_dir=str(self.index_dir))
+    
+    def load_or_create(self, texts:Optional[List[str]] = None, metadatas: Optional[List[Dict]] =None, mmap: bool = False):
+        """
+        Load the existing index (memory-mapped and read-only when ``mmap`` is True) or
+        create one from ``texts``. ingest()/add_documents() need a writable load.
+        """
         if self._exists():
-            self.vs = FAISS.load_local(
-                str(self.index_dir),
-                embeddings = self.emb,
-                allow_dangerous_deserialization=True,
-            )
+            self.vs = load_vectorstore(self.index_dir, self.emb, mmap=mmap)
+            self._mapped = mmap
             return self.vs
         if not texts:
             raise EnterpriseDocumentChatException("No existing index found and no texts provided for creating a new index.", sys)
         self.vs = FAISS.from_texts(texts=texts, embedding=self.emb, metadatas=metadatas or [])
-        self.vs.save_local(str(self.index_dir))
+        self._mapped = False
+        save_vectorstore(self.vs, self.index_dir)
+        VECTORSTORE_CACHE.invalidate(str(self.index_dir))
         return self.vs
     
             
@@ -100,8 +223,6 @@ class ChatIngestor:
         session_id: Optional[str] = None,
     ):
         try:
-            self.model_loader = ModelLoader()
-            
             self.use_session = use_session_dirs
             self.session_id = session_id or generate_session_id()
             
@@ -110,6 +231,8 @@ class ChatIngestor:
             
             self.temp_dir = self._resolve_dir(self.temp_base)
             self.faiss_dir = self._resolve_dir(self.faiss_base)
+            self.ingest_stats: Dict[str, int] = {"added": 0, "skipped": 0}
+            self.content_hashes: Dict[str, str] = {}
             
             log.info("ChatIngestor initialized",
                         session_id=self.session_id,
@@ -131,39 +254,59 @@ class ChatIngestor:
     def _split(self, docs: List[Document], chunk_size=1000, chunk_overlap=200) -> List[Document]:
         splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap)
+            chunk_overlap=chunk_overlap,
+            add_start_index=True)  # lets the context assembler stitch neighbouring chunks
         chunks = splitter.split_documents(docs)
         log.info("Documents split into chunks", original_docs=len(docs), total_chunks=len(chunks), chunk_size=chunk_size, chunk_overlap=chunk_overlap)
         return chunks
         
     
+    def save_uploads(self, uploaded_files: Iterable) -> List[Path]:
+        try:
+            saved = persist_uploads(uploaded_files, self.temp_dir)
+            self.content_hashes.update({str(path): sha256 for path, sha256 in saved})
+            return [path for path, _ in saved]
+        except Exception as e:
+            log.error("Failed to save uploads for ingestion", error=str(e), session_id=self.session_id)
+            raise EnterpriseDocumentChatException("Error saving uploaded files", e) from e
+    
     def build_retriever(self,
         uploaded_files: Iterable,
         *,
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
         k: int = 5,
+        progress: Optional[ProgressCallback] = None,
+        ):
+        _report(progress, "saving")
+        paths = self.save_uploads(uploaded_files)
+        return self.build_retriever_from_paths(
+            paths, chunk_size=chunk_size, chunk_overlap=chunk_overlap, k=k, progress=progress)
+    
+    def build_retriever_from_paths(self,
+        paths: List[Path],
+        *,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        k: int = 5,
+        progress: Optional[ProgressCallback] = None,
         ):
+        """
+        Parse, split, embed and index files already saved under temp_dir.
+        """
         try:
-            paths = save_uploaded_files(uploaded_files, self.temp_dir)
-            docs = load_documents(paths)
+            _report(progress, "parsing")
+            docs = load_documents(paths, self.content_hashes)
             if not docs:
                 raise ValueError("No valid documents found for ingestion.")
             
+            _report(progress, "splitting")
             chunks = self._split(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-            fm = FaissManager(self.faiss_dir, model_loader=self.model_loader)
+            fm = FaissManager(self.faiss_dir)
+            self.ingest_stats = fm.ingest(chunks, progress=progress)
             
-            texts = [c.page_content for c in chunks]
-            metas = [c.metadata for c in chunks]
-            
-            try:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-            except Exception:
-                vs = fm.load_or_create(texts=texts, metadatas=metas)
-            
-            added = fm.add_documents(chunks)
-            log.info("Retriever built successfully", added=added, index=str(self.faiss_dir))
-            return vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
+            log.info("Retriever built successfully", index=str(self.faiss_dir), **self.ingest_stats)
+            return fm.vs.as_retriever(search_type="similarity", search_kwargs={"k": k})
         
         except Exception as e:
             log.error("Failed to build retriever", error=str(e), session_id=self.session_id)
@@ -179,6 +322,7 @@ class DocHandler:
         self.session_id =session_id or generate_session_id("session")
         self.session_path = os.path.join(self.data_dir, self.session_id)
         os.makedirs(self.session_path, exist_ok=True)
+        self.content_hashes: Dict[str, str] = {}
         log.info("DocHandler initialized", session_id=self.session_id, session_path=self.session_path)
             
     def save_pdf(self, uploaded_file) -> str:
@@ -187,26 +331,25 @@ class DocHandler:
             if not filename.lower().endswith(".pdf"):
                 raise ValueError("Only PDF files are supported.")
             save_path = os.path.join(self.session_path, filename)
-            with open(save_path, "wb") as f:
-                if hasattr(uploaded_file, "read"):
-                    f.write(uploaded_file.read())
-                
-                else:
-                    f.write(uploaded_file.getbuffer())
-            log.info("PDF saved successfully", file=filename, save_path=save_path, session_id=self.session_id)
+            self.content_hashes[save_path] = persist_upload(uploaded_file, save_path)
+            log.info("PDF saved successfully", file=filename, save_path=save_path, session_id=self.session_id,
+                     sha256=self.content_hashes[save_path])
             return save_path
         except Exception as e:
             log.error("Failed to save PDF", error=str(e), session_id=self.session_id)
-            raise EnterpriseDocumentChatException(f"Error saving PDF: {sys(e)}", e) from e
+            raise EnterpriseDocumentChatException(f"Error saving PDF: {e}", e) from e
         
     
+    def iter_pages(self, pdf_path: str) -> Iterator[str]:
+        """
+        Page texts in order, streamed rather than joined into one string.
+        """
+        return PDF_TEXT_CACHE.iter_pages(pdf_path, self.content_hashes.get(pdf_path))
+    
     def read_pdf(self, pdf_path: str) -> str:
         try:
-            text_chunks = []
-            with fitz.open(pdf_path) as doc:
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text_chunks.append(f"\n--- Page {page_num + 1} ---\n{page.get_text()}")
+            pages = PDF_TEXT_CACHE.pages(pdf_path, self.content_hashes.get(pdf_path))
+            text_chunks = [f"\n--- Page {page_num + 1} ---\n{text}" for page_num, text in enumerate(pages)]
             text = "\n".join(text_chunks)
             log.info("PDF read successfully", pdf_path=pdf_path, session_id=self.session_id, pages=len(text_chunks))
             return text
@@ -224,6 +367,7 @@ class DocumentComparator:
         self.session_id = session_id or generate_session_id()
         self.session_path = self.base_dir / self. session_id
         self.session_path.mkdir(parents=True, exist_ok=True)
+        self.content_hashes: Dict[str, str] = {}
         log.info("DocumentComparator initialized", session_path=str(self.session_path))
     
     def save_uploaded_files(self, reference_file, actual_file):
@@ -233,11 +377,7 @@ class DocumentComparator:
             for fobj, out in [(reference_file, ref_path), (actual_file, act_path)]:
                 if not fobj.name.lower().endswith(".pdf"):
                     raise ValueError("Only PDF files are supported.")
-                with open(out, "wb") as f:
-                    if hasattr(fobj, "read"):
-                        f.write(fobj.read())
-                    else:
-                        f.write(fobj.getbuffer())
+                self.content_hashes[str(out)] = persist_upload(fobj, out)
             log.info("Uploaded files saved successfully", reference=str(ref_path), actual=str(act_path), session=self.session_id)
             return str(ref_path), str(act_path)
         
@@ -246,17 +386,17 @@ class DocumentComparator:
             raise EnterpriseDocumentChatException("Error saving uploaded files", e) from e
         
     
+    def read_pages(self, pdf_path: Path) -> List[str]:
+        """
+        Per-page text of a PDF (served from PDF_TEXT_CACHE when possible).
+        """
+        return PDF_TEXT_CACHE.pages(pdf_path, self.content_hashes.get(str(pdf_path)))
+    
     def read_pdf(self, pdf_path: Path) -> str:
         try:
-            with fitz.open(pdf_path) as doc:
-                if doc.is_encrypted:
-                    raise ValueError(f"Encrypted PDFs {pdf_path.name} are not supported.")
-                parts = []
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text = page.get_text()
-                    if text.strip():
-                        parts.append(f"\n--- Page {page_num + 1} ---\n{text}")
+            pdf_path = Path(pdf_path)
+            pages = self.read_pages(pdf_path)
+            parts = [f"\n--- Page {page_num + 1} ---\n{text}" for page_num, text in enumerate(pages) if text.strip()]
             log.info("PDF read successfully", pdf_path=str(pdf_path), pages=len(parts), session=self.session_id)
             return "\n".join(parts)
         
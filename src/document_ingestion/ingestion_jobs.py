@@ -0,0 +1,163 @@
+from __future__ import annotations
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from logger import GLOBAL_LOGGER as log
+from utils.config_loader import load_config
+from src.document_ingestion.data_ingestion import ChatIngestor
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when the ingestion queue already holds max_pending jobs."""
+
+
+class IngestionJob:
+    """
+    Mutable status record for one background ingestion run.
+    """
+
+    def __init__(self, session_id: str, files: List[str]):
+        self.job_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.files = files
+        self.status = "queued"
+        self.stage = "queued"
+        self.embedded = 0
+        self.total_chunks: Optional[int] = None
+        self.timings: Dict[str, float] = {}
+        self.result: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._stage_started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _close_stage(self):
+        now = time.perf_counter()
+        self.timings[self.stage] = round(self.timings.get(self.stage, 0.0) + now - self._stage_started, 3)
+        self._stage_started = now
+
+    def update(self, stage: str, done: Optional[int] = None, total: Optional[int] = None):
+        with self._lock:
+            if stage != self.stage:
+                self._close_stage()
+                self.stage = stage
+            if total is not None:
+                self.total_chunks = total
+            if done is not None:
+                self.embedded = done
+
+    def start(self):
+        with self._lock:
+            self._close_stage()
+            self.stage = "starting"
+            self.status = "running"
+            self.started_at = time.time()
+
+    def finish(self, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self._lock:
+            self._close_stage()
+            self.status = status
+            self.stage = "done" if status == "succeeded" else self.stage
+            self.result = result or {}
+            self.error = error
+            self.finished_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "job_id": self.job_id,
+                "session_id": self.session_id,
+                "files": self.files,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": {"chunks_embedded": self.embedded, "chunks_total": self.total_chunks},
+                "timings": dict(self.timings),
+                "elapsed_seconds": round(end - (self.started_at or self.created_at), 3),
+                "result": dict(self.result),
+                "error": self.error,
+            }
+
+
+class IngestionJobManager:
+    """
+    In-process job queue for /chat/index: a bounded worker pool runs
+    ChatIngestor.build_retriever_from_paths and keeps recent job status in memory.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 32, keep_finished: int = 200):
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls) -> "IngestionJobManager":
+        try:
+            cfg = load_config().get("ingestion_jobs") or {}
+        except Exception as e:
+            log.warning("Falling back to default ingestion job settings", error=str(e))
+            cfg = {}
+        return cls(
+            max_workers=int(cfg.get("max_workers", 2)),
+            max_pending=int(cfg.get("max_pending", 32)),
+            keep_finished=int(cfg.get("keep_finished", 200)),
+        )
+
+    def _pending(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status in ("queued", "running"))
+
+    def _prune(self):
+        finished = [jid for jid, j in self._jobs.items() if j.status in ("succeeded", "failed")]
+        for jid in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[jid]
+
+    def is_full(self) -> bool:
+        with self._lock:
+            return self._pending() >= self.max_pending
+
+    def submit(self, ingestor: ChatIngestor, paths: List[Path],
+               on_done: Optional[Callable[[ChatIngestor], None]] = None, **build_kwargs) -> IngestionJob:
+        """
+        Queue ingestion of already-saved files; returns immediately. ``on_done`` runs
+        in the worker after the job finishes, whether it succeeded or failed.
+        """
+        with self._lock:
+            if self._pending() >= self.max_pending:
+                raise JobQueueFullError(f"Ingestion queue is full ({self.max_pending} pending jobs)")
+            job = IngestionJob(ingestor.session_id, [Path(p).name for p in paths])
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, ingestor, paths, build_kwargs, on_done)
+        log.info("Ingestion job queued", job_id=job.job_id, session_id=job.session_id, files=len(paths))
+        return job
+
+    def _run(self, job: IngestionJob, ingestor: ChatIngestor, paths: List[Path], build_kwargs: Dict[str, Any],
+             on_done: Optional[Callable[[ChatIngestor], None]] = None):
+        job.start()
+        try:
+            ingestor.build_retriever_from_paths(paths, progress=job.update, **build_kwargs)
+            job.finish("succeeded", result=dict(ingestor.ingest_stats))
+            log.info("Ingestion job finished", job_id=job.job_id, session_id=job.session_id, timings=job.timings)
+        except Exception as e:
+            job.finish("failed", error=getattr(e, "error_message", str(e)))
+            log.error("Ingestion job failed", job_id=job.job_id, session_id=job.session_id, error=str(e))
+        finally:
+            if on_done is not None:
+                on_done(ingestor)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job.snapshot() if job else None
+
+
+INGESTION_JOBS = IngestionJobManager.from_config()
@@ -1,12 +1,923 @@
 # tests/test_unit_cases.py
 
+from typing import List
+
 import pytest
 from fastapi.testclient import TestClient
+from langchain_community.embeddings import FakeEmbeddings
+from pydantic import Field
 from api.main import app   # or your FastAPI entrypoint
 
 client = TestClient(app)
 
+
+class CountingEmbeddings(FakeEmbeddings):
+    """FakeEmbeddings that records every batch passed to embed_documents."""
+    calls: List[List[str]] = Field(default_factory=list)
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+
+class StubLoader:
+    """Stands in for ModelLoader where only the embedding model is needed."""
+
+    def __init__(self, emb=None):
+        self.emb = emb or FakeEmbeddings(size=8)
+
+    def load_embedding_model(self):
+        return self.emb
+
+
+class StubRegistry:
+    """Stands in for MODEL_REGISTRY: hands out one fixed LLM (and embedding client)."""
+
+    def __init__(self, llm, embeddings=None):
+        self._llm = llm
+        self._embeddings = embeddings
+
+    def loader(self):
+        return None
+
+    def llm(self, provider_key=None):
+        return self._llm
+
+    def embeddings(self):
+        return self._embeddings
+
+
+@pytest.fixture(autouse=True)
+def isolated_pdf_text_cache(tmp_path, monkeypatch):
+    # The shared cache lives under the working directory; keep test runs out of it
+    from utils.pdf_text_cache import PDF_TEXT_CACHE
+    monkeypatch.setattr(PDF_TEXT_CACHE, "cache_dir", tmp_path / "pdf_text_cache")
+
+
+@pytest.fixture
+def stub_model_registry(monkeypatch):
+    """Install a StubRegistry as ``module.MODEL_REGISTRY`` for the test."""
+    def install(module, llm, embeddings=None):
+        monkeypatch.setattr(module, "MODEL_REGISTRY", StubRegistry(llm, embeddings))
+    return install
+
+
+@pytest.fixture(autouse=True)
+def isolated_embedding_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.sqlite3"))
+
 def test_home():
     response = client.get("/")
     assert response.status_code == 200
-    assert "Enterprise Document Chat" in response.text
\ No newline at end of file
+    assert "Enterprise Document Chat" in response.text
+
+def test_vectorstore_cache_reuses_and_reloads(tmp_path):
+    from langchain_community.vectorstores import FAISS
+    from utils.index_cache import VectorStoreCache
+
+    emb = FakeEmbeddings(size=8)
+    FAISS.from_texts(["alpha", "beta"], emb).save_local(str(tmp_path))
+
+    cache = VectorStoreCache(max_bytes=10 * 1024 * 1024)
+    first = cache.get(str(tmp_path), emb)
+    assert cache.get(str(tmp_path), emb) is first
+    assert cache.stats()["hits"] == 1
+
+    first.add_texts(["gamma"])
+    first.save_local(str(tmp_path))
+    reloaded = cache.get(str(tmp_path), emb)
+    assert reloaded is not first
+    assert reloaded.index.ntotal == 3
+
+    # A memory-mapped load is a separate entry, never handed to in-memory callers
+    mapped = cache.get(str(tmp_path), emb, mmap=True)
+    assert mapped is not reloaded and cache.get(str(tmp_path), emb, mmap=True) is mapped
+    assert cache.get(str(tmp_path), emb) is reloaded
+    cache.invalidate(str(tmp_path))
+    assert cache.stats()["entries"] == 0 and cache._key_locks == {}
+
+
+def test_model_registry_shares_clients_until_config_changes(tmp_path, monkeypatch):
+    import shutil
+    from utils.model_loader import ModelRegistry
+
+    monkeypatch.setenv("GROQ_API_KEY", "test-groq-key")
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-google-key")
+    monkeypatch.setenv("LLM_PROVIDER", "groq")
+    config_path = tmp_path / "config.yaml"
+    shutil.copy("config/config.yaml", config_path)
+
+    registry = ModelRegistry(str(config_path))
+    llm = registry.llm()
+    assert registry.llm() is llm
+    assert registry.embeddings() is registry.embeddings()
+
+    config_path.write_text(config_path.read_text() + "\n# changed\n")
+    assert registry.llm() is not llm
+
+
+def test_model_registry_closes_replaced_clients(tmp_path, monkeypatch):
+    from utils.model_loader import ModelRegistry
+
+    monkeypatch.setenv("GROQ_API_KEY", "test-groq-key")
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-google-key")
+    monkeypatch.setenv("LLM_PROVIDER", "groq")
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(open("config/config.yaml").read().replace(
+        "retire_grace_seconds: 120.0", "retire_grace_seconds: 0"))
+
+    registry = ModelRegistry(str(config_path))
+    loader, embeddings = registry.loader(), registry.embeddings()
+    embeddings.underlying._pool()
+    config_path.write_text(config_path.read_text() + "\n# changed\n")
+    assert registry.loader() is not loader
+    assert loader.http_client.is_closed and loader.http_async_client.is_closed
+    assert embeddings.underlying._executor is None
+
+    current = registry.loader()
+    registry.reload()
+    assert current.http_client.is_closed
+
+
+def test_cached_embeddings_skip_known_chunks(tmp_path):
+    from utils.embedding_cache import CachedEmbeddings
+
+    inner = CountingEmbeddings(size=4)
+    cache = CachedEmbeddings(inner, "fake", path=str(tmp_path / "emb.sqlite3"), max_entries=3)
+
+    first = cache.embed_documents(["a", "b", "a"])
+    assert inner.calls == [["a", "b"]]
+    assert first[0] == first[2]
+
+    second = cache.embed_documents(["b", "c"])
+    assert inner.calls[-1] == ["c"]
+    assert second[0] == first[1]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 3
+
+    cache.embed_documents(["d", "e"])
+    assert cache.stats()["entries"] == 3
+
+
+def test_faiss_manager_ingest_embeds_each_chunk_once(tmp_path):
+    from langchain.schema import Document
+    from src.document_ingestion.data_ingestion import FaissManager
+
+    loader = StubLoader(CountingEmbeddings(size=8))
+    docs = [Document(page_content=t, metadata={"source": "a.txt"}) for t in ["one", "two", "one"]]
+    fm = FaissManager(tmp_path, model_loader=loader)
+    assert fm.ingest(docs) == {"added": 2, "skipped": 1}
+    assert fm.vs.index.ntotal == 2
+    assert loader.emb.calls == [["one", "two"]]
+
+    more = [Document(page_content=t, metadata={"source": "b.txt"}) for t in ["two", "three"]]
+    assert fm.ingest(more) == {"added": 1, "skipped": 1}
+    assert fm.vs.index.ntotal == 3
+
+    # Fingerprints survive a restart
+    restarted = FaissManager(tmp_path, model_loader=loader)
+    assert restarted.ingest(docs + more) == {"added": 0, "skipped": 5}
+    assert restarted.vs.index.ntotal == 3
+
+
+def test_concurrent_ingests_into_one_index_keep_every_chunk(tmp_path):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from langchain.schema import Document
+    import src.document_ingestion.data_ingestion as data_ingestion
+    from src.document_ingestion.data_ingestion import FaissManager
+
+    barrier = threading.Barrier(2)
+
+    class SlowEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            try:
+                barrier.wait(timeout=0.5)  # both writers would be mid-ingest without the lock
+            except threading.BrokenBarrierError:
+                pass
+            return super().embed_documents(texts)
+
+    loader = StubLoader(SlowEmbeddings(size=8))
+
+    def ingest(texts):
+        return FaissManager(tmp_path, model_loader=loader).ingest([Document(page_content=t) for t in texts])
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        list(pool.map(ingest, [["a1", "a2"], ["b1", "b2"]]))
+    final = FaissManager(tmp_path, model_loader=loader)
+    assert final.ingest([Document(page_content=t) for t in ["a1", "a2", "b1", "b2"]]) == {"added": 0, "skipped": 4}
+    assert final.vs.index.ntotal == 4
+    assert data_ingestion._INDEX_LOCKS == {}  # per-directory locks go away once released
+
+
+def test_legacy_index_is_refingerprinted_from_its_docstore(tmp_path):
+    from langchain.schema import Document
+    from langchain_community.vectorstores import FAISS
+    from src.document_ingestion.data_ingestion import FaissManager
+
+    loader = StubLoader()
+    # An index written before content fingerprints: FAISS files with no fingerprint store
+    texts = ["alpha clause", "beta clause", "gamma clause"]
+    FAISS.from_texts(texts, loader.emb, metadatas=[{"source": "m.txt"}] * 3).save_local(str(tmp_path))
+
+    fm = FaissManager(tmp_path, model_loader=loader)
+    docs = [Document(page_content=t, metadata={"source": "renamed.txt"}) for t in texts + ["delta clause"]]
+    assert fm.ingest(docs) == {"added": 1, "skipped": 3}
+    assert fm.vs.index.ntotal == 4 and len(fm.fingerprints) == 4
+
+
+def test_batched_embeddings_keep_order_and_retry_throttling():
+    from utils.embedding_pipeline import BatchedEmbeddings
+
+    failed = []
+
+    class FlakyEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            if texts[0] == "t2" and not failed:
+                failed.append(texts[0])
+                raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+            return [[float(t[1:])] * 2 for t in texts]
+
+    emb = BatchedEmbeddings(FlakyEmbeddings(size=2), batch_size=2, max_concurrency=3,
+                            backoff_base=0.01, backoff_max=0.01)
+    texts = [f"t{i}" for i in range(7)]
+    assert emb.embed_documents(texts) == [[float(i)] * 2 for i in range(7)]
+    assert failed == ["t2"]
+
+
+def test_load_documents_keeps_file_and_page_order(tmp_path):
+    import fitz
+    from utils.document_ops import load_documents
+
+    pdf_path = tmp_path / "report.pdf"
+    doc = fitz.open()
+    for i in range(3):
+        doc.new_page().insert_text((72, 72), f"page text {i}")
+    doc.save(str(pdf_path))
+    doc.close()
+    txt_path = tmp_path / "notes.txt"
+    txt_path.write_text("plain notes", encoding="utf-8")
+
+    docs = load_documents([txt_path, pdf_path])
+    assert [d.metadata.get("page") for d in docs] == [None, 0, 1, 2]
+    assert docs[0].metadata["source"] == str(txt_path)
+    assert "page text 2" in docs[3].page_content
+
+
+def test_persist_upload_streams_and_hashes(tmp_path):
+    import hashlib
+    import io
+    from utils.file_io import persist_upload
+
+    payload = b"%PDF-1.4 " + b"x" * 50_000
+
+    class Upload:
+        name = "big.pdf"
+        file = io.BytesIO(payload)
+
+    out = tmp_path / "big.pdf"
+    assert persist_upload(Upload(), out, chunk_size=4096) == hashlib.sha256(payload).hexdigest()
+    assert out.read_bytes() == payload
+
+
+def test_ingestion_job_reports_progress_and_result():
+    import time
+    from src.document_ingestion.ingestion_jobs import IngestionJobManager
+
+    class StubIngestor:
+        session_id = "session_test"
+        ingest_stats = {"added": 3, "skipped": 1}
+
+        def build_retriever_from_paths(self, paths, progress=None, **kwargs):
+            progress("parsing")
+            progress("embedding", done=0, total=3)
+            progress("embedding", done=3, total=3)
+
+    manager = IngestionJobManager(max_workers=1)
+    job = manager.submit(StubIngestor(), ["a.pdf"], chunk_size=500)
+    for _ in range(100):
+        status = manager.get(job.job_id)
+        if status["status"] == "succeeded":
+            break
+        time.sleep(0.01)
+
+    assert status["status"] == "succeeded"
+    assert status["progress"] == {"chunks_embedded": 3, "chunks_total": 3}
+    assert status["result"] == {"added": 3, "skipped": 1}
+    assert {"queued", "parsing", "embedding"} <= set(status["timings"])
+    assert manager.get("missing") is None
+
+
+def test_background_index_rejected_when_queue_full_leaves_no_uploads(tmp_path, monkeypatch):
+    import api.main as main
+    from src.document_ingestion.ingestion_jobs import IngestionJobManager, JobQueueFullError
+
+    class RacedManager(IngestionJobManager):
+        def is_full(self):
+            return False  # another request takes the last slot while this one saves
+
+        def submit(self, *args, **kwargs):
+            raise JobQueueFullError("Ingestion queue is full (1 pending jobs)")
+
+    monkeypatch.setattr(main, "UPLOAD_BASE", str(tmp_path / "uploads"))
+    for manager in (IngestionJobManager(max_workers=1, max_pending=0), RacedManager(max_workers=1)):
+        monkeypatch.setattr(main, "INGESTION_JOBS", manager)
+        response = client.post("/chat/index", data={"background": "true", "session_id": "full"},
+                               files={"files": ("notes.txt", b"queued text", "text/plain")})
+        assert response.status_code == 429
+        assert not [p for p in tmp_path.rglob("*") if p.is_file()]
+
+
+def test_conversational_rag_astream_emits_timings_then_tokens(stub_model_registry):
+    import asyncio
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    import src.document_chat.retrieval as retrieval
+
+    stub_model_registry(retrieval, GenericFakeChatModel(messages=iter([AIMessage(content="streamed final answer")])))
+    store = FAISS.from_texts(["alpha", "beta"], FakeEmbeddings(size=8))
+    rag = retrieval.ConversationalRAG("s1", retriever=store.as_retriever(search_kwargs={"k": 1}))
+
+    async def collect():
+        return [e async for e in rag.astream("question?")]
+
+    events = asyncio.run(collect())
+    names = [e["event"] for e in events]
+    assert names[:2] == ["timing", "timing"] and names[-1] == "done"
+    assert [e["stage"] for e in events[:2]] == ["rewrite", "retrieval"]
+    assert events[0]["rewrite"] == "skipped"
+    tokens = [e["data"] for e in events if e["event"] == "token"]
+    assert len(tokens) > 1 and "".join(tokens) == "streamed final answer"
+
+
+def test_follow_up_rewrite_reuses_speculative_retrieval_and_caches(stub_model_registry, monkeypatch):
+    from concurrent.futures import Future
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.runnables import RunnableLambda
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage, HumanMessage
+    import src.document_chat.retrieval as retrieval
+
+    replies = ["What is the notice period?", "Thirty days.", "Still thirty days."]
+
+    stub_model_registry(retrieval, GenericFakeChatModel(messages=iter(AIMessage(content=r) for r in replies)))
+    store = FAISS.from_texts(["notice is thirty days", "fees are monthly"], FakeEmbeddings(size=8))
+    rag = retrieval.ConversationalRAG("rewrite-session", retriever=store.as_retriever(search_kwargs={"k": 1}))
+    history = [HumanMessage(content="Tell me about the contract"), AIMessage(content="It is a lease.")]
+
+    assert rag.invoke("what is the notice period", chat_history=history) == "Thirty days."
+    assert rag.last_rewrite["rewrite"] == "unchanged"
+    assert rag.invoke("what is the notice period", chat_history=history) == "Still thirty days."
+    assert rag.last_rewrite["rewrite"] == "cached"
+
+    # A failed rewrite cancels the speculative retrieval instead of leaving it queued
+    class HeldPool:
+        def submit(self, fn, *args):
+            self.future = Future()
+            return self.future
+
+    def fail(_payload):
+        raise RuntimeError("rewrite failed")
+
+    pool = HeldPool()
+    monkeypatch.setattr(retrieval, "SPECULATION_EXECUTOR", pool)
+    rag.question_rewriter = RunnableLambda(fail)
+    with pytest.raises(RuntimeError):
+        rag._retrieve({"input": "and the deposit?", "chat_history": history})
+    assert pool.future.cancelled()
+
+
+def test_mmap_loaded_store_matches_private_load(tmp_path):
+    from langchain_community.vectorstores import FAISS
+    from utils.faiss_io import load_vectorstore, save_vectorstore
+
+    emb = FakeEmbeddings(size=8)
+    store = FAISS.from_embeddings([("alpha", [0.0] * 8), ("beta", [1.0] * 8)], emb)
+    save_vectorstore(store, tmp_path)
+
+    mapped = load_vectorstore(tmp_path, emb, mmap=True)
+    docs = mapped.similarity_search_by_vector([0.9] * 8, k=1)
+    assert docs[0].page_content == "beta"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["index.faiss", "index.pkl"]
+
+
+def test_faiss_manager_upgrades_flat_index_past_threshold(tmp_path):
+    import faiss
+    from langchain.schema import Document
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    from src.document_ingestion.data_ingestion import FaissManager
+    from utils.faiss_io import DEFAULT_INDEX_SETTINGS
+
+    fm = FaissManager(tmp_path, model_loader=StubLoader(DeterministicFakeEmbedding(size=16)))
+    fm.index_settings = {**DEFAULT_INDEX_SETTINGS, "index_type": "IVFFlat", "min_vectors_for_ann": 80, "nprobe": 4}
+    fm.ingest([Document(page_content=f"chunk {i}") for i in range(40)])
+    assert isinstance(fm.vs.index, faiss.IndexFlat)
+
+    fm.ingest([Document(page_content=f"chunk {i}") for i in range(40, 120)])
+    assert faiss.try_extract_index_ivf(fm.vs.index) is not None
+    assert fm.vs.index.ntotal == 120
+    assert fm.vs.similarity_search("chunk 77", k=1)[0].page_content == "chunk 77"
+
+
+def test_hybrid_retriever_surfaces_exact_identifier_matches(tmp_path):
+    from langchain.schema import Document
+    from src.document_ingestion.data_ingestion import FaissManager
+    from src.document_chat.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+    from utils.bm25_index import BM25Index, shared_bm25_index
+
+    assert [d for d, _ in reciprocal_rank_fusion([["a", "b"], ["b", "c"]])] == ["b", "a", "c"]
+
+    texts = [f"Routine maintenance note {i} for the pump assembly." for i in range(30)]
+    texts.append("Replace valve part AB-7731 before the annual inspection.")
+    fm = FaissManager(tmp_path, model_loader=StubLoader())
+    fm.ingest([Document(page_content=t, metadata={"source": "m.txt"}) for t in texts])
+
+    bm25 = BM25Index(tmp_path / "bm25.sqlite3")
+    assert len(bm25) == len(texts)
+    retriever = HybridRetriever(vectorstore=fm.vs, bm25=bm25, k=3, fetch_k=10)
+    docs = retriever.invoke("Which part is AB-7731?")
+    assert texts[-1] in [d.page_content for d in docs]
+    assert {"embed_ms", "vector_ms", "bm25_ms", "fusion_ms", "total_ms"} <= set(retriever.timings)
+
+    # Re-adding a doc replaces it: corpus stats and stale postings don't accumulate
+    doc_id = bm25.search("AB-7731", k=1)[0][0]
+    total_len = bm25._stat("total_len")
+    bm25.add([doc_id], ["Replace valve part"])
+    assert len(bm25) == len(texts) and bm25._stat("total_len") == total_len - 10 + 3
+    assert not bm25.search("AB-7731") and bm25.search("valve")[0][0] == doc_id
+    assert shared_bm25_index(tmp_path / "bm25.sqlite3") is shared_bm25_index(str(tmp_path / "bm25.sqlite3"))
+
+
+def test_context_assembler_stitches_overlaps_and_respects_budget():
+    from langchain.schema import Document
+    from src.document_chat.context_assembler import ContextAssembler
+
+    text = " ".join(f"word{i}" for i in range(400))
+    first, second = text[:1000], text[800:1800]
+    other = "An unrelated passage about invoices and their payment schedule."
+    docs = [
+        Document(page_content=second, metadata={"source": "a.pdf", "page": 0}),
+        Document(page_content=other, metadata={"source": "b.pdf", "page": 2}),
+        Document(page_content=first, metadata={"source": "a.pdf", "page": 0}),
+        Document(page_content=other + " ", metadata={"source": "c.pdf", "page": 0}),
+    ]
+    assembler = ContextAssembler(max_tokens=10_000)
+    context = assembler.assemble(docs)
+    assert context == text[:1800] + "\n\n" + other
+    assert assembler.last_stats["duplicates"] == 1
+
+    offsets = [Document(page_content=text[s:s + 500], metadata={"source": "a.pdf", "page": 0, "start_index": s})
+               for s in (500, 0, 1000)]
+    assert ContextAssembler(max_tokens=10_000).assemble(offsets) == text[:1500]
+
+    small = ContextAssembler(max_tokens=100)
+    assert small.estimate_tokens(small.assemble(docs)) <= 100
+
+
+def test_semantic_answer_cache_hits_similar_questions_until_index_changes(tmp_path):
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    from src.document_chat.answer_cache import SemanticAnswerCache
+    from utils.metrics import METRICS
+
+    (tmp_path / "index.faiss").write_bytes(b"v1")
+    emb = DeterministicFakeEmbedding(size=16)
+    cache = SemanticAnswerCache(similarity_threshold=0.99, ttl_seconds=60, max_entries=2)
+    scope = cache.scope(str(tmp_path))
+    hits = METRICS.counter("answer_cache_hits_total", "").value()
+
+    assert cache.lookup(scope, "What is the fee?", emb.embed_query)[0] is None
+    cache.store(scope, "What is the fee?", "Ten dollars.", 1.5, emb.embed_query)
+    assert cache.lookup(scope, "what is the fee", emb.embed_query)[0] == "Ten dollars."
+    assert cache.lookup(scope, "Who signed it?", emb.embed_query)[0] is None
+    assert METRICS.counter("answer_cache_hits_total", "").value() == hits + 1
+    assert "answer_cache_saved_seconds_total" in METRICS.render()
+
+    # Any rewrite of the index (ingest in this or another worker) retires its answers
+    (tmp_path / "index.faiss").write_bytes(b"v2-longer")
+    assert cache.lookup(scope, "What is the fee?", emb.embed_query)[0] is None
+    assert len(cache) == 0
+
+
+def test_streamed_answers_use_the_answer_cache_with_one_query_embedding(tmp_path, stub_model_registry):
+    import asyncio
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    import src.document_chat.retrieval as retrieval
+
+    class CountingEmbedding(DeterministicFakeEmbedding):
+        def embed_query(self, text):
+            queries.append(text)
+            return super().embed_query(text)
+
+    queries = []
+    emb = CountingEmbedding(size=16)
+    FAISS.from_texts(["the fee is ten dollars", "signed by Ann"], emb).save_local(str(tmp_path))
+    queries.clear()
+
+    stub_model_registry(retrieval, GenericFakeChatModel(messages=iter([AIMessage(content="Ten dollars.")])), embeddings=emb)
+
+    def stream(question):
+        rag = retrieval.ConversationalRAG("cached-stream")
+        rag.load_retriever_from_faiss(str(tmp_path), k=1)
+
+        async def collect():
+            return [e async for e in rag.astream(question)]
+        return asyncio.run(collect())
+
+    first = stream("What is the fee?")
+    assert first[-1]["cached"] is False and queries == ["What is the fee?"]
+    again = stream("what is the fee")
+    assert again[-1]["cached"] is True and [e["event"] for e in again] == ["token", "done"]
+    assert again[0]["data"] == "Ten dollars."
+
+
+def test_conversation_memory_keeps_window_and_rolls_summary(tmp_path):
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage, SystemMessage
+    from langchain_core.runnables import RunnableLambda
+    from src.document_chat.conversation_memory import ConversationMemory
+
+    memory = ConversationMemory(tmp_path / "memory.sqlite3", window_turns=1, summarize_batch_turns=1)
+    memory.append("s1", "Who is the landlord?", "Acme Ltd.")
+    assert not memory.needs_compaction("s1")
+    memory.append("s1", "And the rent?", "1000 per month.")
+    assert memory.needs_compaction("s1")
+
+    llm = GenericFakeChatModel(messages=iter([AIMessage(content="The landlord is Acme Ltd.")]))
+    assert memory.compact("s1", llm)
+    history = memory.history("s1")
+    assert isinstance(history[0], SystemMessage) and "Acme Ltd." in history[0].content
+    assert [m.content for m in history[1:]] == ["And the rent?", "1000 per month."]
+
+    # Survives a restart; other sessions are unaffected
+    reopened = ConversationMemory(tmp_path / "memory.sqlite3", window_turns=1, summarize_batch_turns=1)
+    assert len(reopened.history("s1")) == 3 and reopened.history("s2") == []
+    reopened.clear("s1")
+    assert reopened.history("s1") == []
+
+    # Without successful compaction, prompts keep only the newest max_raw_turns turns
+    capped = ConversationMemory(tmp_path / "memory.sqlite3", window_turns=1, summarize_batch_turns=1, max_raw_turns=2)
+    for i in range(5):
+        capped.append("s3", f"q{i}", f"a{i}")
+    assert [m.content for m in capped.history("s3")] == ["q3", "a3", "q4", "a4"]
+
+    # Compaction then folds the whole backlog, oldest first, max_raw_turns turns per call
+    seen = []
+
+    def summarize(prompt_value):
+        seen.append([m.content for m in prompt_value.to_messages() if m.content in
+                     {f"{p}{i}" for p in "qa" for i in range(5)}])
+        return f"summary {len(seen)}"
+
+    assert capped.compact("s3", RunnableLambda(summarize))
+    assert seen == [["q0", "a0", "q1", "a1"], ["q2", "a2", "q3", "a3"]]
+    assert [m.content for m in capped.history("s3")] == ["Summary of the earlier conversation: summary 2", "q4", "a4"]
+
+
+def test_federated_retriever_merges_top_k_across_sessions():
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+    from langchain_community.vectorstores import FAISS
+    from src.document_chat.federated_retriever import FederatedRetriever
+
+    emb = DeterministicFakeEmbedding(size=16)
+    stores = {
+        "s1": FAISS.from_texts(["lease term", "rent amount"], emb),
+        "s2": FAISS.from_texts(["notice period", "deposit rules"], emb),
+    }
+    retriever = FederatedRetriever(vectorstores=stores, k=2)
+    docs = retriever.invoke("deposit rules")
+    assert docs[0].page_content == "deposit rules" and docs[0].metadata["session_id"] == "s2"
+    assert len(docs) == 2
+
+    # Same ranking as searching one index holding everything
+    combined = FAISS.from_texts(["lease term", "rent amount", "notice period", "deposit rules"], emb)
+    expected = [d.page_content for d in combined.similarity_search("deposit rules", k=2)]
+    assert [d.page_content for d in docs] == expected
+
+
+def test_pdf_text_cache_serves_repeat_reads_and_evicts(tmp_path, monkeypatch):
+    import os
+    import fitz
+    import utils.document_ops as document_ops
+    from utils.pdf_text_cache import PdfTextCache, decode_pages, encode_pages
+
+    assert decode_pages(encode_pages(["one", "", "três"])) == ["one", "", "três"]
+
+    pdf_path = tmp_path / "report.pdf"
+    doc = fitz.open()
+    for i in range(2):
+        doc.new_page().insert_text((72, 72), f"page text {i}")
+    doc.save(str(pdf_path))
+    doc.close()
+
+    cache = PdfTextCache(tmp_path / "cache", max_mb=1, max_age_days=1, evict_interval_seconds=0)
+    monkeypatch.setattr(document_ops, "PDF_TEXT_CACHE", cache)
+    first = document_ops.load_documents([pdf_path])
+
+    def no_parsing(*args):
+        raise AssertionError("cached PDF was parsed again")
+
+    monkeypatch.setattr(document_ops.document_parser, "pdf_page_count", no_parsing)
+    # Hashes recorded at upload are used as given
+    known = {str(pdf_path): cache.file_hash(pdf_path)}
+    with monkeypatch.context() as m:
+        m.setattr(cache, "file_hash", no_parsing)
+        again = document_ops.load_documents([pdf_path], known)
+    assert [(d.page_content, d.metadata) for d in again] == [(d.page_content, d.metadata) for d in first]
+    assert cache.pages(pdf_path)[1] == first[1].page_content
+
+    # Comparison reads go through the same cache, which rejects encrypted PDFs
+    from src.document_ingestion.data_ingestion import DocumentComparator
+    comparator = DocumentComparator(base_dir=str(tmp_path / "compare"))
+    monkeypatch.setattr("src.document_ingestion.data_ingestion.PDF_TEXT_CACHE", cache)
+    assert comparator.read_pages(pdf_path) == cache.pages(pdf_path)
+    locked = tmp_path / "locked.pdf"
+    doc = fitz.open()
+    doc.new_page()
+    doc.save(str(locked), encryption=fitz.PDF_ENCRYPT_AES_256, user_pw="user", owner_pw="owner")
+    doc.close()
+    with pytest.raises(ValueError, match="Encrypted"):
+        comparator.read_pages(locked)
+
+    # Entries past max_age are dropped on the next write
+    entry = next((tmp_path / "cache").glob("*/*.ptc"))
+    os.utime(entry, (0, 0))
+    cache.put("0" * 64, ["other"])
+    assert not entry.exists() and cache.get("0" * 64) == ["other"]
+
+    # Between scans, writes under max_mb do not touch the rest of the directory
+    cache.evict_interval_seconds = 3600
+    monkeypatch.setattr(cache, "evict", no_parsing)
+    cache.put("1" * 64, ["more"])
+
+
+def test_page_alignment_survives_inserted_page():
+    from src.document_compare.page_diff import align_pages, format_changed_pages, window_pages
+
+    ref = ["Intro", "Term: 12 months", "Signatures"]
+    act = ["Intro  ", "New annex page", "Term: 24 months", "Signatures"]
+    aligned = align_pages(ref, act)
+    assert [(a.ref_page, a.act_page, a.status) for a in aligned] == [
+        (1, 1, "unchanged"), (2, 2, "changed"), (None, 3, "added"), (3, 4, "unchanged"),
+    ]
+    prompt = format_changed_pages(aligned)
+    assert "-Term: 12 months" in prompt and "Signatures" not in prompt
+
+    # Oversized diffs are truncated in the window only, not in the alignment itself
+    (window,) = window_pages(aligned[1:2], max_chars=10, max_pages=8)
+    assert window[0].diff.endswith("[diff truncated]") and not aligned[1].diff.endswith("[diff truncated]")
+
+
+def test_compare_pages_skips_llm_for_unchanged_pages(stub_model_registry):
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    import src.document_compare.document_comparator as comparator
+
+    calls = []
+
+    def replies():
+        calls.append(1)
+        yield AIMessage(content='[{"page": "2", "changes": "Term extended to 24 months"}]')
+
+    stub_model_registry(comparator, GenericFakeChatModel(messages=replies()))
+    comp = comparator.DocumentComparatorLLM()
+    df = comp.compare_pages(["Intro", "Term: 12 months"], ["Intro", "Term: 24 months"])
+    assert df.to_dict(orient="records") == [
+        {"page": "1", "changes": "No Change", "degraded": False},
+        {"page": "2", "changes": "Term extended to 24 months", "degraded": False},
+    ]
+    assert comp.last_stats["unchanged_pages"] == 1
+
+    calls.clear()
+    df = comp.compare_pages(["Same"], ["Same"])
+    assert calls == [] and df.to_dict(orient="records") == [{"page": "1", "changes": "No Change", "degraded": False}]
+
+
+def test_compare_pages_merges_concurrent_windows_in_page_order(stub_model_registry):
+    import json
+    import re
+    from langchain_core.runnables import RunnableLambda
+    import src.document_compare.document_comparator as comparator
+
+    def fake_llm(prompt_value):
+        labels = re.findall(r"=== Page (\S+) \(", prompt_value.to_string())
+        if "5" in labels:
+            raise RuntimeError("provider timeout")
+        return json.dumps([{"page": label, "changes": f"edited {label}"} for label in labels])
+
+    stub_model_registry(comparator, RunnableLambda(fake_llm))
+    comp = comparator.DocumentComparatorLLM()
+    comp.settings = {**comp.settings, "window_max_pages": 2}
+    ref = [f"page {i} original" for i in range(7)]
+    act = [f"page {i} edited" if i % 2 == 0 else ref[i] for i in range(7)]
+
+    rows = comp.compare_pages(ref, act).to_dict(orient="records")
+    assert [r["page"] for r in rows] == [str(i) for i in range(1, 8)]
+    assert [r["changes"] for r in rows[:3]] == ["edited 1", "No Change", "edited 3"]
+    # The failed window's pages keep a placeholder and are flagged
+    assert [r["page"] for r in rows if r["degraded"]] == ["5", "7"]
+    assert rows[4]["changes"] == "Page changed; diff:\n@@ -1 +1 @@\n-page 4 original\n+page 4 edited"
+    assert comp.last_stats["degraded_pages"] == 2
+    assert [w["page_count"] for w in comp.last_stats["windows"]] == [2, 2]
+    assert all("ms" in w for w in comp.last_stats["windows"])
+
+
+def test_document_analyzer_switches_to_map_reduce_for_large_documents(monkeypatch, stub_model_registry):
+    import json
+    import time
+    from langchain_core.runnables import RunnableLambda
+    import src.document_analyser.data_analysis as data_analysis
+
+    prompts = []
+
+    def fake_llm(prompt_value):
+        text = prompt_value.to_string()
+        prompts.append(text)
+        if "Summarize pages" in text:
+            return "summary of a page range"
+        return json.dumps({"Summary": ["ok"], "Title": "T", "Author": "A", "DateCreated": "", "LastModifiedDate": "",
+                           "Publisher": "", "Language": "English", "PageCount": 1, "SentimentTone": "neutral"})
+
+    stub_model_registry(data_analysis, RunnableLambda(fake_llm))
+    analyzer = data_analysis.DocumentAnalyzer()
+    analyzer.settings = {**analyzer.settings, "single_pass_max_tokens": 200, "map_group_tokens": 100}
+
+    assert analyzer.analyze_pages(iter(["short page"] * 2))["Title"] == "T"
+    assert analyzer.last_stats["mode"] == "single_pass" and len(prompts) == 1
+
+    prompts.clear()
+    result = analyzer.analyze_pages(iter(["x" * 300] * 6))
+    assert result["Language"] == "English"
+    assert analyzer.last_stats["mode"] == "map_reduce" and analyzer.last_stats["pages"] == 6
+    assert sum("Summarize pages" in p for p in prompts) == 6
+    assert "The document has 6 pages" in prompts[-1] and "x" * 300 not in prompts[-1]
+
+    # A failed map call cancels the groups still queued behind it
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(data_analysis, "ANALYSIS_MAP_EXECUTOR", pool)
+    map_calls = []
+
+    def failing_map(_):
+        map_calls.append(1)
+        time.sleep(0.05)
+        raise RuntimeError("provider down")
+
+    analyzer.map_chain = RunnableLambda(failing_map)
+    with pytest.raises(Exception):
+        analyzer.analyze_pages(iter(["x" * 300] * 6))
+    pool.shutdown(wait=True)
+    assert 1 <= len(map_calls) < 6
+
+
+def test_iterate_on_streams_pages_from_another_pool():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.executors import iterate_on
+
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="parse")
+    produced = []
+
+    def pages(n, fail_at=None):
+        for i in range(n):
+            if i == fail_at:
+                raise ValueError("corrupt page")
+            produced.append(threading.current_thread().name)
+            yield f"page {i}"
+
+    assert list(iterate_on(pool, pages, 20, buffer=2)) == [f"page {i}" for i in range(20)]
+    assert all(name.startswith("parse") for name in produced)
+
+    with pytest.raises(ValueError):
+        list(iterate_on(pool, pages, 5, fail_at=3))
+
+    # A consumer that stops early releases the producer instead of leaving it blocked
+    produced.clear()
+    stream = iterate_on(pool, pages, 1000, buffer=2)
+    assert next(stream) == "page 0"
+    stream.close()
+    pool.shutdown(wait=True)
+    assert len(produced) < 1000
+
+
+def test_local_metadata_fills_info_dict_fields_before_the_llm(tmp_path, stub_model_registry):
+    import json
+    import fitz
+    from langchain_core.runnables import RunnableLambda
+    import src.document_analyser.data_analysis as data_analysis
+    from src.document_analyser.local_metadata import (
+        detect_language, extract_pdf_metadata, parse_pdf_date, plausible_title)
+
+    assert parse_pdf_date("D:20240131093000+05'30'") == "2024-01-31T09:30:00+05:30"
+    assert detect_language("El contrato de servicios se renueva por un año para la empresa.") == "Spanish"
+    assert detect_language("12 34 56") is None
+
+    pdf_path = tmp_path / "report.pdf"
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "The quarterly report is ready for the board and the auditors.")
+    doc.set_metadata({"title": "Q3 Report", "author": "Finance", "creationDate": "D:20240131",
+                      "creator": "Microsoft Word"})
+    doc.save(str(pdf_path))
+    doc.close()
+    known = extract_pdf_metadata(str(pdf_path))
+    assert known["Title"] == "Q3 Report" and known["PageCount"] == 1 and known["DateCreated"] == "2024-01-31"
+    assert "Publisher" not in known  # creator names the authoring software, not a publisher
+    assert not plausible_title("Microsoft Word - draft.docx") and plausible_title("Document Management Guide")
+
+    prompts = []
+
+    def fake_llm(prompt_value):
+        prompts.append(prompt_value.to_string())
+        return json.dumps({"Summary": ["ok"], "SentimentTone": "neutral", "Title": "guessed"})
+
+    stub_model_registry(data_analysis, RunnableLambda(fake_llm))
+    result = data_analysis.DocumentAnalyzer().analyze_pages(
+        iter(["The quarterly report is ready for the board and the auditors."]), known=known)
+    assert result["Title"] == "Q3 Report" and result["Language"] == "English"
+    assert result["SentimentTone"] == "neutral" and list(result)[0] == "Summary"
+    assert '"Title"' not in prompts[0] and '"Language"' not in prompts[0] and '"SentimentTone"' in prompts[0]
+
+    # The narrowed chain is built once per set of known fields and shared across analyzers
+    built = dict(data_analysis._OUTPUT_CHAINS)
+    assert data_analysis.DocumentAnalyzer().analyze_pages(iter(["Another page of the report."]), known=known)
+    assert data_analysis._OUTPUT_CHAINS == built and len(prompts) == 2
+
+
+def test_structured_output_prefers_native_then_local_repair_before_llm_fix():
+    import json
+    from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_core.exceptions import OutputParserException
+    from langchain_core.runnables import RunnableLambda
+    from model.models import SummaryResponse
+    from utils.structured_output import StructuredOutputChain, repair_json
+
+    assert json.loads(repair_json('Sure:\n```json\n[{"page": "1", "changes": "x",},]\n```')) == [{"page": "1", "changes": "x"}]
+    assert json.loads(repair_json('{"Summary": ["a", "b"], "SentimentTone": "neut')) == {
+        "Summary": ["a", "b"], "SentimentTone": "neut"}
+
+    prompt = ChatPromptTemplate.from_template("{format_instruction}\n{changed_pages}")
+    inputs = {"changed_pages": "=== Page 1 ==="}
+    settings = {"native": True, "local_repair": True, "llm_fix": True}
+    replies = []
+
+    def text_llm(prompt_value):
+        return AIMessage(content=replies.pop(0))
+
+    chain = StructuredOutputChain(prompt, RunnableLambda(text_llm), SummaryResponse, "test",
+                                  instructions_key="format_instruction", settings=settings)
+    assert chain.native_chain is None
+    replies[:] = ['Here are the rows: [{"page": "1", "changes": "edited",}] Hope this helps.']
+    assert chain.invoke_with_path(inputs) == ([{"page": "1", "changes": "edited"}], "repaired")
+    replies[:] = ["no json at all", '[{"page": "1", "changes": "fixed"}]']
+    assert chain.invoke_with_path(inputs) == ([{"page": "1", "changes": "fixed"}], "llm_fix")
+
+    native_replies, native_prompts = [], []
+
+    def native_llm(prompt_value):
+        native_prompts.append(prompt_value.to_string())
+        reply = native_replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    class NativeLLM(GenericFakeChatModel):
+        def with_structured_output(self, schema, include_raw=False, **kwargs):
+            return RunnableLambda(native_llm)
+
+    fallback_reply = AIMessage(content='{"rows": [{"page": "1", "changes": "text"}]}')
+    fixed_reply = AIMessage(content='[{"page": "1", "changes": "fixed"}]')
+    native = StructuredOutputChain(prompt, NativeLLM(messages=iter([fallback_reply, fixed_reply])), SummaryResponse, "test",
+                                   instructions_key="format_instruction", settings=settings)
+    row = {"page": "1", "changes": "native"}
+    native_replies[:] = [{"raw": AIMessage(content=""), "parsed": native.native_parser.pydantic_object(rows=[row]),
+                          "parsing_error": None}]
+    assert native.invoke_with_path(inputs) == ([row], "native")
+    assert '"rows"' in native_prompts[-1]
+
+    # A reply that fails validation is recovered from its tool-call args, without a second call
+    tool_reply = AIMessage(content="", tool_calls=[{"name": "rows", "args": {"rows": [row]}, "id": "1"}])
+    native_replies[:] = [{"raw": tool_reply, "parsed": None, "parsing_error": ValueError("bad")}]
+    assert native.invoke_with_path(inputs) == ([row], "native_repaired")
+
+    native_replies[:] = [RuntimeError("tool schema rejected")]
+    assert native.invoke_with_path(inputs) == ([{"page": "1", "changes": "text"}], "native_fallback")
+
+    # An unrecoverable native reply goes to OutputFixingParser (or fails), not back to the model as text
+    garbled = {"raw": AIMessage(content="rows: page one changed"), "parsed": None, "parsing_error": ValueError("bad")}
+    native_replies[:] = [dict(garbled)]
+    assert native.invoke_with_path(inputs) == ([{"page": "1", "changes": "fixed"}], "llm_fix")
+    settings["llm_fix"] = False
+    native_replies[:] = [dict(garbled)]
+    with pytest.raises(OutputParserException):
+        native.invoke_with_path(inputs)
+    assert len(native_prompts) == 5
+
+    from utils.metrics import METRICS
+    counter = METRICS.counter("structured_output_total", "")
+    paths = ("native", "native_repaired", "native_fallback", "repaired", "llm_fix", "failed")
+    assert [counter.value(component="test", path=p) for p in paths] == [1, 1, 1, 1, 2, 1]
+    assert 'structured_output_seconds_count{component="test",path="native"} 1.0' in METRICS.render()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from logger import GLOBAL_LOGGER as log
+
+# Keeps identifiers such as "AB-1234", "4.2.1" or "clause_7" together as one token
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+PART_RE = re.compile(r"[-_./]")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens; compound identifiers also contribute their parts."""
+    tokens: List[str] = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        tokens.append(tok)
+        if PART_RE.search(tok):
+            tokens.extend(p for p in PART_RE.split(tok) if p)
+    return tokens
+
+
+class BM25Index:
+    """
+    Persisted sparse BM25 index stored in SQLite next to the FAISS files.
+
+    Documents are keyed by their FAISS docstore id, so keyword hits resolve to the
+    same Documents as vector hits. Inserts cost O(batch); corpus statistics are
+    maintained incrementally.
+    """
+
+    def __init__(self, db_path: Path, k1: float = 1.5, b: float = 0.75):
+        self.db_path = Path(db_path)
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS docs (doc_id TEXT PRIMARY KEY, length INTEGER NOT NULL) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL,"
+            " PRIMARY KEY (term, doc_id)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS stats (key TEXT PRIMARY KEY, value REAL NOT NULL) WITHOUT ROWID;"
+        )
+        self._conn.commit()
+
+    def _stat(self, key: str) -> float:
+        row = self._conn.execute("SELECT value FROM stats WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0.0
+
+    def add(self, doc_ids: Iterable[str], texts: Iterable[str]):
+        """
+        Index documents; re-adding an existing doc_id replaces its postings and
+        its contribution to the corpus statistics.
+        """
+        batch: Dict[str, Counter] = {}
+        for doc_id, text in zip(doc_ids, texts):
+            batch[doc_id] = Counter(tokenize(text))
+        docs = [(doc_id, sum(counts.values())) for doc_id, counts in batch.items()]
+        postings = [(term, doc_id, tf) for doc_id, counts in batch.items() for term, tf in counts.items()]
+        with self._lock, self._conn:
+            replaced, replaced_len = [], 0
+            ids = list(batch)
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT doc_id, length FROM docs WHERE doc_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                replaced.extend(doc_id for doc_id, _ in rows)
+                replaced_len += sum(length for _, length in rows)
+            self._conn.executemany("DELETE FROM postings WHERE doc_id = ?", [(doc_id,) for doc_id in replaced])
+            self._conn.executemany("INSERT OR REPLACE INTO docs (doc_id, length) VALUES (?, ?)", docs)
+            self._conn.executemany("INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)", postings)
+            deltas = (("n_docs", len(docs) - len(replaced)),
+                      ("total_len", sum(length for _, length in docs) - replaced_len))
+            for key, delta in deltas:
+                self._conn.execute(
+                    "INSERT INTO stats (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                    (key, delta),
+                )
+        log.info("BM25 index updated", db=str(self.db_path), docs=len(docs), replaced=len(replaced),
+                 postings=len(postings))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Return up to k (doc_id, score) pairs, best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            n_docs = self._stat("n_docs")
+            if not n_docs:
+                return []
+            avg_len = self._stat("total_len") / n_docs
+            marks = ",".join("?" * len(terms))
+            rows = self._conn.execute(
+                f"SELECT p.term, p.doc_id, p.tf, d.length FROM postings p JOIN docs d ON d.doc_id = p.doc_id "
+                f"WHERE p.term IN ({marks})",
+                terms,
+            ).fetchall()
+
+        by_term: Dict[str, List[Tuple[str, int, int]]] = {}
+        for term, doc_id, tf, length in rows:
+            by_term.setdefault(term, []).append((doc_id, tf, length))
+
+        scores: Dict[str, float] = {}
+        for term, hits in by_term.items():
+            idf = math.log(1 + (n_docs - len(hits) + 0.5) / (len(hits) + 0.5))
+            for doc_id, tf, length in hits:
+                norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_len))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.executescript("DELETE FROM docs; DELETE FROM postings; DELETE FROM stats;")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._stat("n_docs"))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_SHARED: Dict[str, BM25Index] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_bm25_index(db_path: Path) -> BM25Index:
+    """
+    Process-wide BM25Index for ``db_path``, so the read path reuses one SQLite
+    connection per index instead of opening (and leaking) one per retriever.
+    """
+    key = str(Path(db_path).resolve())
+    with _SHARED_LOCK:
+        index = _SHARED.get(key)
+        if index is None:
+            index = _SHARED[key] = BM25Index(Path(key))
+        return index
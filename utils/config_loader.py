@@ -1,6 +1,12 @@
+from typing import Any, Dict
+
 import yaml
 
-def load_config(config_path: str = "config/config.yaml") -> dict:
+from logger import GLOBAL_LOGGER as log
+
+DEFAULT_CONFIG_PATH = "config/config.yaml"
+
+def load_config(config_path: str = DEFAULT_CONFIG_PATH) -> dict:
     """Load configuration from a YAML file.
 
     Args:
@@ -16,3 +22,17 @@ def load_config(config_path: str = "config/config.yaml") -> dict:
         
     return config
 
+
+
+def load_settings(section: str, defaults: Dict[str, Any], config_path: str = DEFAULT_CONFIG_PATH) -> Dict[str, Any]:
+    """``defaults`` overridden by the keys of one config.yaml section.
+
+    Unknown keys are ignored; if the file cannot be read the defaults are returned
+    and a warning is logged.
+    """
+    try:
+        cfg = load_config(config_path).get(section) or {}
+    except Exception as e:
+        log.warning("Falling back to default settings", section=section, error=str(e))
+        cfg = {}
+    return {key: cfg.get(key, default) for key, default in defaults.items()}
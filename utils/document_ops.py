@@ -1,32 +1,114 @@
 from __future__ import annotations
+import os
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Iterable, List
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from fastapi import UploadFile
 from langchain.schema import Document
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
 from logger import GLOBAL_LOGGER as log
 from exception.custom_exception import EnterpriseDocumentChatException
+from utils.config_loader import load_config
+from utils import document_parser
+from utils.pdf_text_cache import PDF_TEXT_CACHE
 
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
-def load_documents(paths: Iterable[Path]) -> List[Document]:
-    """Load docs using appropriate loader based on extension."""
-    docs: List[Document] = []
+_PARSE_POOL: Optional[ProcessPoolExecutor] = None
+_PARSE_POOL_LOCK = threading.Lock()
+
+
+def _parsing_config() -> dict:
     try:
-        for p in paths:
-            ext = p.suffix.lower()
-            if ext == ".pdf":
-                loader = PyPDFLoader(str(p))
-            elif ext == ".docx":
-                loader = Docx2txtLoader(str(p))
-            elif ext == ".txt":
-                loader = TextLoader(str(p), encoding="utf-8")
-            else:
-                log.warning("Unsupported extension skipped", path=str(p))
+        return load_config().get("document_parsing") or {}
+    except Exception:
+        return {}
+
+
+def _parse_pool(max_workers: int) -> ProcessPoolExecutor:
+    global _PARSE_POOL
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None:
+            # spawn: safe next to the server's threads, and workers import only utils.document_parser
+            _PARSE_POOL = ProcessPoolExecutor(max_workers=max_workers,
+                                              mp_context=multiprocessing.get_context("spawn"))
+        return _PARSE_POOL
+
+
+Task = Tuple[str, str, int, int]
+
+
+def _plan_tasks(paths: Iterable[Path], pages_per_task: int,
+                content_hashes: Optional[Dict[str, str]] = None) -> Tuple[List[Task], int, List[Dict[str, Any]]]:
+    """
+    Split files (and large PDFs into page ranges) into ordered parsing tasks.
+    PDFs whose text is already in PDF_TEXT_CACHE get no tasks; ``content_hashes``
+    (path -> sha256 recorded at upload) saves re-hashing them. Returns the tasks,
+    the number of pages to parse, and one plan entry per file in input order.
+    """
+    content_hashes = content_hashes or {}
+    tasks: List[Task] = []
+    total_pages = 0
+    plan: List[Dict[str, Any]] = []
+    for p in paths:
+        ext = p.suffix.lower()
+        if ext == ".pdf":
+            content_hash = content_hashes.get(str(p)) or PDF_TEXT_CACHE.file_hash(p)
+            cached = PDF_TEXT_CACHE.get(content_hash)
+            if cached is not None:
+                plan.append({"path": str(p), "cached": cached})
                 continue
-            docs.extend(loader.load())
-        log.info("Documents loaded", count=len(docs))
+            pages = document_parser.pdf_page_count(str(p))
+            total_pages += pages
+            first = len(tasks)
+            for start in range(0, pages, pages_per_task):
+                tasks.append(("pdf", str(p), start, start + pages_per_task))
+            plan.append({"path": str(p), "hash": content_hash, "tasks": range(first, len(tasks))})
+        elif ext in (".docx", ".txt"):
+            total_pages += 1
+            plan.append({"path": str(p), "tasks": range(len(tasks), len(tasks) + 1)})
+            tasks.append((ext[1:], str(p), 0, 0))
+        else:
+            log.warning("Unsupported extension skipped", path=str(p))
+    return tasks, total_pages, plan
+
+
+def load_documents(paths: Iterable[Path], content_hashes: Optional[Dict[str, str]] = None) -> List[Document]:
+    """Load docs (PyMuPDF for PDFs), fanning files and PDF page ranges out to a process pool.
+
+    Output order follows the input paths and page order regardless of worker scheduling.
+    """
+    try:
+        cfg = _parsing_config()
+        pages_per_task = max(1, int(cfg.get("pages_per_task", 16)))
+        inline_max_pages = int(cfg.get("inline_max_pages", 8))
+        max_workers = int(cfg.get("max_workers") or 0) or (os.cpu_count() or 1)
+
+        started = time.perf_counter()
+        tasks, total_pages, plan = _plan_tasks(paths, pages_per_task, content_hashes)
+        parallel = len(tasks) > 1 and total_pages > inline_max_pages and max_workers > 1
+        if parallel:
+            results = list(_parse_pool(max_workers).map(document_parser.run_task, tasks))
+        else:
+            results = [document_parser.run_task(t) for t in tasks]
+
+        docs: List[Document] = []
+        for entry in plan:
+            if "cached" in entry:
+                pages = entry["cached"]
+                parsed = [(text, {"source": entry["path"], "page": n, "total_pages": len(pages)})
+                          for n, text in enumerate(pages)]
+            else:
+                parsed = [page for i in entry["tasks"] for page in results[i]]
+                if "hash" in entry:
+                    PDF_TEXT_CACHE.put(entry["hash"], [text for text, _ in parsed])
+            docs.extend(Document(page_content=text, metadata=meta) for text, meta in parsed)
+        log.info("Documents loaded", count=len(docs), tasks=len(tasks), parallel=parallel,
+                 cached_files=sum("cached" in entry for entry in plan),
+                 seconds=round(time.perf_counter() - started, 3))
         return docs
     except Exception as e:
         log.error("Failed loading documents", error=str(e))
@@ -46,10 +128,13 @@ def concat_for_comparison(ref_docs: List[Document], act_docs: List[Document]) ->
 
 # ---------- Helpers ----------
 class FastAPIFileAdapter:
-    """Adapt FastAPI UploadFile -> .name + .getbuffer() API"""
+    """Adapt FastAPI UploadFile -> .name + .file (stream) + .getbuffer() API"""
     def __init__(self, uf: UploadFile):
         self._uf = uf
         self.name = uf.filename
+    @property
+    def file(self):
+        return self._uf.file
     def getbuffer(self) -> bytes:
         self._uf.file.seek(0)
         return self._uf.file.read()
@@ -0,0 +1,52 @@
+"""
+Parsing workers for utils.document_ops.load_documents.
+
+Kept free of logger/langchain imports on purpose: the functions here run inside
+spawned worker processes, which import only this module.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Tuple
+
+import fitz
+
+ParsedPage = Tuple[str, Dict[str, Any]]
+
+
+def pdf_page_count(path: str) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def parse_pdf_pages(path: str, start: int, stop: int) -> List[ParsedPage]:
+    """
+    Extract text for pages [start, stop) of a PDF with PyMuPDF.
+    """
+    out: List[ParsedPage] = []
+    with fitz.open(path) as doc:
+        total = doc.page_count
+        for page_num in range(start, min(stop, total)):
+            text = doc.load_page(page_num).get_text()
+            out.append((text, {"source": path, "page": page_num, "total_pages": total}))
+    return out
+
+
+def parse_docx(path: str) -> List[ParsedPage]:
+    import docx2txt
+    return [(docx2txt.process(path), {"source": path})]
+
+
+def parse_txt(path: str) -> List[ParsedPage]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [(f.read(), {"source": path})]
+
+
+def run_task(task: Tuple[str, str, int, int]) -> List[ParsedPage]:
+    """
+    Execute one (kind, path, start, stop) parsing task.
+    """
+    kind, path, start, stop = task
+    if kind == "pdf":
+        return parse_pdf_pages(path, start, stop)
+    if kind == "docx":
+        return parse_docx(path)
+    return parse_txt(path)
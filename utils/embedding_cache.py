@@ -0,0 +1,159 @@
+from __future__ import annotations
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from logger import GLOBAL_LOGGER as log
+
+DEFAULT_CACHE_PATH = "cache/embeddings.sqlite3"
+DEFAULT_MAX_ENTRIES = 200_000
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Disk-backed, content-addressed cache in front of an embedding model.
+
+    Document vectors are stored in SQLite keyed by (model name, sha256 of chunk text),
+    so identical chunks are embedded once across sessions and restarts. Query
+    embeddings use a different task type on some providers and are passed through.
+    The cache keeps at most ``max_entries`` vectors, evicting least-recently-used.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str,
+                 path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, underlying: Embeddings, config: dict) -> Embeddings:
+        """
+        Wrap ``underlying`` according to ``embedding_model.cache`` in config.yaml;
+        EMBEDDING_CACHE_PATH overrides the configured database path.
+        """
+        emb_cfg = config.get("embedding_model") or {}
+        cache_cfg = emb_cfg.get("cache") or {}
+        if not cache_cfg.get("enabled", True):
+            return underlying
+        return cls(
+            underlying,
+            model_name=emb_cfg.get("model_name", "unknown"),
+            path=os.getenv("EMBEDDING_CACHE_PATH") or cache_cfg.get("path", DEFAULT_CACHE_PATH),
+            max_entries=int(cache_cfg.get("max_entries", DEFAULT_MAX_ENTRIES)),
+        )
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(unique), 500):
+            part = unique[i:i + 500]
+            marks = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({marks})",
+                [self.model_name, *part],
+            ).fetchall()
+            for text_hash, blob in rows:
+                found[text_hash] = array("f", blob).tolist()
+        return found
+
+    def _store(self, items: Dict[str, List[float]], touched: List[str]):
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+            [(self.model_name, h, array("f", vec).tobytes(), now) for h, vec in items.items()],
+        )
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+            [(now, self.model_name, h) for h in touched],
+        )
+        self._evict()
+        self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            log.info("Embedding cache evicted entries", evicted=excess, max_entries=self.max_entries)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [self._hash(t) for t in texts]
+        with self._lock:
+            cached = self._lookup(hashes)
+
+        missing: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached and h not in missing:
+                missing[h] = t
+
+        fresh: Dict[str, List[float]] = {}
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            # Round through float32 so a vector is identical whether it was a hit or a miss
+            fresh = {h: array("f", v).tolist() for h, v in zip(missing.keys(), vectors)}
+
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+            self._store(fresh, list(cached.keys()))
+
+        log.info("Embedding cache lookup", requested=len(texts), hits=len(texts) - len(missing),
+                 misses=len(missing), model=self.model_name)
+        return [cached[h] if h in cached else fresh[h] for h in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            total = self.hits + self.misses
+            return {
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else None,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        close = getattr(self.underlying, "close", None)
+        if callable(close):
+            close()
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from logger import GLOBAL_LOGGER as log
+
+THROTTLE_MARKERS = ("429", "rate limit", "ratelimit", "resource exhausted", "resourceexhausted",
+                    "quota", "too many requests", "503", "unavailable")
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    """
+    Heuristic check for provider throttling / transient overload errors.
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status in (429, 503):
+        return True
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in THROTTLE_MARKERS)
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embedding stage that splits documents into fixed-size batches and sends them with
+    a bounded number of in-flight requests, retrying throttled batches with
+    exponential backoff and jitter. The in-flight bound is shared by all callers.
+    """
+
+    def __init__(self, underlying: Embeddings, batch_size: int = 100, max_concurrency: int = 4,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 30.0):
+        self.underlying = underlying
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, underlying: Embeddings, config: dict) -> "BatchedEmbeddings":
+        """
+        Build from the ``embedding_model`` block of config.yaml.
+        """
+        emb_cfg = config.get("embedding_model") or {}
+        return cls(
+            underlying,
+            batch_size=int(emb_cfg.get("batch_size", 100)),
+            max_concurrency=int(emb_cfg.get("max_concurrency", 4)),
+            max_retries=int(emb_cfg.get("max_retries", 5)),
+            backoff_base=float(emb_cfg.get("backoff_base_seconds", 1.0)),
+            backoff_max=float(emb_cfg.get("backoff_max_seconds", 30.0)),
+        )
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                    thread_name_prefix="embed")
+            return self._executor
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                return self.underlying.embed_documents(batch)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_throttling_error(e):
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                delay *= 0.5 + random.random() / 2
+                attempt += 1
+                log.warning("Embedding batch throttled, backing off", attempt=attempt,
+                            delay_seconds=round(delay, 2), batch_size=len(batch), error=str(e))
+                time.sleep(delay)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        started = time.perf_counter()
+        if len(batches) == 1:
+            results = [self._embed_batch(batches[0])]
+        else:
+            results = list(self._pool().map(self._embed_batch, batches))
+        log.info("Embedded documents", texts=len(texts), batches=len(batches),
+                 max_concurrency=self.max_concurrency,
+                 seconds=round(time.perf_counter() - started, 3))
+        return [vec for batch in results for vec in batch]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    def close(self):
+        """
+        Shut down the batch pool; batches already submitted still complete.
+        """
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        close = getattr(self.underlying, "close", None)
+        if callable(close):
+            close()
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import asyncio
+import functools
+import os
+import queue
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, TypeVar
+
+from utils.config_loader import load_settings
+
+T = TypeVar("T")
+
+
+DEFAULT_EXECUTOR_SETTINGS: Dict[str, Any] = {
+    "cpu_workers": 0,
+    "io_workers": 32,
+    "retrieval_workers": 16,
+    "speculation_workers": 8,
+    "federated_workers": 16,
+    "compare_workers": 4,
+    "analysis_map_workers": 4,
+}
+
+_settings = load_settings("executors", DEFAULT_EXECUTOR_SETTINGS)
+
+
+def _pool(key: str, thread_name_prefix: str) -> ThreadPoolExecutor:
+    # 0 (or unset) means the default size; the CPU pool's default is one worker per CPU
+    workers = int(_settings[key] or 0) or int(DEFAULT_EXECUTOR_SETTINGS[key]) or (os.cpu_count() or 1)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix)
+
+
+# Parsing, text extraction and FAISS (de)serialization: sized to the CPU count
+CPU_EXECUTOR = _pool("cpu_workers", "cpu")
+# LLM / embedding calls and upload copies: mostly waiting on the network or disk
+IO_EXECUTOR = _pool("io_workers", "io")
+
+# Pools used from inside work already running on the executors above; kept separate
+# so nested submits cannot deadlock on a saturated parent pool.
+# Vector leg of hybrid retrieval, run next to the BM25 leg
+RETRIEVAL_EXECUTOR = _pool("retrieval_workers", "retrieval")
+# Raw-question retrieval that runs while the LLM rewrites a follow-up question
+SPECULATION_EXECUTOR = _pool("speculation_workers", "speculative-retrieval")
+# Per-session searches and index loads of federated retrieval
+FEDERATED_EXECUTOR = _pool("federated_workers", "federated-search")
+# Concurrent comparison LLM calls (one per window of changed pages)
+COMPARE_EXECUTOR = _pool("compare_workers", "compare-window")
+# Concurrent map-step LLM calls of large-document analysis
+ANALYSIS_MAP_EXECUTOR = _pool("analysis_map_workers", "analysis-map")
+
+
+async def run_cpu(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run CPU-bound blocking work off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(CPU_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+
+async def run_io(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run I/O-bound blocking work (LLM calls, disk copies) off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(IO_EXECUTOR, functools.partial(fn, *args, **kwargs))
+
+
+_DONE = object()
+
+
+def iterate_on(executor: Executor, fn: Callable[..., Iterator[T]], *args: Any,
+               buffer: int = 8, **kwargs: Any) -> Iterator[T]:
+    """
+    Run the generator ``fn(*args, **kwargs)`` on ``executor`` and yield its items
+    to the calling thread through a queue of at most ``buffer`` items, so the
+    producer and the consumer overlap. Closing the returned iterator stops the
+    producer; an exception raised by the producer is re-raised to the consumer.
+    """
+    items: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, buffer))
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in fn(*args, **kwargs):
+                if not put(item):
+                    return
+        except BaseException as e:
+            put(e)
+            return
+        put(_DONE)
+
+    def consume() -> Iterator[T]:
+        future = executor.submit(produce)
+        try:
+            while True:
+                item = items.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            future.cancel()
+
+    return consume()
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import math
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from utils.config_loader import load_config, load_settings
+from logger import GLOBAL_LOGGER as log
+
+# Memory-map the index data instead of copying it into the process (flat codes,
+# HNSW storage and IVF inverted lists); the mapping is read-only.
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+
+INDEX_TYPES = ("Flat", "IVFFlat", "IVFPQ", "HNSW")
+
+DEFAULT_INDEX_SETTINGS: Dict[str, Any] = {
+    "index_type": "Flat",
+    "min_vectors_for_ann": 10000,
+    "ivf_nlist": 0,
+    "pq_m": 16,
+    "pq_nbits": 8,
+    "hnsw_m": 32,
+    "hnsw_ef_construction": 200,
+    "nprobe": 16,
+    "ef_search": 64,
+}
+
+
+def index_settings() -> Dict[str, Any]:
+    """Index factory and search settings from the faiss_db section of config.yaml."""
+    settings = load_settings("faiss_db", DEFAULT_INDEX_SETTINGS)
+    if settings["index_type"] not in INDEX_TYPES:
+        raise ValueError(f"Unsupported faiss_db.index_type {settings['index_type']!r}; expected one of {INDEX_TYPES}")
+    return settings
+
+
+def factory_string(n_vectors: int, dim: int, settings: Dict[str, Any]) -> str:
+    """
+    faiss.index_factory description for ``n_vectors`` of size ``dim``. Falls back to
+    Flat below min_vectors_for_ann, where exact search is cheap and IVF/PQ training
+    would be unreliable.
+    """
+    index_type = settings["index_type"]
+    if index_type == "Flat" or n_vectors < settings["min_vectors_for_ann"]:
+        return "Flat"
+    if index_type == "HNSW":
+        return f"HNSW{settings['hnsw_m']}"
+    # ~4*sqrt(n) lists, keeping the ~39 training points per centroid faiss asks for
+    nlist = settings["ivf_nlist"] or int(4 * math.sqrt(n_vectors))
+    nlist = max(1, min(nlist, n_vectors // 39))
+    if index_type == "IVFFlat":
+        return f"IVF{nlist},Flat"
+    pq_m = math.gcd(dim, int(settings["pq_m"])) or 1
+    return f"IVF{nlist},PQ{pq_m}x{settings['pq_nbits']}"
+
+
+def build_index(vectors: np.ndarray, settings: Optional[Dict[str, Any]] = None) -> faiss.Index:
+    """
+    Create (and train, if needed) an empty L2 index suited to ``vectors``.
+    """
+    settings = settings or index_settings()
+    n_vectors, dim = vectors.shape
+    description = factory_string(n_vectors, dim, settings)
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    if description.startswith("HNSW"):
+        index.hnsw.efConstruction = int(settings["hnsw_ef_construction"])
+    if not index.is_trained:
+        index.train(vectors)
+    apply_search_params(index, settings)
+    log.info("FAISS index created", factory=description, vectors=n_vectors, dim=dim)
+    return index
+
+
+def apply_search_params(index: faiss.Index, settings: Optional[Dict[str, Any]] = None):
+    """Set nprobe (IVF) / efSearch (HNSW) on a loaded or freshly built index."""
+    settings = settings or index_settings()
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = int(settings["nprobe"])
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = int(settings["ef_search"])
+
+
+def is_flat(index: faiss.Index) -> bool:
+    return isinstance(index, faiss.IndexFlat)
+
+
+def mmap_default() -> bool:
+    """Whether read-only index loads should be memory-mapped (faiss_db.mmap)."""
+    try:
+        return bool((load_config().get("faiss_db") or {}).get("mmap", True))
+    except Exception as e:
+        log.warning("Falling back to non-mmap FAISS loads", error=str(e))
+        return False
+
+
+def load_vectorstore(index_dir: Union[str, Path], embeddings, index_name: str = "index", mmap: bool = False) -> FAISS:
+    """
+    Load a LangChain FAISS store saved with save_local().
+
+    With ``mmap=True`` the index is mapped read-only, so pages are shared through the
+    OS page cache across workers and opening is near-instant. Such a store must not
+    be written to: FAISS aborts the process when adding to a mapped index.
+    """
+    index_dir = Path(index_dir)
+    index = faiss.read_index(str(index_dir / f"{index_name}.faiss"), MMAP_FLAGS if mmap else 0)
+    if not is_flat(index):
+        apply_search_params(index)
+    with open(index_dir / f"{index_name}.pkl", "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def save_vectorstore(vs: FAISS, index_dir: Union[str, Path], index_name: str = "index"):
+    """
+    Save atomically: write to a temp dir next to the index, then rename over the old
+    files. Readers that memory-mapped the previous file keep a valid mapping, and the
+    docstore is swapped before the index so a reader never sees ids without documents.
+    """
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=index_dir, prefix=".tmp_save_") as tmp:
+        vs.save_local(tmp, index_name=index_name)
+        for ext in (".pkl", ".faiss"):
+            os.replace(os.path.join(tmp, f"{index_name}{ext}"), index_dir / f"{index_name}{ext}")
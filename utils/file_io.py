@@ -1,14 +1,17 @@
 from __future__ import annotations
 import re
 import uuid
+import hashlib
 from pathlib import Path
 from datetime import datetime
 from zoneinfo import ZoneInfo
 import uuid
-from typing import Iterable, List
+from typing import Iterable, List, Tuple, Union
 from logger import GLOBAL_LOGGER as log
+from exception.custom_exception import EnterpriseDocumentChatException
 
 SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt"}
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes held in memory per upload while copying
 
 # ----------------------------- #
 # Helpers (file I/O + loading)  #
@@ -17,11 +20,45 @@ def generate_session_id(prefix: str = "session") -> str:
     ist = ZoneInfo("Asia/Kolkata")
     return f"{prefix}_{datetime.now(ist).strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
 
+def persist_upload(uploaded_file, out_path: Union[str, Path], chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """Stream an uploaded file to disk in bounded chunks and return its SHA-256 hex digest.
+
+    Accepts objects exposing a binary ``.file`` stream (FastAPI UploadFile / FastAPIFileAdapter),
+    a ``.read()`` method, or, as a fallback, ``.getbuffer()``.
+    """
+    sha = hashlib.sha256()
+    stream = getattr(uploaded_file, "file", None)
+    if stream is None and hasattr(uploaded_file, "read"):
+        stream = uploaded_file
+    with open(out_path, "wb") as f:
+        if stream is not None:
+            if hasattr(stream, "seek"):
+                try:
+                    stream.seek(0)
+                except Exception:
+                    pass  # non-seekable streams are read from their current position
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                f.write(chunk)
+        else:
+            view = memoryview(uploaded_file.getbuffer())
+            for i in range(0, len(view), chunk_size):
+                sha.update(view[i:i + chunk_size])
+                f.write(view[i:i + chunk_size])
+    return sha.hexdigest()
+
 def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path]:
     """Save uploaded files (Streamlit-like) and return local paths."""
+    return [path for path, _ in persist_uploads(uploaded_files, target_dir)]
+
+def persist_uploads(uploaded_files: Iterable, target_dir: Path) -> List[Tuple[Path, str]]:
+    """Stream uploaded files to target_dir and return (local path, sha256) pairs."""
     try:
         target_dir.mkdir(parents=True, exist_ok=True)
-        saved: List[Path] = []
+        saved: List[Tuple[Path, str]] = []
         for uf in uploaded_files:
             name = getattr(uf, "name", "file")
             ext = Path(name).suffix.lower()
@@ -33,14 +70,10 @@ def save_uploaded_files(uploaded_files: Iterable, target_dir: Path) -> List[Path
             fname = f"{safe_name}_{uuid.uuid4().hex[:6]}{ext}"
             fname = f"{uuid.uuid4().hex[:8]}{ext}"
             out = target_dir / fname
-            with open(out, "wb") as f:
-                if hasattr(uf, "read"):
-                    f.write(uf.read())
-                else:
-                    f.write(uf.getbuffer())  # fallback
-            saved.append(out)
-            log.info("File saved for ingestion", uploaded=name, saved_as=str(out))
+            sha256 = persist_upload(uf, out)
+            saved.append((out, sha256))
+            log.info("File saved for ingestion", uploaded=name, saved_as=str(out), sha256=sha256)
         return saved
     except Exception as e:
         log.error("Failed to save uploaded files", error=str(e), dir=str(target_dir))
-        raise DocumentPortalException("Failed to save uploaded files", e) from e
\ No newline at end of file
+        raise EnterpriseDocumentChatException("Failed to save uploaded files", e) from e
\ No newline at end of file
@@ -0,0 +1,53 @@
+from __future__ import annotations
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Set
+
+
+class FingerprintStore:
+    """
+    Indexed, crash-safe set of ingested chunk fingerprints for one FAISS index.
+
+    Backed by SQLite in WAL mode: inserts cost O(batch) and commit atomically, and
+    membership checks go through the primary-key index.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS fingerprints (key TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._conn.commit()
+
+    def contains_many(self, keys: Iterable[str]) -> Set[str]:
+        """
+        Return the subset of keys already recorded.
+        """
+        unique = list(dict.fromkeys(keys))
+        found: Set[str] = set()
+        with self._lock:
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(f"SELECT key FROM fingerprints WHERE key IN ({marks})", part)
+                found.update(r[0] for r in rows)
+        return found
+
+    def add_many(self, keys: Iterable[str]):
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO fingerprints (key) VALUES (?)", ((k,) for k in keys))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM fingerprints")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
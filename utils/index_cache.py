@@ -0,0 +1,156 @@
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from utils.config_loader import load_config
+from utils.faiss_io import load_vectorstore, mmap_default
+from logger import GLOBAL_LOGGER as log
+
+DEFAULT_CACHE_MAX_MB = 1024
+
+Signature = Tuple[Tuple[int, int], ...]
+CacheKey = Tuple[str, str, bool]
+
+
+class VectorStoreCache:
+    """
+    Process-wide LRU cache of loaded FAISS vector stores keyed by index directory,
+    index name and load mode (memory-mapped or in memory).
+
+    Entries are sized by the on-disk footprint of ``<index_name>.pkl`` plus, unless the
+    index is memory-mapped (shared page cache, not process memory), ``<index_name>.faiss``,
+    and evicted least-recently-used once the total exceeds ``max_bytes``. An entry is
+    reloaded whenever the files' mtime/size change. Cached stores are read-only.
+    """
+
+    def __init__(self, max_bytes: int, mmap: bool = False):
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        self._entries: "OrderedDict[CacheKey, Tuple[Signature, int, FAISS]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        # key -> [lock, holders]; only kept while a load of that key is in flight
+        self._key_locks: Dict[CacheKey, List] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(index_dir: str, index_name: str, mmap: bool) -> CacheKey:
+        return str(Path(index_dir).resolve()), index_name, bool(mmap)
+
+    @staticmethod
+    def _signature(index_dir: str, index_name: str) -> Signature:
+        sig = []
+        for ext in (".faiss", ".pkl"):
+            st = os.stat(os.path.join(index_dir, f"{index_name}{ext}"))
+            sig.append((st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+    @contextmanager
+    def _key_lock(self, key: CacheKey) -> Iterator[None]:
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+    def _lookup(self, key: CacheKey, sig: Signature) -> Optional[FAISS]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != sig:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def get(self, index_dir: str, embeddings, index_name: str = "index", mmap: Optional[bool] = None) -> FAISS:
+        """
+        Return the vector store for ``index_dir``, loading it from disk on a miss.
+        """
+        mmap = self.mmap if mmap is None else mmap
+        key = self._key(index_dir, index_name, mmap)
+        sig = self._signature(index_dir, index_name)
+        vs = self._lookup(key, sig)
+        if vs is not None:
+            return vs
+
+        # Serialize loads of the same index so concurrent misses unpickle it once.
+        with self._key_lock(key):
+            sig = self._signature(index_dir, index_name)
+            vs = self._lookup(key, sig)
+            if vs is not None:
+                return vs
+
+            vs = load_vectorstore(index_dir, embeddings, index_name=index_name, mmap=mmap)
+            faiss_size, pkl_size = sig[0][1], sig[1][1]
+            size = pkl_size if mmap else faiss_size + pkl_size
+            with self._lock:
+                self.misses += 1
+                self._drop(key)
+                self._entries[key] = (sig, size, vs)
+                self._total_bytes += size
+                self._evict()
+            log.info("FAISS index loaded into cache", index_dir=key[0], index_name=index_name,
+                     size_bytes=size, mmap=mmap, cached_bytes=self._total_bytes, entries=len(self._entries))
+            return vs
+
+    def _drop(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def _evict(self):
+        # Always keep the most recently inserted entry, even if it alone exceeds the budget.
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, (_, size, _) = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            log.info("FAISS index evicted from cache", index_dir=key[0], index_name=key[1], size_bytes=size)
+
+    def invalidate(self, index_dir: Optional[str] = None, index_name: str = "index"):
+        """
+        Drop one cached index, or every cached index when ``index_dir`` is None.
+        """
+        with self._lock:
+            if index_dir is None:
+                self._entries.clear()
+                self._total_bytes = 0
+            else:
+                for mmap in (False, True):
+                    self._drop(self._key(index_dir, index_name, mmap))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def _cache_max_bytes() -> int:
+    max_mb = os.getenv("FAISS_CACHE_MAX_MB")
+    if max_mb is None:
+        try:
+            max_mb = (load_config().get("faiss_db") or {}).get("cache_max_mb", DEFAULT_CACHE_MAX_MB)
+        except Exception as e:
+            log.warning("Falling back to default FAISS cache size", error=str(e))
+            max_mb = DEFAULT_CACHE_MAX_MB
+    return int(float(max_mb) * 1024 * 1024)
+
+
+# Shared by every request handled in this process
+VECTORSTORE_CACHE = VectorStoreCache(max_bytes=_cache_max_bytes(), mmap=mmap_default())
@@ -1,8 +1,14 @@
 import os
 import sys
 import json
+import asyncio
+import threading
+from typing import Dict, Optional
+import httpx
 from dotenv import load_dotenv
-from utils.config_loader import load_config
+from utils.config_loader import load_config, DEFAULT_CONFIG_PATH
+from utils.embedding_cache import CachedEmbeddings
+from utils.embedding_pipeline import BatchedEmbeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
 from logger import GLOBAL_LOGGER as log
@@ -55,7 +61,9 @@ class ModelLoader:
     Loads embedding models and LLMs based on config and environment.
     """
 
-    def __init__(self):
+    def __init__(self, config_path: str = DEFAULT_CONFIG_PATH,
+                 http_client: Optional[httpx.Client] = None,
+                 http_async_client: Optional[httpx.AsyncClient] = None):
         if os.getenv("ENV", "local").lower() != "production":
             load_dotenv()
             log.info("Running in LOCAL mode: .env loaded")
@@ -63,7 +71,9 @@ class ModelLoader:
             log.info("Running in PRODUCTION mode")
 
         self.api_key_mgr = ApiKeyManager()
-        self.config = load_config()
+        self.config = load_config(config_path)
+        self.http_client = http_client
+        self.http_async_client = http_async_client
         log.info("YAML config loaded", config_keys=list(self.config.keys()))
 
     def load_embedding_model(self):
@@ -79,12 +89,12 @@ class ModelLoader:
             log.error("Error loading embedding model", error=str(e))
             raise EnterpriseDocumentChatException("Failed to load embedding model", sys)
 
-    def load_llm(self):
+    def load_llm(self, provider_key: Optional[str] = None):
         """
         Load and return the configured LLM model.
         """
         llm_block = self.config["llm"]
-        provider_key = os.getenv("LLM_PROVIDER", "groq")
+        provider_key = provider_key or os.getenv("LLM_PROVIDER", "groq")
 
         if provider_key not in llm_block:
             log.error("LLM provider not found in config", provider=provider_key)
@@ -111,6 +121,8 @@ class ModelLoader:
                 model=model_name,
                 api_key=self.api_key_mgr.get("GROQ_API_KEY"), #type: ignore
                 temperature=temperature,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
             )
 
         # elif provider == "openai":
@@ -126,6 +138,139 @@ class ModelLoader:
             raise ValueError(f"Unsupported LLM provider: {provider}")
 
 
+def _close_clients(loader: ModelLoader, embeddings) -> None:
+    """
+    Close the pooled clients of a replaced registry generation.
+    """
+    try:
+        if embeddings is not None and callable(getattr(embeddings, "close", None)):
+            embeddings.close()
+        if loader.http_client is not None:
+            loader.http_client.close()
+        if loader.http_async_client is not None:
+            try:
+                asyncio.get_running_loop().create_task(loader.http_async_client.aclose())
+            except RuntimeError:
+                asyncio.run(loader.http_async_client.aclose())
+        log.info("Retired model clients closed")
+    except Exception as e:
+        log.warning("Failed to close retired model clients", error=str(e))
+
+
+class ModelRegistry:
+    """
+    Process-level registry that builds the ModelLoader, each configured LLM and the
+    embedding client once and hands out the same instances to every caller.
+
+    HTTP-based clients share pooled keep-alive httpx connections; Google clients keep
+    their own gRPC channel alive for as long as the instance is reused. The registry
+    rebuilds everything when the config file or LLM_PROVIDER changes, or on reload().
+    Replaced httpx pools, embedding workers and cache connections are closed after
+    ``http_client.retire_grace_seconds`` so in-flight calls can finish first.
+    """
+
+    def __init__(self, config_path: str = DEFAULT_CONFIG_PATH):
+        self.config_path = config_path
+        self._lock = threading.RLock()
+        self._loader: Optional[ModelLoader] = None
+        self._llms: Dict[str, object] = {}
+        self._embeddings = None
+        self._signature = None
+
+    def _current_signature(self):
+        try:
+            st = os.stat(self.config_path)
+            file_sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            file_sig = None
+        return file_sig, os.getenv("LLM_PROVIDER", "groq")
+
+    def _http_clients(self, config: dict):
+        http_cfg = config.get("http_client") or {}
+        limits = httpx.Limits(
+            max_connections=http_cfg.get("max_connections", 100),
+            max_keepalive_connections=http_cfg.get("max_keepalive_connections", 20),
+            keepalive_expiry=http_cfg.get("keepalive_expiry", 30.0),
+        )
+        timeout = httpx.Timeout(http_cfg.get("timeout", 120.0))
+        return (httpx.Client(limits=limits, timeout=timeout),
+                httpx.AsyncClient(limits=limits, timeout=timeout))
+
+    def _ensure_current(self):
+        signature = self._current_signature()
+        if self._loader is not None and signature == self._signature:
+            return
+        if self._loader is not None:
+            log.info("Model config changed, rebuilding model registry", config_path=self.config_path)
+            self._retire()
+        config = load_config(self.config_path)
+        http_client, http_async_client = self._http_clients(config)
+        self._loader = ModelLoader(self.config_path, http_client=http_client,
+                                   http_async_client=http_async_client)
+        self._llms = {}
+        self._embeddings = None
+        self._signature = signature
+
+    def _retire(self):
+        # In-flight requests keep their references to the old clients; close them
+        # after a grace period so those calls can finish first.
+        if self._loader is None:
+            return
+        loader, embeddings = self._loader, self._embeddings
+        http_cfg = loader.config.get("http_client") or {}
+        grace = float(http_cfg.get("retire_grace_seconds", http_cfg.get("timeout", 120.0)))
+        if grace <= 0:
+            _close_clients(loader, embeddings)
+            return
+        timer = threading.Timer(grace, _close_clients, args=(loader, embeddings))
+        timer.daemon = True
+        timer.start()
+
+    def loader(self) -> ModelLoader:
+        with self._lock:
+            self._ensure_current()
+            return self._loader
+
+    def llm(self, provider_key: Optional[str] = None):
+        """
+        Return the shared LLM client for provider_key (defaults to LLM_PROVIDER).
+        """
+        with self._lock:
+            self._ensure_current()
+            key = provider_key or os.getenv("LLM_PROVIDER", "groq")
+            if key not in self._llms:
+                self._llms[key] = self._loader.load_llm(key)
+            return self._llms[key]
+
+    def embeddings(self):
+        """
+        Return the shared embedding client: persistent cache -> batched/concurrent
+        pipeline -> provider client.
+        """
+        with self._lock:
+            self._ensure_current()
+            if self._embeddings is None:
+                config = self._loader.config
+                pipeline = BatchedEmbeddings.from_config(self._loader.load_embedding_model(), config)
+                self._embeddings = CachedEmbeddings.from_config(pipeline, config)
+            return self._embeddings
+
+    def reload(self):
+        """
+        Drop every cached client so the next call rebuilds from the current config.
+        """
+        with self._lock:
+            self._retire()
+            self._loader = None
+            self._llms = {}
+            self._embeddings = None
+            self._signature = None
+        log.info("Model registry reset", config_path=self.config_path)
+
+
+MODEL_REGISTRY = ModelRegistry()
+
+
 # if __name__ == "__main__":
 #     loader = ModelLoader()
 
@@ -0,0 +1,214 @@
+from __future__ import annotations
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import fitz
+
+from utils.config_loader import load_settings
+from utils.metrics import METRICS
+from logger import GLOBAL_LOGGER as log
+
+# Bump the suffix whenever extraction output changes, so stale text is never served
+EXTRACTOR_VERSION = f"pymupdf-{fitz.VersionBind}-1"
+
+DEFAULT_TEXT_CACHE_SETTINGS: Dict[str, Any] = {
+    "enabled": True,
+    "cache_dir": "data/pdf_text_cache",
+    "max_mb": 512,
+    "max_age_days": 30,
+    "evict_interval_seconds": 600,
+}
+
+_MAGIC = b"PTC1"
+_HITS = METRICS.counter("pdf_text_cache_hits_total", "PDF text extractions served from the cache")
+_MISSES = METRICS.counter("pdf_text_cache_misses_total", "PDF text extractions that had to parse the file")
+
+PathLike = Union[str, Path]
+
+
+def text_cache_settings() -> Dict[str, Any]:
+    """PDF text cache settings from the pdf_text_cache section of config.yaml."""
+    return load_settings("pdf_text_cache", DEFAULT_TEXT_CACHE_SETTINGS)
+
+
+def encode_pages(pages: List[str]) -> bytes:
+    """zlib-compressed: page count, per-page byte lengths, then the UTF-8 text."""
+    blobs = [p.encode("utf-8") for p in pages]
+    header = struct.pack(f"<I{len(blobs)}I", len(blobs), *(len(b) for b in blobs))
+    return _MAGIC + zlib.compress(header + b"".join(blobs), 6)
+
+
+def decode_pages(data: bytes) -> List[str]:
+    if data[:4] != _MAGIC:
+        raise ValueError("Not a PDF text cache entry")
+    raw = zlib.decompress(data[4:])
+    (count,) = struct.unpack_from("<I", raw)
+    lengths = struct.unpack_from(f"<{count}I", raw, 4)
+    pages, offset = [], 4 + 4 * count
+    for length in lengths:
+        pages.append(raw[offset:offset + length].decode("utf-8"))
+        offset += length
+    return pages
+
+
+def _open_pdf(path: PathLike) -> "fitz.Document":
+    doc = fitz.open(path)
+    if doc.is_encrypted:
+        doc.close()
+        raise ValueError(f"Encrypted PDFs {Path(path).name} are not supported.")
+    return doc
+
+
+def extract_pages(path: PathLike) -> List[str]:
+    """Text of every page of a PDF (empty pages included, in order); rejects encrypted PDFs."""
+    with _open_pdf(path) as doc:
+        return [doc.load_page(i).get_text() for i in range(doc.page_count)]
+
+
+class PdfTextCache:
+    """
+    Content-addressed on-disk cache of per-page PDF text.
+
+    Entries are keyed by the file's SHA-256 and EXTRACTOR_VERSION, so renamed or
+    re-uploaded copies of a document share one entry and an extractor upgrade
+    misses cleanly. Entries unused for ``max_age_days`` are dropped, then the least
+    recently used ones until the cache fits in ``max_mb``. The directory is only
+    scanned for eviction when the running size estimate exceeds ``max_mb`` or
+    ``evict_interval_seconds`` have passed since the last scan.
+    """
+
+    def __init__(self, cache_dir: PathLike, max_mb: float = 512, max_age_days: float = 30, enabled: bool = True,
+                 evict_interval_seconds: float = 600):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self.max_age_seconds = float(max_age_days) * 86400
+        self.enabled = bool(enabled)
+        self.evict_interval_seconds = float(evict_interval_seconds)
+        self._lock = threading.Lock()
+        self._cached_bytes: Optional[int] = None  # estimate since the last scan; None = unknown
+        self._last_evict = 0.0
+        # (path, mtime_ns, size) -> sha256, so unchanged files are not re-hashed
+        self._hashes: Dict[Tuple[str, int, int], str] = {}
+
+    @classmethod
+    def from_config(cls) -> "PdfTextCache":
+        return cls(**text_cache_settings())
+
+    def file_hash(self, path: PathLike) -> str:
+        st = os.stat(path)
+        key = (str(Path(path).resolve()), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._hashes.get(key)
+        if cached:
+            return cached
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(block)
+        digest = h.hexdigest()
+        with self._lock:
+            self._hashes[key] = digest
+        return digest
+
+    def _entry_path(self, content_hash: str) -> Path:
+        version = hashlib.sha256(EXTRACTOR_VERSION.encode()).hexdigest()[:8]
+        return self.cache_dir / content_hash[:2] / f"{content_hash}.{version}.ptc"
+
+    def get(self, content_hash: str) -> Optional[List[str]]:
+        if not self.enabled:
+            return None
+        entry = self._entry_path(content_hash)
+        try:
+            pages = decode_pages(entry.read_bytes())
+        except FileNotFoundError:
+            _MISSES.inc()
+            return None
+        except Exception as e:
+            log.warning("Discarding unreadable PDF text cache entry", path=str(entry), error=str(e))
+            entry.unlink(missing_ok=True)
+            _MISSES.inc()
+            return None
+        os.utime(entry)  # recency for LRU eviction
+        _HITS.inc()
+        return pages
+
+    def put(self, content_hash: str, pages: List[str]):
+        if not self.enabled:
+            return
+        entry = self._entry_path(content_hash)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        data = encode_pages(pages)
+        fd, tmp = tempfile.mkstemp(dir=entry.parent, prefix=".tmp_")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, entry)
+        with self._lock:
+            if self._cached_bytes is not None:
+                self._cached_bytes += len(data)
+            due = (self._cached_bytes is None or self._cached_bytes > self.max_bytes
+                   or time.time() - self._last_evict >= self.evict_interval_seconds)
+        if due:
+            self.evict()
+
+    def pages(self, path: PathLike, content_hash: Optional[str] = None) -> List[str]:
+        """
+        Per-page text of ``path``, parsing it only on a cache miss.
+        """
+        content_hash = content_hash or self.file_hash(path)
+        pages = self.get(content_hash)
+        if pages is None:
+            pages = extract_pages(path)
+            self.put(content_hash, pages)
+        return pages
+
+    def iter_pages(self, path: PathLike, content_hash: Optional[str] = None) -> Iterator[str]:
+        """
+        Yield page text one page at a time; on a miss pages are yielded as they are
+        extracted and the document is cached once fully read.
+        """
+        content_hash = content_hash or self.file_hash(path)
+        pages = self.get(content_hash)
+        if pages is not None:
+            yield from pages
+            return
+        extracted: List[str] = []
+        with _open_pdf(path) as doc:
+            for i in range(doc.page_count):
+                text = doc.load_page(i).get_text()
+                extracted.append(text)
+                yield text
+        self.put(content_hash, extracted)
+
+    def evict(self):
+        now = time.time()
+        entries = []
+        for entry in self.cache_dir.glob("*/*.ptc"):
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, entry in entries:
+            if now - mtime <= self.max_age_seconds and total <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        with self._lock:
+            self._cached_bytes, self._last_evict = total, now
+        if removed:
+            log.info("PDF text cache evicted", entries=removed, cached_bytes=total)
+
+
+# Shared by analysis, comparison and chat ingestion
+PDF_TEXT_CACHE = PdfTextCache.from_config()
@@ -0,0 +1,224 @@
+from __future__ import annotations
+import json
+import re
+import time
+from typing import Any, Dict, Optional, Tuple, Type
+
+from langchain.output_parsers import OutputFixingParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from pydantic import BaseModel, RootModel, create_model
+
+from utils.config_loader import load_settings
+from utils.metrics import METRICS
+from logger import GLOBAL_LOGGER as log
+
+DEFAULT_STRUCTURED_OUTPUT_SETTINGS: Dict[str, Any] = {
+    "native": True,
+    "local_repair": True,
+    "llm_fix": True,
+}
+
+# Paths: native | native_repaired | native_fallback | json | repaired | llm_fix | failed
+_CALLS = METRICS.counter("structured_output_total", "Structured LLM outputs by component and parse path")
+_SECONDS = METRICS.histogram("structured_output_seconds", "Structured LLM call latency by component and parse path")
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def structured_output_settings() -> Dict[str, Any]:
+    """Parse-path settings from the structured_output section of config.yaml."""
+    return load_settings("structured_output", DEFAULT_STRUCTURED_OUTPUT_SETTINGS)
+
+
+def repair_json(text: str) -> str:
+    """
+    Best-effort local fix-up of model JSON: takes the fenced block or the first
+    object/array, drops surrounding prose and trailing commas, and closes an
+    unterminated string and any brackets left open by a truncated reply.
+    """
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError("No JSON object or array found")
+    text = text[min(starts):]
+
+    closers, in_string, escaped, end = [], False, False, len(text)
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]" and closers and closers[-1] == ch:
+            closers.pop()
+            if not closers:
+                end = i + 1
+                break
+    text = text[:end]
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",") + "".join(reversed(closers))
+    return _TRAILING_COMMA_RE.sub(r"\1", text)
+
+
+def _message_text(message: Any) -> str:
+    content = getattr(message, "content", message)
+    if isinstance(content, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+    return content or ""
+
+
+class StructuredOutputChain:
+    """
+    ``prompt | llm`` parsed into ``schema`` through the cheapest path that works.
+
+    Providers with native structured output (``with_structured_output``) are used
+    first; a native reply that fails validation is repaired locally from its
+    tool-call arguments or text, then by OutputFixingParser. The prompt is only
+    sent again as plain text when the native call itself raises. Without native
+    support the reply text is parsed
+    as JSON, then repaired locally, and only then handed to OutputFixingParser,
+    which costs another LLM call. The format instructions put into
+    ``instructions_key`` always describe the schema actually bound. Every call is
+    counted and timed per path in METRICS under ``component``.
+    """
+
+    def __init__(self, prompt, llm, schema: Type[BaseModel], component: str,
+                 instructions_key: str = "format_instructions", settings: Optional[Dict[str, Any]] = None):
+        self.component = component
+        self.llm = llm
+        self.instructions_key = instructions_key
+        self.settings = settings or structured_output_settings()
+        self.schema = schema
+        self.is_list = issubclass(schema, RootModel)
+        self.parser = JsonOutputParser(pydantic_object=schema)
+        self.fixing_parser = OutputFixingParser.from_llm(parser=self.parser, llm=llm)
+        self.text_chain = prompt | llm
+        self.native_chain, self.native_parser = None, None
+        if self.settings["native"]:
+            self._bind_native(prompt, llm)
+
+    def _bind_native(self, prompt, llm):
+        target = self.schema
+        if self.is_list:
+            # Tool/JSON-schema modes need an object at the top level
+            target = create_model(f"{self.schema.__name__}Rows",
+                                  rows=(self.schema.model_fields["root"].annotation, ...))
+        try:
+            self.native_chain = prompt | llm.with_structured_output(target, include_raw=True)
+        except (AttributeError, NotImplementedError) as e:
+            log.info("Native structured output unavailable", component=self.component, reason=str(e))
+            return
+        self.native_parser = JsonOutputParser(pydantic_object=target)
+
+    def format_instructions(self) -> str:
+        return (self.native_parser or self.parser).get_format_instructions()
+
+    def _shaped(self, value: Any) -> Any:
+        if self.is_list and isinstance(value, dict) and len(value) == 1:
+            value = next(iter(value.values()))
+        if not isinstance(value, list if self.is_list else dict):
+            raise ValueError(f"Expected a JSON {'array' if self.is_list else 'object'}")
+        return value
+
+    def _repaired(self, text: str) -> Any:
+        return self._shaped(json.loads(repair_json(text)))
+
+    def _parse_text(self, text: str) -> Tuple[Any, str]:
+        try:
+            return self._shaped(self.parser.parse(text)), "json"
+        except ValueError:
+            pass
+        if self.settings["local_repair"]:
+            try:
+                return self._repaired(text), "repaired"
+            except ValueError:
+                pass
+        if self.settings["llm_fix"]:
+            return self._shaped(self.fixing_parser.parse(text)), "llm_fix"
+        raise OutputParserException(f"Unparseable {self.component} output", llm_output=text)
+
+    def _recover_native(self, raw: Any) -> Any:
+        """Value from a native reply that failed validation: tool-call args, then text."""
+        for call in getattr(raw, "tool_calls", None) or []:
+            try:
+                return self._shaped(call.get("args"))
+            except ValueError:
+                pass
+        candidates = [call.get("args") or "" for call in getattr(raw, "invalid_tool_calls", None) or []]
+        candidates.append(_message_text(raw))
+        for text in filter(None, candidates):
+            try:
+                return self._shaped(self.parser.parse(text))
+            except ValueError:
+                pass
+            if self.settings["local_repair"]:
+                try:
+                    return self._repaired(text)
+                except ValueError:
+                    pass
+        raise OutputParserException(f"Unrecoverable native {self.component} output")
+
+    @staticmethod
+    def _native_text(raw: Any) -> str:
+        """The first non-empty payload of a native reply, as text for OutputFixingParser."""
+        texts = [json.dumps(call.get("args")) for call in getattr(raw, "tool_calls", None) or []]
+        texts += [call.get("args") or "" for call in getattr(raw, "invalid_tool_calls", None) or []]
+        texts.append(_message_text(raw))
+        return next(filter(None, texts), "")
+
+    def _native_result(self, out: Dict[str, Any]) -> Tuple[Any, str]:
+        if out.get("parsed") is not None:
+            parsed = out["parsed"].model_dump()
+            return (parsed["rows"] if self.is_list else parsed), "native"
+        log.warning("Native structured output did not validate", component=self.component,
+                    error=str(out.get("parsing_error")))
+        raw = out.get("raw")
+        try:
+            return self._recover_native(raw), "native_repaired"
+        except OutputParserException:
+            if not self.settings["llm_fix"]:
+                raise
+        return self._shaped(self.fixing_parser.parse(self._native_text(raw))), "llm_fix"
+
+    def invoke_with_path(self, inputs: Dict[str, Any]) -> Tuple[Any, str]:
+        """
+        Parsed output and the path that produced it: native | native_repaired |
+        native_fallback | json | repaired | llm_fix | failed. ``native_fallback``
+        means the native call could not be used and the prompt was sent again as text.
+        """
+        started = time.perf_counter()
+        path = "failed"
+        inputs = {**inputs, self.instructions_key: self.format_instructions()}
+        try:
+            if self.native_chain is None:
+                value, path = self._parse_text(_message_text(self.text_chain.invoke(inputs)))
+                return value, path
+            try:
+                out = self.native_chain.invoke(inputs)
+            except Exception as e:
+                log.warning("Native structured output failed, retrying as text", component=self.component,
+                            error=str(e))
+            else:
+                value, path = self._native_result(out)
+                return value, path
+            value, text_path = self._parse_text(_message_text(self.text_chain.invoke(inputs)))
+            path = "native_fallback"
+            log.info("Native fallback parsed", component=self.component, text_path=text_path)
+            return value, path
+        finally:
+            _CALLS.inc(component=self.component, path=path)
+            _SECONDS.observe(time.perf_counter() - started, component=self.component, path=path)
+
+    def invoke(self, inputs: Dict[str, Any]) -> Any:
+        return self.invoke_with_path(inputs)[0]